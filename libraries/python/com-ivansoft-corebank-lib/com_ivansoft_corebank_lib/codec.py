@@ -0,0 +1,17 @@
+from typing import Union
+from pydantic import TypeAdapter
+from com_ivansoft_corebank_lib.models.Transaction import Transaction
+
+_transactions = TypeAdapter(list[Transaction])
+
+
+def decode_transaction(data: Union[str, bytes, dict]) -> Transaction:
+    """Validates a transaction from its json in a single pass, without building the intermediate dict"""
+    if isinstance(data, dict):
+        return Transaction.model_validate(data)
+    return Transaction.model_validate_json(data)
+
+
+def decode_transactions(data: Union[str, bytes]) -> list[Transaction]:
+    """Validates a json array of transactions in a single pass"""
+    return _transactions.validate_json(data)
@@ -0,0 +1,31 @@
+from decimal import Decimal, localcontext
+from enum import Enum
+from typing import Any
+from bson.decimal128 import Decimal128, create_decimal128_context
+from pydantic import BaseModel
+
+
+def to_document(model: BaseModel, **fields) -> dict:
+    """MongoDB document of a model without going through json, Decimal values are stored as Decimal128 and datetime
+    values as BSON dates. fields are added to the document, e.g. _id"""
+    document = {key: _to_bson(value) for key, value in model.model_dump().items()}
+    document.update(fields)
+    return document
+
+
+def to_decimal128(amount: Decimal) -> Decimal128:
+    # amounts converted from float carry more digits than Decimal128 supports, round them to its precision
+    with localcontext(create_decimal128_context()) as context:
+        return Decimal128(context.create_decimal(amount))
+
+
+def _to_bson(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return to_decimal128(value)
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, dict):
+        return {key: _to_bson(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_bson(item) for item in value]
+    return value
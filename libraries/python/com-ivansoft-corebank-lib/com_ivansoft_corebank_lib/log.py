@@ -0,0 +1,193 @@
+"""Logging pipeline of the services. After configure_logging a structlog record costs the caller a level check, the
+sampling and a queue put: a background thread resolves the Lazy values, renders the records (console or json) and
+writes them, so formatting never runs on the event loop. When the queue is full records are dropped instead of
+blocking, the writer reports how many.
+
+Loggers bound with sampled=True write only a sample_rate fraction of their records below warning. The services bind
+every module logger that logs per event or per query with it and set the rate with LOG_SAMPLE_RATE. The level and the
+sample rate can be changed at runtime with set_level and set_sample_rate"""
+import atexit
+import json
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Optional, TextIO
+import structlog
+from pydantic import BaseModel
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'critical': 50}
+_LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+# structlog calls the logger method of the level, exception() logs at error
+_METHOD_LEVELS = {**LEVELS, 'warn': 30, 'msg': 20, 'exception': 40, 'fatal': 50}
+# records written at once by the writer thread
+_WRITE_BATCH = 1000
+_STOP = object()
+
+_level = LEVELS['info']
+_sample_rate = 1.0
+_writer: Optional['LogWriter'] = None
+
+
+class Lazy:
+    """Log value computed by the writer thread, only for the records that are written, e.g.
+    logger.debug('New balance', balance=Lazy(balance.model_dump))"""
+    __slots__ = ('fn',)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self.fn = fn
+
+    def __repr__(self) -> str:
+        # rendered by the default structlog pipeline too, e.g. in scripts and tests that don't configure logging
+        return repr(self.fn())
+
+
+class LogWriter:
+    """Background thread rendering and writing the records of a bounded queue to stream, sys.stdout when None"""
+
+    def __init__(self, renderer: str = 'console', queue_size: int = 10000, stream: Optional[TextIO] = None):
+        self._queue = queue.Queue(queue_size)
+        self._stream = stream
+        self._render = _render_json if renderer == 'json' else _console_renderer()
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, event_dict: dict):
+        try:
+            self._queue.put_nowait(event_dict)
+        except queue.Full:
+            self.dropped += 1
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: float = 5.0):
+        """Writes the queued records and stops the thread"""
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            while len(records) < _WRITE_BATCH:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            lines = [self._render_record(record) for record in records if record is not _STOP]
+            if self.dropped > self._reported_dropped:
+                lines.append(self._render_record({'event': 'Log records dropped, the queue was full', 'level': 'warning',
+                                                  'timestamp': time.time(), 'logger': 'log',
+                                                  'dropped': self.dropped - self._reported_dropped}))
+                self._reported_dropped = self.dropped
+            if lines:
+                self._write('\n'.join(lines) + '\n')
+            if any(record is _STOP for record in records):
+                return
+
+    def _render_record(self, event_dict: dict) -> str:
+        try:
+            return self._render({key: value.fn() if isinstance(value, Lazy) else value
+                                 for key, value in event_dict.items()})
+        except Exception as e:
+            return f'Log record {event_dict.get("event")!r} could not be rendered: {e!r}'
+
+    def _write(self, text: str):
+        stream = self._stream or sys.stdout
+        try:
+            stream.write(text)
+            stream.flush()
+        except (OSError, ValueError):
+            # closed stream, e.g. on interpreter shutdown
+            pass
+
+
+class QueueLogger:
+    """structlog logger handing the processed records to the writer"""
+
+    def msg(self, **event_dict):
+        if _writer is not None:
+            _writer.put(event_dict)
+
+    debug = info = warning = warn = error = exception = critical = fatal = log = msg
+
+
+def _filter(logger, method_name: str, event_dict: dict) -> dict:
+    level = _METHOD_LEVELS.get(method_name, LEVELS['info'])
+    if level < _level:
+        raise structlog.DropEvent
+    if event_dict.pop('sampled', False) and level < LEVELS['warning'] and random.random() >= _sample_rate:
+        raise structlog.DropEvent
+    event_dict['level'] = _LEVEL_NAMES.get(level, method_name)
+    # formatted by the writer
+    event_dict['timestamp'] = time.time()
+    return event_dict
+
+
+def _console_renderer() -> Callable[[dict], str]:
+    renderer = structlog.dev.ConsoleRenderer()
+
+    def render(event_dict: dict) -> str:
+        event_dict['timestamp'] = datetime.fromtimestamp(event_dict['timestamp']).strftime('%Y-%m-%d %H:%M:%S')
+        return renderer(None, event_dict['level'], event_dict)
+    return render
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode='json')
+    return str(value)
+
+
+def _render_json(event_dict: dict) -> str:
+    event_dict['timestamp'] = datetime.fromtimestamp(event_dict['timestamp'], timezone.utc).isoformat()
+    return json.dumps(event_dict, default=_json_default)
+
+
+def configure_logging(level: str = 'info', sample_rate: float = 1.0, renderer: str = 'console',
+                      queue_size: int = 10000, stream: Optional[TextIO] = None):
+    """Sends the structlog records through the writer thread, renderer is console or json"""
+    global _writer
+    set_level(level)
+    set_sample_rate(sample_rate)
+    if _writer is not None:
+        _writer.close()
+    _writer = LogWriter(renderer, queue_size, stream)
+    structlog.configure(
+        # the traceback of exception() is captured by the caller, it is gone by the time the writer renders it
+        processors=[_filter, structlog.processors.format_exc_info],
+        logger_factory=lambda *args: QueueLogger(),
+        cache_logger_on_first_use=True,
+    )
+
+
+def set_level(level: str):
+    global _level
+    if level.lower() not in LEVELS:
+        raise ValueError(f'Invalid log level: {level}, expected one of {", ".join(LEVELS)}')
+    _level = LEVELS[level.lower()]
+
+
+def set_sample_rate(sample_rate: float):
+    global _sample_rate
+    if not 0 <= sample_rate <= 1:
+        raise ValueError(f'Invalid sample rate: {sample_rate}, expected a value between 0 and 1')
+    _sample_rate = sample_rate
+
+
+def logging_settings() -> dict:
+    return {'level': _LEVEL_NAMES[_level], 'sample_rate': _sample_rate,
+            'queued': _writer.queued() if _writer else 0, 'dropped': _writer.dropped if _writer else 0}
+
+
+@atexit.register
+def _close():
+    if _writer is not None:
+        _writer.close()
@@ -0,0 +1,143 @@
+"""Prometheus metrics shared by the services (install the `metrics` extra): request latency per route, MongoDB
+latency per repository method and the exposition of the default registry"""
+import inspect
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Iterator, Optional
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest, multiprocess
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'HTTP request latency, until the response body is sent',
+                            ['method', 'route', 'status'])
+MONGO_SECONDS = Histogram('mongo_operation_duration_seconds', 'MongoDB latency per repository method',
+                          ['operation'])
+
+
+class MongoTime:
+    """Latency of the timed repository methods awaited within measure_mongo_time, added up"""
+    __slots__ = ('seconds', 'operations')
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.operations = 0
+
+    def add(self, seconds: float, operations: int = 1):
+        self.seconds += seconds
+        self.operations += operations
+
+    def mean(self) -> Optional[float]:
+        """Mean latency of the operations, None without operations"""
+        return self.seconds / self.operations if self.operations else None
+
+
+_mongo_time: ContextVar[Optional[MongoTime]] = ContextVar('mongo_time', default=None)
+
+
+@contextmanager
+def measure_mongo_time() -> Iterator[MongoTime]:
+    """Adds up the latency of the timed methods awaited within, also in the tasks started within since they copy the
+    context, e.g. the MongoDB time of a request without the time it waited for a lock or slept"""
+    mongo_time = MongoTime()
+    token = _mongo_time.set(mongo_time)
+    try:
+        yield mongo_time
+    finally:
+        _mongo_time.reset(token)
+
+
+def current_mongo_time() -> Optional[MongoTime]:
+    """The MongoTime of the innermost measure_mongo_time, None outside of it"""
+    return _mongo_time.get()
+
+
+def _observe(histogram, seconds: float):
+    histogram.observe(seconds)
+    mongo_time = _mongo_time.get()
+    if mongo_time is not None:
+        mongo_time.add(seconds)
+
+
+def timed(fn: Callable) -> Callable:
+    """Observes the latency of a repository method in MONGO_SECONDS labeled with its qualified name, e.g.
+    BalanceRepository.get, and adds it to the measure_mongo_time in progress. For async generators only the time spent reading is observed, not the time the caller
+    spends between items"""
+    operation = fn.__qualname__
+    histogram = MONGO_SECONDS.labels(operation)
+
+    if inspect.isasyncgenfunction(fn):
+        @wraps(fn)
+        async def generator_wrapper(*args, **kwargs):
+            generator = fn(*args, **kwargs)
+            elapsed = 0.0
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        item = await anext(generator)
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield item
+            finally:
+                _observe(histogram, elapsed)
+                await generator.aclose()
+        return generator_wrapper
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            _observe(histogram, time.perf_counter() - start)
+    return wrapper
+
+
+class MetricsMiddleware:
+    """ASGI middleware observing REQUEST_SECONDS labeled with the route template (/account/{account_id}/balance), so
+    the label doesn't grow with the account ids. Requests that match no route are labeled unmatched"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router adds the matched route to the scope
+            route = scope.get('route')
+            REQUEST_SECONDS.labels(scope['method'], getattr(route, 'path', 'unmatched'), str(status)).observe(
+                time.perf_counter() - start)
+
+
+def latest() -> (bytes, str):
+    """Exposition of the default registry and its content type. When the service runs several processes with
+    PROMETHEUS_MULTIPROC_DIR set, every process writes its metrics to files in that directory and the exposition
+    aggregates the files of all of them"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def process_exited(pid: int):
+    """Drops the live gauges of a process of the service that exited, its counters and histograms are still exposed"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        multiprocess.mark_process_dead(pid)
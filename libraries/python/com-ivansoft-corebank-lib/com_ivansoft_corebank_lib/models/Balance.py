@@ -2,10 +2,11 @@
 from pydantic import BaseModel
 from decimal import Decimal
 from typing import Optional
+from com_ivansoft_corebank_lib.models.Money import Money
 
 
 class Balance(BaseModel):
-    balance: Decimal
+    balance: Money
     currency: str = 'MXN'
     user_id: int
     username: str
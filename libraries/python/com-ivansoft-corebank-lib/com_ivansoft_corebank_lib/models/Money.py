@@ -0,0 +1,18 @@
+from decimal import Decimal
+from typing import Annotated, Any
+from pydantic import BeforeValidator
+
+
+def to_money(value: Any) -> Any:
+    """Exact decimal of an amount. Floats are converted from their shortest representation, so 100.45 is
+    Decimal('100.45') and not the binary approximation of 100.45. Decimal128 values read from MongoDB are accepted"""
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    if hasattr(value, 'to_decimal'):
+        return value.to_decimal()
+    return value
+
+
+# amounts are exact decimals, stored in MongoDB as Decimal128 (see documents.to_document) so the database can sum,
+# compare and $inc them
+Money = Annotated[Decimal, BeforeValidator(to_money)]
@@ -0,0 +1,32 @@
+from decimal import Decimal
+from enum import Enum
+from typing import Optional
+from pydantic import BaseModel, computed_field
+from com_ivansoft_corebank_lib.models.Money import Money
+
+
+class RollupGranularity(str, Enum):
+    DAY = "day"
+    MONTH = "month"
+
+    def period(self, timestamp) -> str:
+        """Period of a datetime or date, YYYY-MM-DD for days and YYYY-MM for months"""
+        return timestamp.strftime('%Y-%m-%d' if self == RollupGranularity.DAY else '%Y-%m')
+
+
+class Rollup(BaseModel):
+    """Totals of the transactions of an account in a day or a month, closing_balance is the balance after the last
+    transaction applied in the period"""
+    account_id: str
+    granularity: RollupGranularity
+    period: str
+    count: int
+    deposits: Money
+    withdrawals: Money
+    closing_balance: Money
+    updated_at: Optional[str] = None
+
+    @computed_field
+    @property
+    def net(self) -> Decimal:
+        return self.deposits - self.withdrawals
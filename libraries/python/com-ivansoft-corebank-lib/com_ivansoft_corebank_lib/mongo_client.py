@@ -0,0 +1,87 @@
+"""The Motor client of a service process (install the `mongo` extra). The service configures MongoBase with its url and
+the client options from its settings, `client_options` builds them, and its repositories declare `_client =
+LazyClient()`"""
+from typing import Callable, Optional, Union
+from motor.motor_asyncio import AsyncIOMotorClient
+from structlog import get_logger
+from com_ivansoft_corebank_lib.mongo_pool import PoolStats
+
+logger = get_logger().bind(logger='MongoBase')
+
+
+def _int(value: Optional[Union[str, int]]) -> Optional[int]:
+    return int(value) if value else None
+
+
+def client_options(max_pool_size: Optional[int] = None, min_pool_size: Optional[int] = None,
+                   max_idle_time_ms: Optional[str] = None, wait_queue_timeout_ms: Optional[str] = None,
+                   connect_timeout_ms: Optional[str] = None, server_selection_timeout_ms: Optional[str] = None,
+                   socket_timeout_ms: Optional[str] = None, compressors: Optional[str] = None,
+                   write_concern_w: Optional[str] = None, write_concern_journal: Optional[str] = None,
+                   write_concern_timeout_ms: Optional[str] = None) -> dict:
+    """Client options from the settings values, the unset ones are left to the driver defaults"""
+    w = write_concern_w
+    options = {
+        'maxPoolSize': max_pool_size,
+        'minPoolSize': min_pool_size,
+        'maxIdleTimeMS': _int(max_idle_time_ms),
+        'waitQueueTimeoutMS': _int(wait_queue_timeout_ms),
+        'connectTimeoutMS': _int(connect_timeout_ms),
+        'serverSelectionTimeoutMS': _int(server_selection_timeout_ms),
+        'socketTimeoutMS': _int(socket_timeout_ms),
+        'compressors': compressors or None,
+        # a number of nodes or a tag set name like majority
+        'w': int(w) if w and w.isdigit() else w,
+        'journal': write_concern_journal.lower() == 'true' if write_concern_journal else None,
+        'wTimeoutMS': _int(write_concern_timeout_ms),
+    }
+    return {name: value for name, value in options.items() if value is not None}
+
+
+class MongoBase:
+    """The MongoDB client of the process, connected and closed by the app lifespan. Scripts and tests connect on first
+    use. configure sets the url and the function returning the client options, called on every connect so they follow
+    the settings"""
+    _client: AsyncIOMotorClient = None
+    _url: str = 'mongodb://localhost:27017'
+    _options: Callable[[], dict] = staticmethod(dict)
+    pool_stats: PoolStats = PoolStats()
+
+    @classmethod
+    def configure(cls, url: str, options: Callable[[], dict]):
+        cls._url = url
+        cls._options = staticmethod(options)
+
+    @classmethod
+    def get_client(cls) -> AsyncIOMotorClient:
+        if not cls._client:
+            cls.connect()
+        return cls._client
+
+    @classmethod
+    def connect(cls):
+        options = cls.options()
+        logger.info('Connecting to MongoDB', **options)
+        cls.pool_stats = PoolStats()
+        cls._client = AsyncIOMotorClient(cls._url, event_listeners=[cls.pool_stats], **options)
+
+    @classmethod
+    def options(cls) -> dict:
+        return cls._options()
+
+    @classmethod
+    def close(cls):
+        if cls._client:
+            cls._client.close()
+            cls._client = None
+            logger.info('MongoDB connection closed')
+        else:
+            logger.warning('MongoDB connection already closed')
+
+
+class LazyClient:
+    """Class attribute of the repositories resolving to the client of MongoBase when it is used, so importing a
+    repository doesn't connect. Tests replace it on the repository class"""
+
+    def __get__(self, instance, owner) -> AsyncIOMotorClient:
+        return MongoBase.get_client()
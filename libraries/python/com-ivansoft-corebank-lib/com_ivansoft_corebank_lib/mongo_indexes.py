@@ -0,0 +1,55 @@
+"""Indexes of a service database (install the `mongo` extra). A service declares the IndexModels of every collection
+and its query patterns, (query, collection, fields matched by equality then sorted) tuples, and bootstraps them at
+startup. The names of the indexes replaced by a declared one are listed per collection so they are dropped"""
+from pymongo import IndexModel
+from structlog import get_logger
+
+logger = get_logger().bind(logger='indexes')
+
+
+async def bootstrap_indexes(database, indexes: dict[str, list[IndexModel]],
+                            query_patterns: list[tuple[str, str, list[str]]], superseded: dict[str, list[str]] = None):
+    """Create the missing indexes, drop the superseded ones once their replacements exist and report the query
+    patterns without a supporting index, errors are logged so they don't stop the service"""
+    try:
+        await ensure_indexes(database, indexes)
+        await drop_superseded_indexes(database, superseded or {})
+        await verify_query_patterns(database, query_patterns)
+    except Exception as e:
+        logger.error('Error bootstrapping indexes', error=str(e))
+
+
+async def ensure_indexes(database, indexes: dict[str, list[IndexModel]]):
+    for collection, collection_indexes in indexes.items():
+        existing = await database[collection].index_information()
+        missing = [index for index in collection_indexes if index.document['name'] not in existing]
+        if not missing:
+            continue
+        logger.info('Creating indexes', collection=collection, indexes=[index.document['name'] for index in missing])
+        await database[collection].create_indexes(missing)
+
+
+async def drop_superseded_indexes(database, superseded: dict[str, list[str]]):
+    for collection, names in superseded.items():
+        existing = await database[collection].index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            logger.info('Dropping superseded index', collection=collection, index=name)
+            await database[collection].drop_index(name)
+
+
+async def verify_query_patterns(database, query_patterns: list[tuple[str, str, list[str]]]) -> list[str]:
+    """Returns the query patterns without a supporting index"""
+    index_fields = {}
+    unsupported = []
+    for query, collection, fields in query_patterns:
+        if collection not in index_fields:
+            information = await database[collection].index_information()
+            index_fields[collection] = [[field for field, _ in index['key']] for index in information.values()]
+        # _id is always indexed, even before the collection exists
+        if fields == ['_id'] or any(keys[:len(fields)] == fields for keys in index_fields[collection]):
+            continue
+        logger.warning('Query pattern without supporting index', query=query, collection=collection, fields=fields)
+        unsupported.append(query)
+    return unsupported
@@ -0,0 +1,107 @@
+"""Connection pool statistics of a MongoDB client (install the `mongo` extra). Add a PoolStats to the event_listeners of
+the client, its snapshot has per server the open, checked out and idle connections, the operations waiting for a
+connection and how long the check outs waited"""
+import threading
+from pymongo.monitoring import ConnectionPoolListener
+
+
+class _ServerPool:
+    def __init__(self, options: dict):
+        self.options = options
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.check_outs = 0
+        self.check_out_failures = 0
+        self.cleared = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def waited(self, duration):
+        # the driver reports the duration from the start of the check out, older drivers don't
+        if duration is None:
+            return
+        self.wait_seconds += duration
+        self.max_wait_seconds = max(self.max_wait_seconds, duration)
+
+
+class PoolStats(ConnectionPoolListener):
+    """Counts the connection pool events of a client per server address. The driver publishes them from the threads
+    running the operations, so they are counted under a lock"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servers: dict[tuple, _ServerPool] = {}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {f'{host}:{port}': {
+                'max_pool_size': server.options.get('maxPoolSize'),
+                'min_pool_size': server.options.get('minPoolSize'),
+                'open': server.open,
+                'checked_out': server.checked_out,
+                'idle': server.open - server.checked_out,
+                'waiting': server.waiting,
+                'check_outs': server.check_outs,
+                'check_out_failures': server.check_out_failures,
+                'cleared': server.cleared,
+                'wait_ms_avg': round(server.wait_seconds * 1000 / server.check_outs, 3) if server.check_outs else 0.0,
+                'wait_ms_max': round(server.max_wait_seconds * 1000, 3),
+            } for (host, port), server in self._servers.items()}
+
+    def _server(self, address) -> _ServerPool:
+        server = self._servers.get(address)
+        if server is None:
+            server = self._servers[address] = _ServerPool({})
+        return server
+
+    def pool_created(self, event):
+        with self._lock:
+            self._servers[event.address] = _ServerPool(dict(event.options))
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._server(event.address).cleared += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._servers.pop(event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._server(event.address).open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server.open = max(server.open - 1, 0)
+
+    def connection_check_out_started(self, event):
+        with self._lock:
+            self._server(event.address).waiting += 1
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server.waiting = max(server.waiting - 1, 0)
+            server.check_out_failures += 1
+            server.waited(getattr(event, 'duration', None))
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server.waiting = max(server.waiting - 1, 0)
+            server.checked_out += 1
+            server.check_outs += 1
+            server.waited(getattr(event, 'duration', None))
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            server = self._server(event.address)
+            server.checked_out = max(server.checked_out - 1, 0)
@@ -0,0 +1,132 @@
+"""Opt-in cProfile profiling of single requests. ProfilingMiddleware profiles the requests that have the trigger header
+or a sampled fraction of them, from the first byte received until the last byte of the response is sent. ProfileStore
+writes every profile to a directory as a pstats file (snakeviz, pstats) and a json summary, the summary has the time
+spent per stage: pydantic validation, structlog, MongoDB driver, serialization, the framework, the service code and the
+event loop, which includes the time waiting for MongoDB.
+
+cProfile profiles the whole thread, so other requests served by the event loop meanwhile show up in the profile, and
+only one request is profiled at a time. Add the middleware only when profiling is enabled, so it costs nothing
+otherwise"""
+import cProfile
+import json
+import os
+import pstats
+import random
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Optional
+from structlog import get_logger
+
+logger = get_logger().bind(logger='profiling')
+
+# (stage, fragments of the file path or of the built-in name), the first stage that matches wins
+_STAGES = [
+    ('pydantic', ('pydantic',)),
+    ('structlog', ('structlog',)),
+    ('mongo', ('motor', 'pymongo', 'bson')),
+    ('serialization', ('orjson', '/json/', "'json'")),
+    ('event_loop', ('asyncio', 'selectors', "'poll'", "'select'", 'epoll', 'kqueue')),
+    ('framework', ('starlette', 'fastapi', 'anyio', 'uvicorn')),
+    ('app', ('/app/',)),
+]
+
+
+def _stage(filename: str, function: str) -> str:
+    location = f'{filename} {function}'
+    for stage, fragments in _STAGES:
+        if any(fragment in location for fragment in fragments):
+            return stage
+    return 'other'
+
+
+def summarize(profiler: cProfile.Profile, top: int = 20) -> dict:
+    """Time per stage and the top functions by own time, in milliseconds"""
+    stats = pstats.Stats(profiler)
+    stages = {}
+    functions = []
+    for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+        stage = _stage(filename, function)
+        stages[stage] = stages.get(stage, 0) + own * 1000
+        functions.append({'function': f'{filename}:{line}({function})', 'stage': stage, 'calls': calls,
+                          'own_ms': round(own * 1000, 3), 'cumulative_ms': round(cumulative * 1000, 3)})
+    functions.sort(key=lambda item: item['own_ms'], reverse=True)
+    return {'profiled_ms': round(sum(stages.values()), 3),
+            'stages': {stage: round(ms, 3) for stage, ms in sorted(stages.items(), key=lambda item: -item[1])},
+            'top': functions[:top]}
+
+
+class ProfileStore:
+    """Writes the profiles to directory and keeps the summaries of the last keep of them"""
+
+    def __init__(self, directory: str, keep: int = 50):
+        self.directory = directory
+        self._recent = deque(maxlen=keep)
+
+    def save(self, profile_id: str, profiler: cProfile.Profile, request: dict) -> dict:
+        summary = {'id': profile_id, **request, **summarize(profiler)}
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            profiler.dump_stats(os.path.join(self.directory, f'{profile_id}.prof'))
+            with open(os.path.join(self.directory, f'{profile_id}.json'), 'w') as file:
+                json.dump(summary, file, indent=2)
+        except OSError as e:
+            logger.error('Error writing profile', profile_id=profile_id, error=str(e))
+        self._recent.append(summary)
+        logger.info('Request profiled', profile_id=profile_id, path=request['path'], wall_ms=request['wall_ms'])
+        return summary
+
+    def recent(self) -> list[dict]:
+        """Summaries of the last profiles, newest first, without the top functions"""
+        return [{key: value for key, value in summary.items() if key != 'top'} for summary in reversed(self._recent)]
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return next((summary for summary in self._recent if summary['id'] == profile_id), None)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests with the header (any value but 0 or false) and a sample_rate fraction
+    of the rest. The response of a profiled request has the X-Profile-Id header with the id of its profile"""
+
+    def __init__(self, app, store: ProfileStore, header: str = 'X-Profile', sample_rate: float = 0.0):
+        self.app = app
+        self.store = store
+        self.header = header.lower().encode()
+        self.sample_rate = sample_rate
+        self._active = False
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or self._active or not self._triggered(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f'{datetime.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}'
+        status = 500
+
+        async def send_with_profile_id(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                message = {**message, 'headers': [*message.get('headers', []), (b'x-profile-id', profile_id.encode())]}
+            await send(message)
+
+        self._active = True
+        profiler = cProfile.Profile()
+        started_at = datetime.now().isoformat()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.disable()
+            self._active = False
+            self.store.save(profile_id, profiler, {
+                'method': scope['method'], 'path': scope['path'], 'status': status,
+                'started_at': started_at, 'wall_ms': round((time.perf_counter() - start) * 1000, 3)})
+
+    def _triggered(self, scope) -> bool:
+        for name, value in scope['headers']:
+            if name == self.header:
+                return value.lower() not in (b'0', b'false')
+        return self.sample_rate > 0 and random.random() < self.sample_rate
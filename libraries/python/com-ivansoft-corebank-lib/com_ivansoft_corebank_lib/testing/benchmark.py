@@ -0,0 +1,134 @@
+"""Throughput and latency measurements compared against a baseline stored with the tests.
+
+Results are normalized by a calibration workload measured in the same run (pure Python, validating Transaction
+models), so a baseline recorded on one machine can be checked on a faster or slower one. A benchmark regresses when
+its normalized throughput is lower than the baseline by more than the tolerance, or when the baseline doesn't have it.
+Latencies are reported but not compared, with the few calls a test run can afford they mostly measure the scheduler"""
+import json
+import os
+import statistics
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+from structlog import get_logger
+from com_ivansoft_corebank_lib.codec import decode_transaction
+
+logger = get_logger().bind(logger='benchmark')
+
+CALIBRATION_EVENT = json.dumps({'id': 'tx1', 'account_id': '1234567890', 'amount': 100.45, 'type': 'DEPOSIT',
+                                'status': 'PENDING', 'description': 'Deposit of $100.45',
+                                'timestamp': '2024-08-30T18:24:06.123456', 'version': 1})
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    # operations per call, e.g. the events of a bulk message, so the throughput is in events and not requests
+    operations: int
+    seconds: float
+    latencies_ms: list[float] = field(repr=False)
+
+    @property
+    def ops_per_second(self) -> float:
+        return self.operations / self.seconds
+
+    @property
+    def p50_ms(self) -> float:
+        return statistics.median(self.latencies_ms)
+
+    @property
+    def p99_ms(self) -> float:
+        latencies = sorted(self.latencies_ms)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+    def to_baseline(self, calibration: float) -> dict:
+        return {'ops_per_second': round(self.ops_per_second, 1), 'p50_ms': round(self.p50_ms, 4),
+                'p99_ms': round(self.p99_ms, 4), 'relative_ops': self.ops_per_second / calibration}
+
+
+async def run_benchmark(name: str, operation: Callable[[int], Awaitable], calls: int, operations_per_call: int = 1,
+                        warmup: int = 10) -> BenchmarkResult:
+    """Awaits operation(i) calls times one after the other and times every call, after warmup untimed calls"""
+    for i in range(warmup):
+        await operation(i)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(warmup, warmup + calls):
+        call_start = time.perf_counter()
+        await operation(i)
+        latencies.append((time.perf_counter() - call_start) * 1000)
+    return BenchmarkResult(name, calls * operations_per_call, time.perf_counter() - start, latencies)
+
+
+def calibrate(events: int = 2000, repeat: int = 5) -> float:
+    """Events per second of the calibration workload on this machine, median of repeat runs like the benchmarks
+    are an average and not a best case"""
+    elapsed = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(events):
+            decode_transaction(CALIBRATION_EVENT)
+        elapsed.append(time.perf_counter() - start)
+    return events / statistics.median(elapsed)
+
+
+def load_baseline(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_baseline(path: str, results: list[BenchmarkResult], calibration: float):
+    baseline = {'calibration_ops_per_second': round(calibration, 1),
+                'benchmarks': {result.name: result.to_baseline(calibration) for result in results}}
+    with open(path, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def compare(results: list[BenchmarkResult], baseline: dict, calibration: float, tolerance: float) -> list[str]:
+    """Returns a message per regression, benchmarks missing from the baseline are not compared"""
+    regressions = []
+    for result in results:
+        expected = baseline['benchmarks'].get(result.name)
+        if not expected:
+            continue
+        relative_ops = result.ops_per_second / calibration
+        if relative_ops < expected['relative_ops'] * (1 - tolerance):
+            regressions.append(f'{result.name}: throughput {relative_ops / expected["relative_ops"]:.0%} of the '
+                               f'baseline ({result.ops_per_second:.0f} ops/s)')
+    return regressions
+
+
+def report(results: list[BenchmarkResult], baseline: Optional[dict] = None, calibration: Optional[float] = None) -> str:
+    lines = [f'{"benchmark":<32} {"ops/s":>10} {"p50 (ms)":>10} {"p99 (ms)":>10} {"vs baseline":>12}']
+    for result in results:
+        expected = (baseline or {}).get('benchmarks', {}).get(result.name)
+        versus = f'{result.ops_per_second / calibration / expected["relative_ops"]:.0%}' \
+            if expected and calibration else '-'
+        lines.append(f'{result.name:<32} {result.ops_per_second:>10.0f} {result.p50_ms:>10.3f} '
+                     f'{result.p99_ms:>10.3f} {versus:>12}')
+    return '\n'.join(lines)
+
+
+def check(results: list[BenchmarkResult], baseline_path: str, calibration: float) -> list[str]:
+    """Logs the results and returns the regressions against the baseline at baseline_path, a missing baseline or
+    benchmark is one too. With BENCHMARK_UPDATE_BASELINE=true the results are saved as the baseline instead.
+    BENCHMARK_TOLERANCE (default 0.5) is the fraction a benchmark can be worse than the baseline"""
+    baseline = load_baseline(baseline_path)
+    for result in results:
+        expected = (baseline or {}).get('benchmarks', {}).get(result.name)
+        logger.info('Benchmark result', benchmark=result.name, ops_per_second=round(result.ops_per_second, 1),
+                    p50_ms=round(result.p50_ms, 3), p99_ms=round(result.p99_ms, 3),
+                    vs_baseline=round(result.ops_per_second / calibration / expected['relative_ops'], 2)
+                    if expected else None)
+    if os.environ.get('BENCHMARK_UPDATE_BASELINE', 'false').lower() == 'true':
+        save_baseline(baseline_path, results, calibration)
+        logger.info('Benchmark baseline saved', path=baseline_path, benchmarks=len(results))
+        return []
+    if baseline is None:
+        return [f'no baseline at {baseline_path}, record one with BENCHMARK_UPDATE_BASELINE=true']
+    missing = [f'{result.name}: not in the baseline, record it with BENCHMARK_UPDATE_BASELINE=true'
+               for result in results if result.name not in baseline['benchmarks']]
+    return missing + compare(results, baseline, calibration, float(os.environ.get('BENCHMARK_TOLERANCE', '0.5')))
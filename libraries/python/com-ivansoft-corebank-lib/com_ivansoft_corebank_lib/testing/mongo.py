@@ -0,0 +1,665 @@
+"""In-memory stand-in for the Motor client, so tests and benchmarks run the repositories queries without a MongoDB
+server. It supports the subset of the API the services use: find with filters, projections, sort, skip and limit,
+insert, update, find_one_and_update, delete, bulk_write and index management. Documents are copied in and out like
+the real driver does, and duplicated _id values or unique index keys raise the same pymongo errors. A unique index on
+an array path is multikey: every element is a key, so two documents can't share an element.
+
+Like the real server, a query only avoids scanning the collection when an index starts with a field the filter
+matches by equality or $in, so the benchmarks show a missing index. Filters support equality, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $type, $or and $and over dotted paths,
+a path through an array of documents matches the values of every element. Updates support $set, $unset, $inc, $min,
+$max, $setOnInsert and $push (with $each and $slice), or a replacement document"""
+import itertools
+import re
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Iterable, Optional
+from bson.decimal128 import Decimal128
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DeleteMany, DeleteOne, InsertOne, ReplaceOne, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+from com_ivansoft_corebank_lib.documents import to_decimal128
+
+DUPLICATE_KEY_ERROR = 11000
+
+_MISSING = object()
+_UNHASHABLE = object()
+
+# $type aliases of the BSON types the services store
+_TYPES = {
+    'double': lambda value: isinstance(value, float),
+    'string': lambda value: isinstance(value, str),
+    'object': lambda value: isinstance(value, dict),
+    'array': lambda value: isinstance(value, list),
+    'objectId': lambda value: isinstance(value, ObjectId),
+    'bool': lambda value: isinstance(value, bool),
+    'date': lambda value: isinstance(value, datetime),
+    'null': lambda value: value is None,
+    'int': lambda value: isinstance(value, int) and not isinstance(value, bool) and -2 ** 31 <= value < 2 ** 31,
+    'long': lambda value: isinstance(value, int) and not isinstance(value, bool) and not -2 ** 31 <= value < 2 ** 31,
+    'decimal': lambda value: isinstance(value, Decimal128),
+}
+
+
+class InMemoryMongoClient:
+    """Drop-in for AsyncIOMotorClient, databases and collections are created on first use"""
+
+    def __init__(self, *args, **kwargs):
+        self._databases: dict[str, InMemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> 'InMemoryDatabase':
+        return self.get_database(name)
+
+    def get_database(self, name: str) -> 'InMemoryDatabase':
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(self, name)
+        return self._databases[name]
+
+    async def drop_database(self, name: str):
+        self._databases.pop(name if isinstance(name, str) else name.name, None)
+
+    async def list_database_names(self) -> list[str]:
+        return list(self._databases)
+
+    def close(self):
+        pass
+
+
+class InMemoryDatabase:
+    def __init__(self, client: InMemoryMongoClient, name: str):
+        self.client = client
+        self.name = name
+        self._collections: dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> 'InMemoryCollection':
+        return self.get_collection(name)
+
+    def get_collection(self, name: str) -> 'InMemoryCollection':
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(self, name)
+        return self._collections[name]
+
+    async def drop_collection(self, name: str):
+        self._collections.pop(name if isinstance(name, str) else name.name, None)
+
+    async def list_collection_names(self) -> list[str]:
+        return list(self._collections)
+
+
+class InMemoryCollection:
+    def __init__(self, database: InMemoryDatabase, name: str):
+        self.database = database
+        self.name = name
+        # documents by _id in insertion order, the natural order of find without sort
+        self._documents: dict[Any, dict] = {}
+        self._sequence: dict[Any, int] = {}
+        self._next_sequence = 0
+        self._indexes: dict[str, dict] = {'_id_': {'key': [('_id', ASCENDING)], 'v': 2}}
+        # leading field of every index -> value -> ids of the documents with the value
+        self._lookups: dict[str, dict[Any, dict]] = {}
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True) -> InsertManyResult:
+        inserted_ids = []
+        write_errors = []
+        for index, document in enumerate(documents):
+            try:
+                inserted_ids.append(self._insert(document))
+            except DuplicateKeyError as e:
+                write_errors.append({'index': index, 'code': DUPLICATE_KEY_ERROR, 'errmsg': str(e),
+                                     'op': document})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({'writeErrors': write_errors, 'writeConcernErrors': [],
+                                  'nInserted': len(inserted_ids), 'nUpserted': 0, 'nMatched': 0, 'nModified': 0,
+                                  'nRemoved': 0, 'upserted': []})
+        return InsertManyResult(inserted_ids, True)
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, sort=None, skip: int = 0,
+             limit: int = 0, **kwargs) -> 'InMemoryCursor':
+        cursor = InMemoryCursor(self, filter or {}, projection)
+        if sort:
+            cursor.sort(sort)
+        return cursor.skip(skip).limit(limit)
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, sort=None,
+                       **kwargs) -> Optional[dict]:
+        documents = await self.find(filter, projection, sort=sort, limit=1).to_list(length=1)
+        return documents[0] if documents else None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        return sum(1 for _ in self._matching(filter))
+
+    async def distinct(self, key: str, filter: Optional[dict] = None) -> list:
+        values = []
+        for document in self._matching(filter or {}):
+            value = _get(document, key)
+            if value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=False)[0], True)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, multi=True)[0], True)
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False)[0], True)
+
+    async def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None, sort=None,
+                                  upsert: bool = False, return_document: bool = ReturnDocument.BEFORE,
+                                  **kwargs) -> Optional[dict]:
+        _, before, after = self._update(filter, update, upsert, multi=False, sort=sort)
+        document = after if return_document == ReturnDocument.AFTER else before
+        return _project(document, projection) if document is not None else None
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({'n': self._delete(filter, multi=False)}, True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({'n': self._delete(filter, multi=True)}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {'writeErrors': [], 'writeConcernErrors': [], 'nInserted': 0, 'nUpserted': 0, 'nMatched': 0,
+                  'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        for index, request in enumerate(requests):
+            try:
+                self._apply_request(request, index, result)
+            except DuplicateKeyError as e:
+                result['writeErrors'].append({'index': index, 'code': DUPLICATE_KEY_ERROR, 'errmsg': str(e)})
+                if ordered:
+                    break
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    async def create_index(self, keys, name: Optional[str] = None, unique: bool = False, **kwargs) -> str:
+        keys = [(keys, ASCENDING)] if isinstance(keys, str) else list(keys)
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        self._indexes[name] = {'key': keys, 'v': 2, **({'unique': True} if unique else {})}
+        field = keys[0][0]
+        if field != '_id' and field not in self._lookups:
+            self._lookups[field] = {}
+            for document in self._documents.values():
+                self._add_lookup(field, document)
+        return name
+
+    async def create_indexes(self, indexes: list, **kwargs) -> list[str]:
+        names = []
+        for index in indexes:
+            document = dict(index.document)
+            keys = list(document.pop('key').items())
+            names.append(await self.create_index(keys, name=document.pop('name', None),
+                                                 unique=document.pop('unique', False)))
+        return names
+
+    async def index_information(self) -> dict:
+        return _copy(self._indexes)
+
+    async def drop_index(self, name: str):
+        if name not in self._indexes or name == '_id_':
+            raise OperationFailure(f'index not found with name [{name}]')
+        field = self._indexes.pop(name)['key'][0][0]
+        if all(index['key'][0][0] != field for index in self._indexes.values()):
+            self._lookups.pop(field, None)
+
+    async def drop(self):
+        await self.database.drop_collection(self.name)
+
+    def _apply_request(self, request, index: int, result: dict):
+        if isinstance(request, InsertOne):
+            self._insert(request._doc)
+            result['nInserted'] += 1
+        elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+            raw, _, _ = self._update(request._filter, request._doc, bool(request._upsert),
+                                     multi=isinstance(request, UpdateMany))
+            result['nMatched'] += raw['n'] - (1 if 'upserted' in raw else 0)
+            result['nModified'] += raw['nModified']
+            if 'upserted' in raw:
+                result['nUpserted'] += 1
+                result['upserted'].append({'index': index, '_id': raw['upserted']})
+        elif isinstance(request, (DeleteOne, DeleteMany)):
+            result['nRemoved'] += self._delete(request._filter, multi=isinstance(request, DeleteMany))
+        else:
+            raise TypeError(f'{type(request).__name__} is not a valid request')
+
+    def _matching(self, filter: dict) -> Iterable[dict]:
+        ids = self._candidates(filter)
+        documents = [self._documents[_id] for _id in ids] if ids is not None else list(self._documents.values())
+        return (document for document in documents if _matches(document, filter))
+
+    def _candidates(self, filter: dict) -> Optional[list]:
+        """Ids of the documents the filter can match in natural order, None when the collection has to be scanned"""
+        for field, condition in filter.items():
+            if field != '_id' and field not in self._lookups:
+                continue
+            if isinstance(condition, dict) and any(key.startswith('$') for key in condition):
+                if '$eq' in condition:
+                    values = [condition['$eq']]
+                elif isinstance(condition.get('$in'), list):
+                    values = condition['$in']
+                else:
+                    continue
+            else:
+                values = [condition]
+            if not all(_is_hashable(value) for value in values):
+                continue
+            if field == '_id':
+                ids = {value: None for value in values if value in self._documents}
+            else:
+                lookup = self._lookups[field]
+                ids = dict(lookup.get(_UNHASHABLE, {}))
+                for value in values:
+                    ids.update(lookup.get(_lookup_key(value), {}))
+            return sorted(ids, key=self._sequence.__getitem__) if len(ids) > 1 else list(ids)
+        return None
+
+    def _insert(self, document: dict) -> Any:
+        if '_id' not in document:
+            # the driver adds the generated _id to the inserted document
+            document['_id'] = ObjectId()
+        self._check_unique(document)
+        self._store(_copy(document))
+        self._sequence[document['_id']] = self._next_sequence
+        self._next_sequence += 1
+        return document['_id']
+
+    def _store(self, document: dict):
+        previous = self._documents.get(document['_id'])
+        for field in self._lookups:
+            if previous is not None:
+                self._remove_lookup(field, previous)
+            self._add_lookup(field, document)
+        self._documents[document['_id']] = document
+
+    def _add_lookup(self, field: str, document: dict):
+        for key in _lookup_keys(_get(document, field)):
+            self._lookups[field].setdefault(key, {})[document['_id']] = None
+
+    def _remove_lookup(self, field: str, document: dict):
+        for key in _lookup_keys(_get(document, field)):
+            self._lookups[field].get(key, {}).pop(document['_id'], None)
+
+    def _check_unique(self, document: dict, replacing: Any = _MISSING):
+        if document['_id'] in self._documents and document['_id'] != replacing:
+            raise DuplicateKeyError(f'E11000 duplicate key error collection: {self.name} index: _id_ dup key: '
+                                    f'{{ _id: {document["_id"]!r} }}', DUPLICATE_KEY_ERROR)
+        for name, index in self._indexes.items():
+            if name == '_id_' or not index.get('unique'):
+                continue
+            keys = _index_keys(document, index['key'])
+            for other in self._documents.values():
+                if other['_id'] != document['_id'] and other['_id'] != replacing and \
+                        any(key in keys for key in _index_keys(other, index['key'])):
+                    raise DuplicateKeyError(f'E11000 duplicate key error collection: {self.name} index: {name}',
+                                            DUPLICATE_KEY_ERROR)
+
+    def _update(self, filter: dict, update: dict, upsert: bool, multi: bool, sort=None) -> (dict, dict, dict):
+        """Returns the raw result and the first document before and after the update"""
+        documents = list(self._matching(filter))
+        if sort:
+            documents = _sorted(documents, _sort_keys(sort))
+        if not multi:
+            documents = documents[:1]
+
+        if not documents:
+            if not upsert:
+                return {'n': 0, 'nModified': 0}, None, None
+            document = {field: value for field, value in filter.items()
+                        if not field.startswith('$') and not (isinstance(value, dict) and
+                                                              any(key.startswith('$') for key in value))}
+            document = _apply_update(document, update, inserting=True)
+            self._insert(document)
+            return {'n': 1, 'nModified': 0, 'upserted': document['_id']}, None, _copy(document)
+
+        modified = 0
+        before = after = None
+        for document in documents:
+            updated = _apply_update(_copy(document), update, inserting=False)
+            if updated.get('_id', document['_id']) != document['_id']:
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+            updated['_id'] = document['_id']
+            self._check_unique(updated, replacing=document['_id'])
+            if updated != document:
+                modified += 1
+                self._store(updated)
+            if before is None:
+                before, after = _copy(document), _copy(updated)
+        return {'n': len(documents), 'nModified': modified}, before, after
+
+    def _delete(self, filter: dict, multi: bool) -> int:
+        documents = list(self._matching(filter))
+        if not multi:
+            documents = documents[:1]
+        for document in documents:
+            for field in self._lookups:
+                self._remove_lookup(field, document)
+            del self._documents[document['_id']]
+            del self._sequence[document['_id']]
+        return len(documents)
+
+
+class InMemoryCursor:
+    """Lazy like the Motor cursor, the query runs on the first to_list or iteration"""
+
+    def __init__(self, collection: InMemoryCollection, filter: dict, projection: Optional[dict]):
+        self._collection = collection
+        self._filter = filter
+        self._projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+        self._position = 0
+
+    def sort(self, key_or_list, direction: Optional[int] = None) -> 'InMemoryCursor':
+        self._sort = _sort_keys(key_or_list, direction)
+        return self
+
+    def skip(self, skip: int) -> 'InMemoryCursor':
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> 'InMemoryCursor':
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size: int) -> 'InMemoryCursor':
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> list[dict]:
+        results = self._execute()
+        end = self._position + length if length else len(results)
+        documents = results[self._position:end]
+        self._position += len(documents)
+        return documents
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        results = self._execute()
+        if self._position >= len(results):
+            raise StopAsyncIteration
+        self._position += 1
+        return results[self._position - 1]
+
+    def _execute(self) -> list[dict]:
+        if self._results is None:
+            documents = list(self._collection._matching(self._filter))
+            if self._sort:
+                documents = _sorted(documents, self._sort)
+            documents = documents[self._skip:]
+            if self._limit:
+                documents = documents[:self._limit]
+            self._results = [_project(document, self._projection) for document in documents]
+        return self._results
+
+
+def _is_hashable(value: Any) -> bool:
+    return not isinstance(value, (dict, list))
+
+
+def _lookup_key(value: Any) -> Any:
+    # missing fields are indexed as null, like in MongoDB
+    return None if value is _MISSING else _comparable(value)
+
+
+def _lookup_keys(value: Any) -> list:
+    # arrays are indexed by every element, embedded documents are always candidates
+    if isinstance(value, list):
+        return [_lookup_key(item) if _is_hashable(item) else _UNHASHABLE for item in value] or [_UNHASHABLE]
+    return [_lookup_key(value) if _is_hashable(value) else _UNHASHABLE]
+
+
+def _copy(value: Any) -> Any:
+    # documents only hold dicts and lists of immutable BSON values, much cheaper than copy.deepcopy
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+def _sort_keys(key_or_list, direction: Optional[int] = None) -> list[tuple[str, int]]:
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or ASCENDING)]
+    return list(key_or_list.items()) if isinstance(key_or_list, dict) else list(key_or_list)
+
+
+def _sorted(documents: list[dict], keys: list[tuple[str, int]]) -> list[dict]:
+    # stable sorts from the last key to the first give the compound order
+    for field, direction in reversed(keys):
+        documents = sorted(documents, key=lambda document: _sort_value(_get(document, field)),
+                           reverse=direction < 0)
+    return documents
+
+
+def _sort_value(value: Any) -> tuple:
+    # BSON comparison order of the types the services store: null, numbers, strings, objects, ids, bool, dates
+    value = _comparable(value)
+    if value is _MISSING or value is None:
+        return 0, 0
+    if isinstance(value, bool):
+        return 5, value
+    if isinstance(value, (int, float, Decimal)):
+        return 1, value
+    if isinstance(value, str):
+        return 2, value
+    if isinstance(value, ObjectId):
+        return 4, value
+    if isinstance(value, datetime):
+        return 6, value
+    return 3, repr(value)
+
+
+def _index_keys(document: dict, keys: list[tuple[str, int]]) -> list[tuple]:
+    """Keys of the document in a compound index, one per element of an array field like in a multikey index"""
+    values = []
+    for field, _ in keys:
+        value = _get(document, field)
+        values.append([_comparable(item) for item in value] if isinstance(value, list) and value else
+                      [_comparable(value)])
+    return list(itertools.product(*values))
+
+
+def _comparable(value: Any) -> Any:
+    return value.to_decimal() if isinstance(value, Decimal128) else value
+
+
+def _get(document: dict, path: str) -> Any:
+    value = document
+    parts = path.split('.')
+    for position, part in enumerate(parts):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        elif isinstance(value, list):
+            # the values of the field in every element, e.g. transactions.id
+            rest = '.'.join(parts[position:])
+            values = [_get(item, rest) for item in value if isinstance(item, dict)]
+            return [item for item in values if item is not _MISSING] or _MISSING
+        else:
+            return _MISSING
+    return value
+
+
+def _set(document: dict, path: str, value: Any):
+    *parents, field = path.split('.')
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[field] = value
+
+
+def _unset(document: dict, path: str):
+    *parents, field = path.split('.')
+    for part in parents:
+        document = document.get(part)
+        if not isinstance(document, dict):
+            return
+    document.pop(field, None)
+
+
+def _matches(document: dict, filter: dict) -> bool:
+    for field, condition in filter.items():
+        if field == '$or':
+            if not any(_matches(document, clause) for clause in condition):
+                return False
+        elif field == '$and':
+            if not all(_matches(document, clause) for clause in condition):
+                return False
+        elif field == '$nor':
+            if any(_matches(document, clause) for clause in condition):
+                return False
+        elif not _matches_condition(_get(document, field), condition):
+            return False
+    return True
+
+
+def _matches_condition(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+        return all(_matches_operator(value, operator, argument) for operator, argument in condition.items())
+    if isinstance(condition, re.Pattern):
+        return isinstance(value, str) and condition.search(value) is not None
+    return _equals(value, condition)
+
+
+def _matches_operator(value: Any, operator: str, argument: Any) -> bool:
+    if operator == '$eq':
+        return _equals(value, argument)
+    if operator == '$ne':
+        return not _equals(value, argument)
+    if operator == '$in':
+        return any(_equals(value, item) for item in argument)
+    if operator == '$nin':
+        return not any(_equals(value, item) for item in argument)
+    if operator == '$exists':
+        return (value is not _MISSING) == bool(argument)
+    if operator == '$type':
+        types = argument if isinstance(argument, list) else [argument]
+        return value is not _MISSING and any(_TYPES[name](value) for name in types)
+    if operator == '$regex':
+        return isinstance(value, str) and re.search(argument, value) is not None
+    if operator in ('$gt', '$gte', '$lt', '$lte'):
+        return _compare(value, operator, argument)
+    if operator == '$not':
+        return not _matches_condition(value, argument)
+    raise OperationFailure(f'unknown operator: {operator}')
+
+
+def _equals(value: Any, expected: Any) -> bool:
+    if isinstance(value, list) and not isinstance(expected, list):
+        return any(_equals(item, expected) for item in value)
+    if value is _MISSING:
+        return expected is None
+    return _comparable(value) == _comparable(expected)
+
+
+def _compare(value: Any, operator: str, argument: Any) -> bool:
+    value, argument = _comparable(value), _comparable(argument)
+    # like MongoDB, range operators only match values of the same type bracket
+    if value is _MISSING or value is None or _sort_value(value)[0] != _sort_value(argument)[0]:
+        return False
+    if operator == '$gt':
+        return value > argument
+    if operator == '$gte':
+        return value >= argument
+    if operator == '$lt':
+        return value < argument
+    return value <= argument
+
+
+def _apply_update(document: dict, update: dict, inserting: bool) -> dict:
+    if not any(key.startswith('$') for key in update):
+        # replacement document, only the _id is kept
+        return {'_id': document['_id'], **_copy(update)} if '_id' in document else _copy(update)
+    for operator, fields in update.items():
+        if operator == '$setOnInsert' and not inserting:
+            continue
+        for path, value in fields.items():
+            if operator in ('$set', '$setOnInsert'):
+                _set(document, path, _copy(value))
+            elif operator == '$unset':
+                _unset(document, path)
+            elif operator == '$inc':
+                _set(document, path, _increment(_get(document, path), value))
+            elif operator in ('$min', '$max'):
+                current = _get(document, path)
+                if current is _MISSING or _compare(value, '$lt' if operator == '$min' else '$gt', current):
+                    _set(document, path, _copy(value))
+            elif operator == '$push':
+                current = _get(document, path)
+                values = value['$each'] if isinstance(value, dict) and '$each' in value else [value]
+                values = (current if isinstance(current, list) else []) + _copy(values)
+                if isinstance(value, dict) and '$slice' in value:
+                    # a negative $slice keeps the last elements
+                    values = values[value['$slice']:] if value['$slice'] < 0 else values[:value['$slice']]
+                _set(document, path, values)
+            else:
+                raise OperationFailure(f'Unknown modifier: {operator}')
+    return document
+
+
+def _increment(current: Any, amount: Any) -> Any:
+    if current is _MISSING or current is None:
+        return amount
+    if isinstance(current, Decimal128) or isinstance(amount, Decimal128):
+        # MongoDB keeps the result as Decimal128 when either operand is Decimal128
+        return to_decimal128(_to_decimal(current) + _to_decimal(amount))
+    return current + amount
+
+
+def _to_decimal(value: Any) -> Decimal:
+    return value.to_decimal() if isinstance(value, Decimal128) else Decimal(str(value))
+
+
+def _project(document: dict, projection: Optional[dict]) -> dict:
+    document = _copy(document)
+    if not projection:
+        return document
+    if isinstance(projection, (list, tuple)):
+        projection = {field: True for field in projection}
+    include_id = bool(projection.get('_id', True))
+    fields = {field: bool(value) for field, value in projection.items() if field != '_id'}
+    if any(fields.values()):
+        projected = {}
+        for field, included in fields.items():
+            if included:
+                _merge(projected, _included(document, field.split('.')))
+        if include_id and '_id' in document:
+            projected['_id'] = document['_id']
+        return projected
+    for field in fields:
+        _unset(document, field)
+    if not include_id:
+        document.pop('_id', None)
+    return document
+
+
+def _included(value: Any, parts: list[str]) -> Any:
+    """The path of value as an inclusion projection returns it: embedded documents keep only the path and arrays keep
+    it in each of their embedded documents, e.g. transactions.id is a list of {'id': ...}"""
+    if not parts:
+        return value
+    if isinstance(value, list):
+        return [_included(item, parts) for item in value if isinstance(item, dict)]
+    if isinstance(value, dict) and parts[0] in value:
+        inner = _included(value[parts[0]], parts[1:])
+        return {} if inner is _MISSING else {parts[0]: inner}
+    return {} if isinstance(value, dict) else _MISSING
+
+
+def _merge(target: dict, source: dict):
+    for key, value in source.items():
+        if isinstance(target.get(key), dict) and isinstance(value, dict):
+            _merge(target[key], value)
+        elif isinstance(target.get(key), list) and isinstance(value, list):
+            for target_item, item in zip(target[key], value):
+                _merge(target_item, item)
+        else:
+            target[key] = value
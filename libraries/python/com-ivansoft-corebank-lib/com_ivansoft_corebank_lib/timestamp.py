@@ -0,0 +1,59 @@
+import re
+from datetime import datetime, timezone
+from typing import Callable, Optional
+
+# Java Date.toString(), e.g. Wed Apr 08 17:26:53 UTC 2026
+_JAVA_DATE = re.compile(r'^(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun) (Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec) '
+                        r'(\d{2}) (\d{2}):(\d{2}):(\d{2}) ([A-Z]{3}) (\d{4})$')
+_MONTHS = {month: number for number, month in enumerate(
+    ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'], start=1)}
+# the timezone is ignored, only the ones the services are known to send are accepted
+_JAVA_TIMEZONES = {'UTC', 'CST', 'GMT', 'EST', 'PST'}
+
+
+def _parse_iso(value: str) -> Optional[datetime]:
+    if len(value) < 10 or value[4] != '-':
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def _parse_java(value: str) -> Optional[datetime]:
+    match = _JAVA_DATE.match(value)
+    if not match or match.group(6) not in _JAVA_TIMEZONES:
+        return None
+    month, day, hour, minute, second, _, year = match.groups()
+    return datetime(int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second))
+
+
+class TimestampParser:
+    """Tries the formats in order and moves the one that matched to the front, a stream of timestamps in the same
+    format is parsed with a single attempt per value. Formats return None instead of raising when they don't match"""
+
+    def __init__(self, formats: list[Callable[[str], Optional[datetime]]]):
+        self._formats = list(formats)
+
+    def parse(self, value: str) -> datetime:
+        for index, parse in enumerate(self._formats):
+            result = parse(value)
+            if result is not None:
+                if index:
+                    self._formats.insert(0, self._formats.pop(index))
+                return result
+        raise ValueError(f'Invalid date format: {value}')
+
+
+_parser = TimestampParser([_parse_iso, _parse_java])
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parses ISO 8601 and Java Date.toString() timestamps"""
+    return _parser.parse(value)
+
+
+def naive_utc(timestamp: datetime) -> datetime:
+    """The timestamp in UTC without timezone, like MongoDB returns dates. Timestamps without timezone are taken as
+    UTC, e.g. the ones parsed from Java Date.toString()"""
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None) if timestamp.tzinfo else timestamp
@@ -0,0 +1,31 @@
+from unittest import TestCase
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.models.Balance import Balance
+from com_ivansoft_corebank_lib.models.Transaction import Transaction
+
+
+class TestMoney(TestCase):
+    def _transaction(self, amount):
+        return Transaction(id='1', account_id='1', amount=amount, type='DEPOSIT', status='PENDING',
+                           description='Test', timestamp='2024-08-30T18:24:06', version=1)
+
+    def test_float_amount_is_exact(self):
+        self.assertEqual(self._transaction(100.45).amount, Decimal('100.45'))
+        self.assertEqual(self._transaction(0.1).amount + self._transaction(0.2).amount, Decimal('0.3'))
+
+    def test_amount_from_json(self):
+        transaction = Transaction.model_validate_json(
+            '{"id": "1", "account_id": "1", "amount": 100.45, "type": "DEPOSIT", "status": "PENDING", '
+            '"description": "Test", "timestamp": "2024-08-30T18:24:06", "version": 1}')
+
+        self.assertEqual(transaction.amount, Decimal('100.45'))
+
+    def test_amount_from_decimal128_and_string(self):
+        self.assertEqual(self._transaction(Decimal128('100.45')).amount, Decimal('100.45'))
+        self.assertEqual(self._transaction('100.45').amount, Decimal('100.45'))
+
+    def test_balance_from_decimal128(self):
+        balance = Balance(balance=Decimal128('1000.10'), user_id=1, username='test', account_id='1')
+
+        self.assertEqual(balance.balance, Decimal('1000.10'))
@@ -0,0 +1,19 @@
+from unittest import TestCase
+from datetime import date, datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.models.Rollup import Rollup, RollupGranularity
+
+
+class TestRollup(TestCase):
+    def test_period(self):
+        self.assertEqual(RollupGranularity.DAY.period(datetime(2024, 3, 5, 23, 59)), '2024-03-05')
+        self.assertEqual(RollupGranularity.MONTH.period(date(2024, 3, 5)), '2024-03')
+
+    def test_net(self):
+        rollup = Rollup(account_id='1', granularity='day', period='2024-03-05', count=3,
+                        deposits=Decimal128('150.50'), withdrawals=Decimal128('20.25'),
+                        closing_balance=Decimal128('1130.25'))
+
+        self.assertEqual(rollup.net, Decimal('130.25'))
+        self.assertEqual(rollup.model_dump()['net'], Decimal('130.25'))
@@ -0,0 +1,48 @@
+import json
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from com_ivansoft_corebank_lib.testing.benchmark import BenchmarkResult, check, compare, run_benchmark
+
+
+class TestBenchmark(IsolatedAsyncioTestCase):
+    async def test_run_benchmark(self):
+        calls = []
+
+        async def operation(i):
+            calls.append(i)
+
+        result = await run_benchmark('noop', operation, calls=100, operations_per_call=10, warmup=5)
+
+        self.assertEqual(calls, list(range(105)))
+        self.assertEqual(result.operations, 1000)
+        self.assertEqual(len(result.latencies_ms), 100)
+
+    def test_compare_is_normalized_by_calibration(self):
+        baseline = {'benchmarks': {'events': BenchmarkResult('events', 1000, 1.0, [1.0] * 10).to_baseline(10000)}}
+
+        # twice as slow on a machine twice as slow is not a regression
+        slower_machine = compare([BenchmarkResult('events', 1000, 2.0, [2.0] * 10)], baseline, 5000, 0.5)
+        regression = compare([BenchmarkResult('events', 1000, 3.0, [3.0] * 10)], baseline, 10000, 0.5)
+
+        self.assertEqual(slower_machine, [])
+        self.assertEqual(len(regression), 1)
+
+    def test_check_fails_without_baseline_unless_updating(self):
+        results = [BenchmarkResult('events', 1000, 1.0, [1.0] * 10)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+
+            with patch.dict(os.environ, {'BENCHMARK_UPDATE_BASELINE': 'false'}):
+                missing = check(results, path, 10000)
+            with patch.dict(os.environ, {'BENCHMARK_UPDATE_BASELINE': 'true'}):
+                updated = check(results, path, 10000)
+            with patch.dict(os.environ, {'BENCHMARK_UPDATE_BASELINE': 'false'}):
+                checked = check(results + [BenchmarkResult('new', 10, 1.0, [1.0])], path, 10000)
+
+            self.assertEqual(len(missing), 1)
+            self.assertEqual(updated, [])
+            with open(path) as file:
+                self.assertEqual(list(json.load(file)['benchmarks']), ['events'])
+            self.assertEqual(checked, ['new: not in the baseline, record it with BENCHMARK_UPDATE_BASELINE=true'])
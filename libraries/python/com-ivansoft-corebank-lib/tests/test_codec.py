@@ -0,0 +1,49 @@
+import json
+from unittest import TestCase
+from datetime import datetime
+from pydantic import ValidationError
+from com_ivansoft_corebank_lib.codec import decode_transaction, decode_transactions
+from com_ivansoft_corebank_lib.models.Transaction import Transaction, TransactionType
+
+
+def _transaction(transaction_id='1', timestamp='Fri Aug 30 18:24:06 CST 2024'):
+    return {
+        'id': transaction_id,
+        'account_id': '1',
+        'amount': 1000,
+        'type': 'DEPOSIT',
+        'status': 'PENDING',
+        'description': 'Test',
+        'timestamp': timestamp,
+        'version': 1,
+    }
+
+
+class TestCodec(TestCase):
+    def test_decode_transaction(self):
+        # Arrange
+        data = json.dumps(_transaction())
+
+        # Act
+        result = decode_transaction(data)
+
+        # Assert
+        self.assertEqual(result, Transaction(**json.loads(data)))
+        self.assertEqual(result.type, TransactionType.DEPOSIT)
+        self.assertEqual(result.timestamp, datetime(2024, 8, 30, 18, 24, 6))
+
+    def test_decode_transaction_bytes_and_dict(self):
+        data = _transaction(timestamp='2024-08-30T18:24:06')
+
+        self.assertEqual(decode_transaction(json.dumps(data).encode()), decode_transaction(data))
+
+    def test_decode_transactions(self):
+        data = json.dumps([_transaction('1'), _transaction('2')])
+
+        result = decode_transactions(data)
+
+        self.assertEqual([transaction.id for transaction in result], ['1', '2'])
+
+    def test_decode_invalid_transaction(self):
+        with self.assertRaises(ValidationError):
+            decode_transaction(json.dumps(_transaction(timestamp='yesterday')))
@@ -0,0 +1,37 @@
+from unittest import TestCase
+from datetime import datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.documents import to_document, to_decimal128
+from com_ivansoft_corebank_lib.models.Balance import Balance
+from com_ivansoft_corebank_lib.models.Transaction import Transaction, TransactionType
+
+
+class TestDocuments(TestCase):
+    def test_transaction_document(self):
+        # Arrange
+        transaction = Transaction(id='tx1', account_id='1', amount=100.45, type=TransactionType.WITHDRAW,
+                                  status='PENDING', description='Test', timestamp='2024-08-30T18:24:06', version=1)
+
+        # Act
+        document = to_document(transaction, _id=transaction.id)
+
+        # Assert
+        self.assertEqual(document['_id'], 'tx1')
+        self.assertEqual(document['type'], 'WITHDRAWAL')
+        self.assertIs(type(document['type']), str)
+        self.assertEqual(document['timestamp'], datetime(2024, 8, 30, 18, 24, 6))
+        self.assertEqual(document['amount'], Decimal128('100.45'))
+
+    def test_balance_document(self):
+        balance = Balance(balance=Decimal('1000.10'), user_id=1, username='test', account_id='1')
+
+        document = to_document(balance)
+
+        self.assertEqual(document['balance'], Decimal128('1000.10'))
+        self.assertEqual(document['currency'], 'MXN')
+
+    def test_to_decimal128_rounds_to_its_precision(self):
+        result = to_decimal128(Decimal(100.45))
+
+        self.assertEqual(result.to_decimal(), Decimal('100.4500000000000028421709430404007'))
@@ -0,0 +1,78 @@
+import io
+import json
+import queue
+from unittest import TestCase
+from structlog import get_logger
+from com_ivansoft_corebank_lib.log import Lazy, configure_logging, logging_settings, set_level, set_sample_rate
+import com_ivansoft_corebank_lib.log as log
+from com_ivansoft_corebank_lib.models.User import User
+
+
+class TestLog(TestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        configure_logging('info', 1.0, 'json', stream=self.stream)
+
+    def tearDown(self):
+        configure_logging()
+
+    def _records(self) -> list[dict]:
+        log._writer.close()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_records_are_rendered_by_the_writer(self):
+        # Arrange
+        computed = []
+
+        # Act
+        get_logger().bind(logger='test').info('New balance', user=User(user_id=1, username='a'),
+                                              total=Lazy(lambda: computed.append(1) or 42))
+        get_logger().bind(logger='test').debug('Hidden', value=Lazy(lambda: computed.append(2)))
+
+        # Assert
+        records = self._records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual({key: records[0][key] for key in ('event', 'level', 'logger', 'user', 'total')},
+                         {'event': 'New balance', 'level': 'info', 'logger': 'test',
+                          'user': {'user_id': 1, 'username': 'a'}, 'total': 42})
+        # the lazy value of the filtered record is never computed
+        self.assertEqual(computed, [1])
+
+    def test_sampled_loggers(self):
+        # Arrange
+        set_sample_rate(0)
+        logger = get_logger().bind(logger='test', sampled=True)
+
+        # Act
+        logger.info('Dropped')
+        logger.warning('Kept')
+
+        # Assert
+        self.assertEqual([(record['event'], 'sampled' in record) for record in self._records()], [('Kept', False)])
+
+    def test_runtime_settings(self):
+        set_level('ERROR')
+        get_logger().warning('Dropped')
+
+        self.assertEqual(logging_settings()['level'], 'error')
+        self.assertEqual(self._records(), [])
+        with self.assertRaises(ValueError):
+            set_level('verbose')
+        with self.assertRaises(ValueError):
+            set_sample_rate(2)
+
+    def test_full_queue_drops_records(self):
+        # Arrange - a full queue the writer thread doesn't drain, it waits on the original one
+        writer_queue = log._writer._queue
+        log._writer._queue = queue.Queue(1)
+        log._writer._queue.put_nowait({'event': 'Queued'})
+
+        # Act
+        get_logger().info('Dropped')
+
+        # Assert
+        self.assertEqual(logging_settings()['dropped'], 1)
+        log._writer._queue = writer_queue
+
+    def test_lazy_values_render_without_the_writer(self):
+        self.assertEqual(repr(Lazy(lambda: {'balance': 42})), "{'balance': 42}")
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+from prometheus_client import REGISTRY
+from com_ivansoft_corebank_lib.metrics import MetricsMiddleware, latest, measure_mongo_time, timed
+
+
+class Repository:
+    @timed
+    async def get(self, account_id: str) -> str:
+        return account_id
+
+    @timed
+    async def get_many(self, account_ids: [str]):
+        for account_id in account_ids:
+            yield account_id
+
+
+def _count(name: str, labels: dict) -> float:
+    return REGISTRY.get_sample_value(f'{name}_count', labels) or 0
+
+
+class TestMetrics(IsolatedAsyncioTestCase):
+    async def test_timed(self):
+        # Arrange
+        before_get = _count('mongo_operation_duration_seconds', {'operation': 'Repository.get'})
+        before_many = _count('mongo_operation_duration_seconds', {'operation': 'Repository.get_many'})
+
+        # Act
+        result = await Repository().get('1')
+        items = [item async for item in Repository().get_many(['1', '2'])]
+
+        # Assert
+        self.assertEqual((result, items), ('1', ['1', '2']))
+        self.assertEqual(_count('mongo_operation_duration_seconds', {'operation': 'Repository.get'}), before_get + 1)
+        # one observation per generator, not per item
+        self.assertEqual(_count('mongo_operation_duration_seconds', {'operation': 'Repository.get_many'}),
+                         before_many + 1)
+
+    async def test_measure_mongo_time(self):
+        # Arrange
+        async def handle():
+            await asyncio.sleep(0.05)
+            await asyncio.gather(Repository().get('1'), Repository().get('2'))
+
+        # Act
+        with measure_mongo_time() as mongo_time:
+            await handle()
+        await Repository().get('3')
+
+        # Assert - the operations of the tasks started within, not the sleep nor the operations after it
+        self.assertEqual(mongo_time.operations, 2)
+        self.assertLess(mongo_time.seconds, 0.05)
+        self.assertEqual(mongo_time.mean(), mongo_time.seconds / 2)
+
+    async def test_middleware_labels_route_template(self):
+        class Route:
+            path = '/account/{account_id}/balance'
+
+        async def app(scope, receive, send):
+            scope['route'] = Route()
+            await send({'type': 'http.response.start', 'status': 404, 'headers': []})
+            await send({'type': 'http.response.body', 'body': b''})
+
+        async def send(message):
+            pass
+
+        labels = {'method': 'GET', 'route': '/account/{account_id}/balance', 'status': '404'}
+        before = _count('http_request_duration_seconds', labels)
+
+        await MetricsMiddleware(app)({'type': 'http', 'method': 'GET', 'path': '/account/123/balance'}, None, send)
+
+        self.assertEqual(_count('http_request_duration_seconds', labels), before + 1)
+
+    async def test_latest_aggregates_the_processes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # Arrange - two processes of the service count events
+            script = "from prometheus_client import Counter; Counter('worker_events', 'Events').inc(2)"
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', script], check=True,
+                               env={**os.environ, 'PROMETHEUS_MULTIPROC_DIR': directory})
+
+            # Act
+            with patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                content, _ = latest()
+
+            # Assert
+            self.assertIn(b'worker_events_total 4.0', content)
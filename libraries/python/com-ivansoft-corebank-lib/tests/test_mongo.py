@@ -0,0 +1,131 @@
+from unittest import IsolatedAsyncioTestCase
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from pymongo import IndexModel, InsertOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient, DUPLICATE_KEY_ERROR
+
+
+class TestInMemoryMongo(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.collection = InMemoryMongoClient()['db']['transactions']
+        await self.collection.insert_many([
+            {'_id': f'tx{i}', 'id': f'tx{i}', 'account_id': '1' if i % 2 else '2', 'timestamp': f'2024-01-0{i}',
+             'amount': Decimal128(f'{i}.50')} for i in range(1, 6)])
+
+    async def test_find_filter_sort_limit(self):
+        # Act
+        documents = await (self.collection.find({'account_id': '1', 'timestamp': {'$lt': '2024-01-05'}}, {'_id': False})
+                           .sort([('timestamp', -1), ('id', -1)]).limit(1).to_list(length=None))
+
+        # Assert
+        self.assertEqual(documents, [{'id': 'tx3', 'account_id': '1', 'timestamp': '2024-01-03',
+                                      'amount': Decimal128('3.50')}])
+
+    async def test_find_or_and_in(self):
+        documents = [document['_id'] async for document in self.collection.find(
+            {'$or': [{'_id': {'$in': ['tx1', 'tx2']}}, {'amount': {'$gte': Decimal('5')}}]})]
+
+        self.assertEqual(documents, ['tx1', 'tx2', 'tx5'])
+
+    async def test_documents_are_copies(self):
+        document = await self.collection.find_one({'_id': 'tx1'})
+        document['account_id'] = 'changed'
+
+        self.assertEqual((await self.collection.find_one({'_id': 'tx1'}))['account_id'], '1')
+
+    async def test_duplicate_key(self):
+        with self.assertRaises(DuplicateKeyError):
+            await self.collection.insert_one({'_id': 'tx1'})
+
+        with self.assertRaises(BulkWriteError) as context:
+            await self.collection.insert_many([{'_id': 'tx9'}, {'_id': 'tx1'}], ordered=False)
+        self.assertEqual([(error['index'], error['code']) for error in context.exception.details['writeErrors']],
+                         [(1, DUPLICATE_KEY_ERROR)])
+        self.assertEqual(await self.collection.count_documents({'_id': 'tx9'}), 1)
+
+    async def test_find_one_and_update_upsert_inc_decimal128(self):
+        balances = InMemoryMongoClient()['db']['balance_current']
+        update = {'$inc': {'balance': Decimal128('100.45')}, '$setOnInsert': {'account_id': '1'}}
+
+        await balances.find_one_and_update({'_id': '1'}, update, upsert=True, return_document=ReturnDocument.AFTER)
+        balance = await balances.find_one_and_update({'_id': '1'}, update, upsert=True,
+                                                     return_document=ReturnDocument.AFTER)
+
+        self.assertEqual(balance, {'_id': '1', 'balance': Decimal128('200.90'), 'account_id': '1'})
+
+    async def test_bulk_write(self):
+        result = await self.collection.bulk_write([
+            UpdateOne({'_id': 'tx1'}, {'$set': {'status': 'DONE'}}),
+            UpdateOne({'_id': 'tx9'}, {'$set': {'status': 'NEW'}}, upsert=True),
+            InsertOne({'_id': 'tx10'}),
+        ], ordered=False)
+
+        self.assertEqual((result.modified_count, result.upserted_count, result.inserted_count), (1, 1, 1))
+        self.assertEqual(await self.collection.count_documents({'status': {'$exists': True}}), 2)
+
+    async def test_unique_index(self):
+        await self.collection.create_indexes([IndexModel([('account_id', 1), ('timestamp', 1)], name='unique_key',
+                                                         unique=True)])
+
+        with self.assertRaises(DuplicateKeyError):
+            await self.collection.insert_one({'account_id': '1', 'timestamp': '2024-01-01'})
+        self.assertIn('unique_key', await self.collection.index_information())
+
+    async def test_unique_index_on_array_path(self):
+        # Arrange - a transaction is stored once per account whatever its bucket
+        buckets = InMemoryMongoClient()['db']['buckets']
+        await buckets.create_indexes([IndexModel([('account_id', 1), ('items.id', 1)], unique=True)])
+        await buckets.insert_one({'_id': 'b1', 'account_id': '1', 'items': [{'id': 'tx1'}, {'id': 'tx2'}]})
+
+        # Act / Assert
+        await buckets.insert_one({'_id': 'b2', 'account_id': '2', 'items': [{'id': 'tx1'}]})
+        await buckets.update_one({'_id': 'b1'}, {'$push': {'items': {'id': 'tx3'}}})
+        with self.assertRaises(DuplicateKeyError):
+            await buckets.update_one({'_id': 'b3', 'items.id': {'$ne': 'tx2'}}, {
+                '$push': {'items': {'id': 'tx2'}}, '$setOnInsert': {'account_id': '1'}}, upsert=True)
+        self.assertEqual(await buckets.find_one({'_id': 'b1'}, {'_id': False, 'items.id': True}),
+                         {'items': [{'id': 'tx1'}, {'id': 'tx2'}, {'id': 'tx3'}]})
+
+    async def test_index_lookup_follows_updates(self):
+        # Arrange
+        await self.collection.create_indexes([IndexModel([('account_id', 1), ('timestamp', 1)], name='account_id')])
+
+        # Act
+        await self.collection.update_one({'_id': 'tx1'}, {'$set': {'account_id': '2'}})
+        await self.collection.delete_one({'_id': 'tx4'})
+
+        # Assert
+        ids = [document['_id'] for document in await self.collection.find({'account_id': '2'}).to_list(None)]
+        self.assertEqual(ids, ['tx1', 'tx2'])
+        self.assertEqual(await self.collection.count_documents({'account_id': {'$in': ['1', '3']}}), 2)
+
+    async def test_push_each_min_max_and_array_paths(self):
+        # Arrange
+        buckets = InMemoryMongoClient()['db']['buckets']
+        update = {'$push': {'items': {'$each': [{'id': 'tx1'}, {'id': 'tx2'}]}}, '$min': {'first': '2024-01-02'},
+                  '$max': {'last': '2024-01-03'}}
+
+        # Act
+        await buckets.update_one({'_id': 'b1', 'items.id': {'$ne': 'tx1'}}, update, upsert=True)
+        await buckets.update_one({'_id': 'b1'}, {'$push': {'items': {'id': 'tx3'}}, '$min': {'first': '2024-01-01'},
+                                                 '$max': {'last': '2024-01-02'}})
+
+        # Assert
+        self.assertEqual(await buckets.find_one({'items.id': 'tx2'}), {
+            '_id': 'b1', 'items': [{'id': 'tx1'}, {'id': 'tx2'}, {'id': 'tx3'}], 'first': '2024-01-01',
+            'last': '2024-01-03'})
+        self.assertEqual(await buckets.count_documents({'items.id': {'$ne': 'tx1'}}), 0)
+
+    async def test_push_slice_keeps_the_last_elements(self):
+        # Arrange
+        balances = InMemoryMongoClient()['db']['balances']
+        await balances.insert_one({'_id': 'acc1', 'applied': ['tx1', 'tx2']})
+
+        # Act
+        await balances.update_one({'_id': 'acc1', 'applied': {'$nin': ['tx3', 'tx4']}},
+                                  {'$push': {'applied': {'$each': ['tx3', 'tx4'], '$slice': -3}}})
+
+        # Assert
+        self.assertEqual((await balances.find_one({'_id': 'acc1'}))['applied'], ['tx2', 'tx3', 'tx4'])
+        self.assertEqual(await balances.count_documents({'applied': {'$nin': ['tx1', 'tx4']}}), 0)
@@ -0,0 +1,50 @@
+from unittest import TestCase
+from com_ivansoft_corebank_lib.mongo_client import LazyClient, MongoBase, client_options
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+
+
+class Repository:
+    _client = LazyClient()
+
+
+class TestMongoClient(TestCase):
+    def setUp(self):
+        self.configured = (MongoBase._url, MongoBase._options)
+
+    def tearDown(self):
+        MongoBase._client = None
+        MongoBase.configure(*self.configured)
+
+    def test_client_options(self):
+        # Act
+        options = client_options(max_pool_size=20, min_pool_size=5, wait_queue_timeout_ms='2000',
+                                  compressors='zstd,zlib', write_concern_w='2', write_concern_journal='true')
+
+        # Assert - unset options are left to the driver defaults
+        self.assertEqual(options, {'maxPoolSize': 20, 'minPoolSize': 5, 'waitQueueTimeoutMS': 2000,
+                                   'compressors': 'zstd,zlib', 'w': 2, 'journal': True})
+
+    def test_write_concern_tag_set(self):
+        self.assertEqual(client_options(write_concern_w='majority'), {'w': 'majority'})
+
+    def test_options_follow_the_configured_settings(self):
+        # Arrange
+        settings = {'max_pool_size': 10}
+        MongoBase.configure('mongodb://localhost:27017', lambda: client_options(**settings))
+
+        # Act
+        settings['max_pool_size'] = 30
+
+        # Assert
+        self.assertEqual(MongoBase.options(), {'maxPoolSize': 30})
+
+    def test_lazy_client_resolves_when_used(self):
+        # Arrange
+        client = InMemoryMongoClient()
+
+        # Act
+        MongoBase._client = client
+
+        # Assert
+        self.assertIs(Repository._client, client)
+        self.assertIs(Repository()._client, client)
@@ -0,0 +1,61 @@
+from unittest import IsolatedAsyncioTestCase
+from pymongo import ASCENDING, IndexModel
+from com_ivansoft_corebank_lib.mongo_indexes import (bootstrap_indexes, drop_superseded_indexes, ensure_indexes,
+                                                    verify_query_patterns)
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+
+INDEXES = {
+    'transactions': [IndexModel([('account_id', ASCENDING), ('timestamp', ASCENDING)], name='account_id_timestamp')],
+    'users': [IndexModel([('account_ids', ASCENDING)], name='account_ids')],
+}
+QUERY_PATTERNS = [
+    ('TransactionRepository.get_history', 'transactions', ['account_id', 'timestamp']),
+    ('TransactionRepository.get_by_account_id', 'transactions', ['account_id']),
+    ('TransactionRepository.get', 'transactions', ['_id']),
+    ('UserRepository.find_many', 'users', ['account_ids']),
+    ('BalanceRepository.get_history', 'balances', ['account_id']),
+]
+
+
+class TestMongoIndexes(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.database = InMemoryMongoClient()['db']
+
+    async def test_ensure_indexes_creates_missing(self):
+        # Arrange
+        await self.database['users'].create_index('account_ids', name='account_ids')
+
+        # Act
+        await ensure_indexes(self.database, INDEXES)
+
+        # Assert
+        self.assertEqual(set(await self.database['transactions'].index_information()), {'_id_', 'account_id_timestamp'})
+        self.assertEqual(set(await self.database['users'].index_information()), {'_id_', 'account_ids'})
+
+    async def test_verify_query_patterns_reports_unsupported(self):
+        # Arrange - prefixes of an index and _id are supported
+        await ensure_indexes(self.database, INDEXES)
+
+        # Act
+        unsupported = await verify_query_patterns(self.database, QUERY_PATTERNS)
+
+        # Assert
+        self.assertEqual(unsupported, ['BalanceRepository.get_history'])
+
+    async def test_drop_superseded_indexes(self):
+        # Arrange
+        await self.database['transactions'].create_index('account_id', name='account_id')
+        await ensure_indexes(self.database, INDEXES)
+
+        # Act - the users index was already dropped
+        await drop_superseded_indexes(self.database, {'transactions': ['account_id'], 'users': ['username']})
+
+        # Assert
+        self.assertEqual(set(await self.database['transactions'].index_information()), {'_id_', 'account_id_timestamp'})
+
+    async def test_bootstrap_indexes_logs_errors(self):
+        # Arrange - a spec that isn't an IndexModel fails the index creation
+        indexes = {'broken': [object()]}
+
+        # Act / Assert - doesn't raise
+        await bootstrap_indexes(self.database, indexes, QUERY_PATTERNS)
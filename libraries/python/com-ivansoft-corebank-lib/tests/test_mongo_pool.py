@@ -0,0 +1,42 @@
+from unittest import TestCase
+from pymongo.monitoring import (ConnectionCheckedInEvent, ConnectionCheckedOutEvent, ConnectionCheckOutFailedEvent,
+                                ConnectionCheckOutStartedEvent, ConnectionClosedEvent, ConnectionCreatedEvent,
+                                PoolClosedEvent, PoolCreatedEvent)
+from com_ivansoft_corebank_lib.mongo_pool import PoolStats
+
+ADDRESS = ('localhost', 27017)
+
+
+class TestPoolStats(TestCase):
+    def setUp(self):
+        self.stats = PoolStats()
+        self.stats.pool_created(PoolCreatedEvent(ADDRESS, {'maxPoolSize': 10, 'minPoolSize': 1}))
+
+    def test_check_outs(self):
+        # Act - two operations get a connection, a third one waits
+        for connection_id in (1, 2):
+            self.stats.connection_created(ConnectionCreatedEvent(ADDRESS, connection_id))
+            self.stats.connection_check_out_started(ConnectionCheckOutStartedEvent(ADDRESS))
+            self.stats.connection_checked_out(ConnectionCheckedOutEvent(ADDRESS, connection_id, 0.002 * connection_id))
+        self.stats.connection_check_out_started(ConnectionCheckOutStartedEvent(ADDRESS))
+        self.stats.connection_checked_in(ConnectionCheckedInEvent(ADDRESS, 1))
+
+        # Assert
+        self.assertEqual(self.stats.snapshot()['localhost:27017'], {
+            'max_pool_size': 10, 'min_pool_size': 1, 'open': 2, 'checked_out': 1, 'idle': 1, 'waiting': 1,
+            'check_outs': 2, 'check_out_failures': 0, 'cleared': 0, 'wait_ms_avg': 3.0, 'wait_ms_max': 4.0})
+
+    def test_check_out_failures_and_closed_connections(self):
+        self.stats.connection_created(ConnectionCreatedEvent(ADDRESS, 1))
+        self.stats.connection_check_out_started(ConnectionCheckOutStartedEvent(ADDRESS))
+        self.stats.connection_check_out_failed(ConnectionCheckOutFailedEvent(ADDRESS, 'timeout', 0.5))
+        self.stats.connection_closed(ConnectionClosedEvent(ADDRESS, 1, 'idle'))
+
+        server = self.stats.snapshot()['localhost:27017']
+        self.assertEqual((server['open'], server['waiting'], server['check_out_failures'], server['wait_ms_max']),
+                         (0, 0, 1, 500.0))
+
+    def test_closed_pool(self):
+        self.stats.pool_closed(PoolClosedEvent(ADDRESS))
+
+        self.assertEqual(self.stats.snapshot(), {})
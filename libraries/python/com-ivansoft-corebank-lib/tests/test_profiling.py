@@ -0,0 +1,62 @@
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from pydantic import BaseModel
+from com_ivansoft_corebank_lib.profiling import ProfileStore, ProfilingMiddleware
+
+
+class Balance(BaseModel):
+    account_id: str
+    balance: float
+
+
+async def app(scope, receive, send):
+    Balance.model_validate({'account_id': '1', 'balance': 10.5})
+    await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+    await send({'type': 'http.response.body', 'body': b'{}'})
+
+
+def _scope(headers: list = ()) -> dict:
+    return {'type': 'http', 'method': 'GET', 'path': '/account/1/balance', 'headers': list(headers)}
+
+
+class TestProfiling(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ProfileStore(self.directory.name)
+        self.messages = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def send(self, message):
+        self.messages.append(message)
+
+    async def test_profiles_request_with_header(self):
+        # Act
+        await ProfilingMiddleware(app, self.store)(_scope([(b'x-profile', b'1')]), None, self.send)
+
+        # Assert
+        profile_id = dict(self.messages[0]['headers'])[b'x-profile-id'].decode()
+        summary = self.store.get(profile_id)
+        self.assertEqual((summary['path'], summary['status']), ('/account/1/balance', 200))
+        self.assertIn('pydantic', summary['stages'])
+        self.assertTrue(summary['top'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, f'{profile_id}.prof')))
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, f'{profile_id}.json')))
+        self.assertNotIn('top', self.store.recent()[0])
+
+    async def test_skips_request_without_header(self):
+        middleware = ProfilingMiddleware(app, self.store)
+
+        await middleware(_scope(), None, self.send)
+        await middleware(_scope([(b'x-profile', b'0')]), None, self.send)
+
+        self.assertEqual(self.store.recent(), [])
+        self.assertEqual(self.messages[0]['headers'], [])
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    async def test_samples_requests(self):
+        await ProfilingMiddleware(app, self.store, sample_rate=1.0)(_scope(), None, self.send)
+
+        self.assertEqual(len(self.store.recent()), 1)
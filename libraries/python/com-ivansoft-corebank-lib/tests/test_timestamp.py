@@ -0,0 +1,40 @@
+from unittest import TestCase
+from datetime import datetime, timezone
+from com_ivansoft_corebank_lib.timestamp import TimestampParser, parse_timestamp, _parse_iso, _parse_java
+
+
+class TestTimestamp(TestCase):
+    def test_parse_iso(self):
+        self.assertEqual(parse_timestamp('2024-08-30T18:24:06'), datetime(2024, 8, 30, 18, 24, 6))
+        self.assertEqual(parse_timestamp('2024-08-30T18:24:06Z'),
+                         datetime(2024, 8, 30, 18, 24, 6, tzinfo=timezone.utc))
+
+    def test_parse_java(self):
+        self.assertEqual(parse_timestamp('Fri Aug 30 18:24:06 CST 2024'), datetime(2024, 8, 30, 18, 24, 6))
+        self.assertEqual(parse_timestamp('Wed Apr 08 17:26:53 UTC 2026'), datetime(2026, 4, 8, 17, 26, 53))
+
+    def test_parse_invalid(self):
+        for value in ['not a date', 'Fri Aug 30 18:24:06 XYZ 2024', '2024-13-40T00:00:00']:
+            with self.assertRaisesRegex(ValueError, 'Invalid date format'):
+                parse_timestamp(value)
+
+    def test_matching_format_is_tried_first(self):
+        # Arrange
+        calls = []
+
+        def tracked(parse):
+            def wrapper(value):
+                calls.append(parse.__name__)
+                return parse(value)
+            wrapper.__name__ = parse.__name__
+            return wrapper
+
+        parser = TimestampParser([tracked(_parse_iso), tracked(_parse_java)])
+
+        # Act
+        parser.parse('Fri Aug 30 18:24:06 CST 2024')
+        calls.clear()
+        parser.parse('Sat Aug 31 18:24:06 CST 2024')
+
+        # Assert
+        self.assertEqual(calls, ['_parse_java'])
@@ -0,0 +1,42 @@
+from typing import Annotated, Optional
+from fastapi import APIRouter, Depends, Query
+from structlog import get_logger
+from app.api.eventsource.v1.subscribers import apply_entries, get_account_service, get_worker_pool, routing_key
+from app.api.schemas.DeadLetterReplayModel import DeadLetterReplayModel
+from app.services.AccountService import AccountService
+from app.services.WorkerPool import WorkerPool
+from app.config.settings import DEAD_LETTER_REPLAY_MAX
+
+logger = get_logger().bind(logger='dead_letters')
+
+router = APIRouter()
+
+
+@router.get('/dead_letters', response_model=None)
+async def get_dead_letters(limit: int = Query(100, gt=0, le=DEAD_LETTER_REPLAY_MAX),
+                           account_service: AccountService = Depends(get_account_service)):
+    """Parked events, the oldest first"""
+    return await account_service.get_dead_letters(limit)
+
+
+@router.post('/dead_letters/replay', response_model=None)
+async def replay_dead_letters(replay: DeadLetterReplayModel,
+                              account_service: AccountService = Depends(get_account_service),
+                              worker_pool: Annotated[Optional[WorkerPool], Depends(get_worker_pool)] = None):
+    """Apply parked events again, in the order they were parked and the same way as the live events. The applied
+    ones are marked as replayed, the ones failing permanently again stay parked with the new error and the ones
+    failing transiently stay parked as they were"""
+    parked = await account_service.get_dead_letters(replay.limit, replay.ids)
+    entries = [(dead_letter['_id'], dead_letter['event']) for dead_letter in parked]
+    if worker_pool is not None:
+        statuses = await worker_pool.submit(entries, key=routing_key)
+    else:
+        statuses = await apply_entries(account_service, entries)
+
+    replayed = [event_id for event_id, _ in entries if statuses[event_id] == 'SUCCESS']
+    failed = sum(1 for status in statuses.values() if status == 'DROP')
+    await account_service.mark_replayed(replayed)
+    logger.info('Dead letters replayed', replayed=len(replayed), failed=failed,
+                retry=len(entries) - len(replayed) - failed)
+    return {'replayed': len(replayed), 'failed': failed, 'retry': len(entries) - len(replayed) - failed,
+            'ids': replayed}
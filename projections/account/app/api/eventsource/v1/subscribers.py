@@ -1,34 +1,221 @@
 
+import asyncio
 import json
-from fastapi import APIRouter, Depends
+import re
+from functools import partial, wraps
+from typing import Annotated, Optional
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import JSONResponse
+from structlog import get_logger
 from app.api.schemas.CloudEventModel import CloudEventModel
+from app.api.schemas.BulkSubscribeModel import BulkSubscribeMessageModel
 from com_ivansoft_corebank_lib.models.Transaction import Transaction
-from decimal import Decimal
+from com_ivansoft_corebank_lib import codec
+from com_ivansoft_corebank_lib.metrics import measure_mongo_time
 from app.services.AccountService import AccountService
+from app.services.KeyedExecutor import KeyedExecutor
+from app.services.ConcurrencyLimiter import ConcurrencyLimiter
+from app.services.WorkerPool import WorkerPool
+from app.metrics import CONCURRENCY_LIMIT, REQUESTS_IN_FLIGHT, REQUESTS_SHED
+from app.services.retry import is_permanent, retry_transient
+from app.config.settings import EXECUTOR_LANES, EXECUTOR_QUEUE_DEPTH
+from app.config.settings import (LIMITER_ENABLED, LIMITER_INITIAL_LIMIT, LIMITER_MIN_LIMIT, LIMITER_MAX_LIMIT,
+                                 LIMITER_LATENCY_TOLERANCE, LIMITER_BACKOFF_RATIO)
+
+logger = get_logger().bind(logger='subscribers', sampled=True)
 
 router = APIRouter()
 
-def get_account_service():
-    service = AccountService()
-    yield service
+# events of the same account are applied one at a time in arrival order, different accounts run concurrently
+executor = KeyedExecutor(EXECUTOR_LANES, EXECUTOR_QUEUE_DEPTH)
+
+# deliveries handled at once, shared by both handlers, shown at /debug/limiter
+limiter = ConcurrencyLimiter(LIMITER_INITIAL_LIMIT, LIMITER_MIN_LIMIT, LIMITER_MAX_LIMIT, LIMITER_LATENCY_TOLERANCE,
+                             LIMITER_BACKOFF_RATIO)
+
+def record_limiter():
+    # set on every change instead of read on scrape, so the gauges are also exported from the metric files of the
+    # multi-process mode
+    REQUESTS_IN_FLIGHT.set(limiter.in_flight)
+    CONCURRENCY_LIMIT.set(int(limiter.limit))
+
+def get_account_service(request: Request) -> AccountService:
+    # created once per app in main.py
+    return request.app.state.account_service
+
+def get_worker_pool(request: Request) -> Optional[WorkerPool]:
+    # started in main.py in the multi-process mode, events are applied in this process otherwise
+    return getattr(request.app.state, 'worker_pool', None)
+
+def limited(handler):
+    """Handle the delivery within the concurrency limit, over it the delivery is answered with 429 so Dapr
+    redelivers it later. The limiter compares the mean latency of the MongoDB operations of the delivery, the time it
+    waits in the executor lanes and the retry backoff are not load. Deliveries answered with RETRY or failing count as
+    overload"""
+    if not LIMITER_ENABLED:
+        return handler
+
+    @wraps(handler)
+    async def wrapper(*args, **kwargs):
+        if not limiter.try_acquire():
+            REQUESTS_SHED.labels(handler.__name__).inc()
+            return JSONResponse({"status": "RETRY"}, status_code=429, headers={'Retry-After': '1'})
+        record_limiter()
+        response = None
+        with measure_mongo_time() as mongo_time:
+            try:
+                response = await handler(*args, **kwargs)
+                return response
+            finally:
+                limiter.release(mongo_time.mean(), overloaded=response is None or _retried(response))
+                record_limiter()
+    return wrapper
 
-"""this endpoint handlers is for programmatic method to subscribe to a topic, check main.py for subscription details"""
+def _retried(response: dict) -> bool:
+    return response.get("status") == "RETRY" or any(
+        status["status"] == "RETRY" for status in response.get("statuses", []))
+
+"""this endpoint handlers is for programmatic method to subscribe to a topic, check main.py for subscription details.
+
+Transient errors (e.g. MongoDB unavailable) are retried in the lane of the account with exponential backoff, then the
+event is left to Dapr to redeliver (RETRY). Permanent errors (invalid events, unknown accounts) would fail every
+redelivery, so the event is parked in the dead letter collection and dropped from the topic (DROP), see the admin api
+to replay it. An event is only dropped once it is parked"""
 
 @router.post('/account_projections/handler', response_model=None)
-async def account_projections_handler(event: CloudEventModel, account_service: AccountService = Depends(get_account_service)):
-    transaction = Transaction(**json.loads(event.data))
+@limited
+async def account_projections_handler(event: CloudEventModel, account_service: AccountService = Depends(get_account_service),
+                                      worker_pool: Annotated[Optional[WorkerPool], Depends(get_worker_pool)] = None):
+    if worker_pool is not None:
+        statuses = await worker_pool.submit([(event.id, event.model_dump())], key=routing_key)
+        return {"status": statuses[event.id]}
+
+    try:
+        transaction = codec.decode_transaction(event.data)
+    except Exception as e:
+        logger.error('Invalid event', event_id=event.id, error=str(e))
+        return {"status": "DROP" if await park(account_service, [(event.id, event.model_dump(), e)]) else "RETRY"}
+
+    logger.info('Processing transaction', transaction_id=transaction.id, account_id=transaction.account_id)
+
+    # apply the transaction once, redeliveries of an already processed event are acknowledged without changes
+    try:
+        processed = await executor.submit(transaction.account_id, partial(
+            retry_transient, partial(account_service.process_transaction, transaction)))
+    except Exception as e:
+        logger.error('Error applying transaction', transaction_id=transaction.id, account_id=transaction.account_id,
+                     error=str(e))
+        if not is_permanent(e):
+            return {"status": "RETRY"}
+        return {"status": "DROP" if await park(account_service, [(event.id, event.model_dump(), e)]) else "RETRY"}
+
+    if not processed:
+        return {"message": "Transaction already processed"}
+
+    return {"message": "Projections processed successfully"}
+
+
+@router.post('/account_projections/bulk_handler', response_model=None)
+@limited
+async def account_projections_bulk_handler(message: BulkSubscribeMessageModel, account_service: AccountService = Depends(get_account_service),
+                                           worker_pool: Annotated[Optional[WorkerPool], Depends(get_worker_pool)] = None):
+    """Dapr bulk subscribe handler, every entry gets its own status so only the failed ones are redelivered"""
+    entries = [(entry.entryId, entry.event) for entry in message.entries]
+    if worker_pool is not None:
+        statuses = await worker_pool.submit(entries, key=routing_key)
+    else:
+        statuses = await apply_entries(account_service, entries)
+    return {"statuses": [{"entryId": entry.entryId, "status": statuses[entry.entryId]} for entry in message.entries]}
+
+
+async def apply_entries(account_service: AccountService, entries: [(str, object)]) -> dict[str, str]:
+    """Decode and apply (entry_id, CloudEvent) pairs, returns the Dapr status of every entry: SUCCESS, RETRY for
+    transient failures and DROP for the permanent ones, which are parked"""
+    statuses = {}
+    transactions = []
+    decoded = []
+    dead_letters = []
+    for entry_id, event in entries:
+        try:
+            transactions.append(decode_transaction(event))
+            decoded.append((entry_id, event))
+        except Exception as e:
+            logger.error('Invalid bulk entry', entry_id=entry_id, error=str(e))
+            dead_letters.append((entry_id, event, e))
+
+    permanent, transient = await apply_in_lanes(account_service, transactions)
+
+    for (entry_id, event), transaction in zip(decoded, transactions):
+        if transaction.account_id in permanent:
+            dead_letters.append((entry_id, event, permanent[transaction.account_id]))
+        else:
+            statuses[entry_id] = 'RETRY' if transaction.account_id in transient else 'SUCCESS'
+
+    parked = await park(account_service, [(event_id(entry_id, event), event, error)
+                                          for entry_id, event, error in dead_letters])
+    for entry_id, _, _ in dead_letters:
+        statuses[entry_id] = 'DROP' if parked else 'RETRY'
+    return statuses
+
+
+async def apply_in_lanes(account_service: AccountService, transactions: [Transaction]) -> (dict, dict):
+    """Apply the transactions partitioned by executor lane, every partition with its own bulk writes and its transient
+    errors retried. Returns the errors of the accounts that failed permanently and of the ones that failed
+    transiently, both keyed by account id"""
+    partitions = executor.partition(transactions, key=lambda transaction: transaction.account_id)
+    results = await asyncio.gather(*(
+        executor.submit(partition[0].account_id, partial(
+            retry_transient, partial(account_service.apply_transactions, partition)))
+        for partition in partitions), return_exceptions=True)
+
+    permanent = {}
+    transient = {}
+    for partition, result in zip(partitions, results):
+        if isinstance(result, Exception):
+            logger.error('Error applying bulk entries', entries=len(partition), error=str(result))
+            failed = permanent if is_permanent(result) else transient
+            failed.update((transaction.account_id, result) for transaction in partition)
+        else:
+            permanent.update(result)
+    return permanent, transient
+
+
+async def park(account_service: AccountService, events: [(str, object, BaseException)]) -> bool:
+    """Park the events in the dead letter collection, returns False when they could not be parked so they are
+    redelivered instead of lost"""
+    if not events:
+        return True
+    try:
+        await account_service.park_events(events)
+        return True
+    except Exception as e:
+        logger.error('Error parking events, they will be redelivered', events=len(events), error=str(e))
+        return False
+
+
+def event_id(entry_id: str, event) -> str:
+    # the CloudEvent id, the entry id when the event is not a json object
+    return event.get('id', entry_id) if isinstance(event, dict) else entry_id
 
-    print(f'Start procressing balance projection')
 
-    # convert float to Decimal
-    amount = Decimal(transaction.amount)
+# the account id of the transaction json, also when it is escaped inside a CloudEvent string
+_ACCOUNT_ID = re.compile(r'\\?"account_id\\?"\s*:\s*\\?"([^"\\]*)')
 
-    # update the balance
-    await account_service.update_balance(transaction.account_id, amount, transaction.type)
 
-    print(f'Start procressing transaction history projection')
+def routing_key(entry_id: str, event) -> str:
+    """Account id of the event without validating it, the entry id when it has none so the invalid event is parked
+    by any worker"""
+    data = event.get('data', event) if isinstance(event, dict) else event
+    if isinstance(data, dict):
+        return str(data.get('account_id', entry_id))
+    match = _ACCOUNT_ID.search(data) if isinstance(data, str) else None
+    return match.group(1) if match else entry_id
 
-    # save the transaction to history
-    await account_service.save_transaction(transaction)
 
-    return {"message": "Projections processed successfully"}
\ No newline at end of file
+def decode_transaction(event) -> Transaction:
+    # with cloudevents content type Dapr sends the event as a json object, the data may be a string or an object
+    if isinstance(event, (str, bytes)):
+        event = json.loads(event)
+    data = event['data'] if isinstance(event, dict) and 'data' in event else event
+    # the data string is validated straight into the model without an intermediate dict
+    return codec.decode_transaction(data)
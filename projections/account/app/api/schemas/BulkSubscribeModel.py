@@ -0,0 +1,20 @@
+
+from typing import Any, Optional
+from pydantic import BaseModel
+
+
+class BulkSubscribeEntryModel(BaseModel):
+    entryId: str
+    # the CloudEvent as a json object when contentType is application/cloudevents+json
+    event: Any
+    contentType: Optional[str] = None
+    metadata: Optional[dict] = None
+
+
+class BulkSubscribeMessageModel(BaseModel):
+    entries: list[BulkSubscribeEntryModel]
+    id: Optional[str] = None
+    topic: Optional[str] = None
+    pubsubname: Optional[str] = None
+    type: Optional[str] = None
+    metadata: Optional[dict] = None
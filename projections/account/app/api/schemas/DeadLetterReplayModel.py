@@ -0,0 +1,9 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+from app.config.settings import DEAD_LETTER_REPLAY_MAX
+
+
+class DeadLetterReplayModel(BaseModel):
+    # the ids of the events to replay, the oldest parked events when missing
+    ids: Optional[list[str]] = None
+    limit: int = Field(DEAD_LETTER_REPLAY_MAX, gt=0, le=DEAD_LETTER_REPLAY_MAX)
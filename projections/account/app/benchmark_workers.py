@@ -0,0 +1,106 @@
+"""Events per second of the multi-process mode by number of worker processes, 0 being the events applied in this
+process like the default mode. Bulk messages are submitted with --concurrency of them in flight, like the sidecar
+delivers them.
+
+Every worker uses its own in-memory MongoDB of the common library, which works because the accounts of a worker
+are applied by that worker only. So the numbers are the CPU side of the projections (decoding, validation, the
+projection logic and the IPC with the workers) spread over the cores, MongoDB is not measured"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+
+# there is no sidecar to publish the balance updates to and no users, set before the settings are imported here and
+# in the workers
+os.environ['BALANCE_UPDATES_ENABLED'] = 'false'
+os.environ['USER_PLACEHOLDER_ENABLED'] = 'true'
+
+from app import worker  # noqa: E402
+from app.api.eventsource.v1.subscribers import apply_entries, routing_key  # noqa: E402
+from app.db.MongoBase import MongoBase  # noqa: E402
+from app.services.AccountService import AccountService  # noqa: E402
+from app.services.WorkerPool import WorkerPool  # noqa: E402
+
+
+def use_in_memory_mongo():
+    MongoBase._client = InMemoryMongoClient()
+
+
+def cloud_event(i: int, accounts: int) -> dict:
+    transaction = {'id': f'tx{i}', 'account_id': f'acc{i % accounts}', 'amount': 100.45, 'type': 'DEPOSIT',
+                   'status': 'PENDING', 'description': 'Deposit of $100.45',
+                   'timestamp': f'2024-03-{i % 28 + 1:02d}T12:00:00Z', 'version': 1}
+    return {'specversion': '1.0', 'type': 'com.dapr.event.sent', 'source': 'benchmark', 'id': str(i),
+            'datacontenttype': 'application/json', 'data': json.dumps(transaction), 'topic': 'transactions',
+            'pubsubname': 'eventsource'}
+
+
+async def measure(workers: int, messages: int, entries: int, accounts: int, concurrency: int) -> float:
+    """Events per second applying messages bulk messages of entries events"""
+    batches = [[(str(n), cloud_event(n, accounts)) for n in range(i * entries, (i + 1) * entries)]
+               for i in range(messages + 1)]
+    if workers == 0:
+        use_in_memory_mongo()
+        account_service = AccountService()
+        pool = None
+
+        async def submit(batch):
+            return await apply_entries(account_service, batch)
+    else:
+        pool = WorkerPool(worker.run, workers, setup=use_in_memory_mongo)
+        await pool.start()
+
+        async def submit(batch):
+            return await pool.submit(batch, key=routing_key)
+
+    try:
+        # warm up, the workers import the app when they start
+        await submit(batches[0])
+        slots = asyncio.Semaphore(concurrency)
+
+        async def submit_limited(batch):
+            async with slots:
+                statuses = await submit(batch)
+            assert all(status == 'SUCCESS' for status in statuses.values()), statuses
+
+        start = time.perf_counter()
+        await asyncio.gather(*(submit_limited(batch) for batch in batches[1:]))
+        return messages * entries / (time.perf_counter() - start)
+    finally:
+        if pool is not None:
+            await pool.close()
+        MongoBase._client = None
+
+
+async def benchmark(workers: [int], messages: int, entries: int, accounts: int, concurrency: int) -> list[dict]:
+    results = []
+    for count in workers:
+        events_per_second = await measure(count, messages, entries, accounts, concurrency)
+        results.append({'workers': count, 'events_per_second': round(events_per_second, 1)})
+    single = next((result['events_per_second'] for result in results if result['workers'] == 1), None)
+    for result in results:
+        result['speedup'] = round(result['events_per_second'] / single, 2) if single else None
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Events per second of the projections by number of worker processes')
+    parser.add_argument('--workers', default='0,1,2,4', help='Comma separated worker counts, 0 is in-process')
+    parser.add_argument('--messages', type=int, default=200, help='Bulk messages per run')
+    parser.add_argument('--entries', type=int, default=100, help='Events per bulk message')
+    parser.add_argument('--accounts', type=int, default=1000, help='Accounts the events are spread over')
+    parser.add_argument('--concurrency', type=int, default=8, help='Bulk messages in flight')
+    args = parser.parse_args()
+
+    results = asyncio.run(benchmark([int(count) for count in args.workers.split(',')], args.messages, args.entries,
+                                    args.accounts, args.concurrency))
+    print(f'{os.cpu_count()} cores')
+    print(f'{"workers":>8} {"events/s":>10} {"speedup":>8}')
+    for result in results:
+        print(f'{result["workers"]:>8} {result["events_per_second"]:>10} {result["speedup"] or "":>8}')
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,122 @@ MONGO_HOST = os.environ.get('MONGO_HOST', 'localhost')
 MONGO_URL = f'mongodb://{MONGO_HOST}:27017/'
 MONGO_DB_NAME = 'mydb'
 MONGO_BALANCE_COLLECTION = 'balance'
+MONGO_CURRENT_BALANCE_COLLECTION = 'balance_current'
 MONGO_USER_COLLECTION = 'user'
 MONGO_TRANSACTION_COLLECTION = 'transactions'
-MONGO_ACCOUNT_COLLECTION = 'account'
\ No newline at end of file
+MONGO_TRANSACTION_BUCKET_COLLECTION = 'transaction_buckets'
+MONGO_ACCOUNT_COLLECTION = 'account'
+MONGO_PROCESSED_EVENT_COLLECTION = 'processed_events'
+MONGO_ROLLUP_COLLECTION = 'balance_rollups'
+MONGO_DEAD_LETTER_COLLECTION = 'dead_letter_events'
+MONGO_BALANCE_CHECKPOINT_COLLECTION = 'balance_checkpoints'
+
+# MongoDB client, the connection pool is per process and shared by every request. Unset timeouts use the driver
+# defaults, MONGO_COMPRESSORS is a comma separated list (zstd and snappy need their python packages, zlib doesn't)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = os.environ.get('MONGO_MAX_IDLE_TIME_MS')
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+MONGO_CONNECT_TIMEOUT_MS = os.environ.get('MONGO_CONNECT_TIMEOUT_MS')
+MONGO_SERVER_SELECTION_TIMEOUT_MS = os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS')
+MONGO_SOCKET_TIMEOUT_MS = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+# write concern of the projections writes, w is majority or a number of nodes, journal waits for the journal
+MONGO_WRITE_CONCERN_W = os.environ.get('MONGO_WRITE_CONCERN_W')
+MONGO_WRITE_CONCERN_JOURNAL = os.environ.get('MONGO_WRITE_CONCERN_JOURNAL')
+MONGO_WRITE_CONCERN_TIMEOUT_MS = os.environ.get('MONGO_WRITE_CONCERN_TIMEOUT_MS')
+
+# storage layout of the transaction history, shared with the queries api: document stores one document per transaction
+# in MONGO_TRANSACTION_COLLECTION, bucket one document per account and TRANSACTION_BUCKET_PERIOD (day or month) in
+# MONGO_TRANSACTION_BUCKET_COLLECTION holding up to TRANSACTION_BUCKET_SIZE transactions. The migrate-transactions
+# script copies the stored history from one layout to the other
+TRANSACTION_LAYOUT = os.environ.get('TRANSACTION_LAYOUT', 'document')
+TRANSACTION_BUCKET_PERIOD = os.environ.get('TRANSACTION_BUCKET_PERIOD', 'month')
+TRANSACTION_BUCKET_SIZE = int(os.environ.get('TRANSACTION_BUCKET_SIZE', '200'))
+
+# ids of the last BALANCE_APPLIED_WINDOW transactions applied to every current balance, the increment of a balance only
+# matches while its transactions are not among them, so a redelivery is never applied twice even when the processed
+# events ledger wasn't written. It has to cover the events of an account applied while an event waits for redelivery
+BALANCE_APPLIED_WINDOW = int(os.environ.get('BALANCE_APPLIED_WINDOW', '1000'))
+
+# keep a balance snapshot per applied event in MONGO_BALANCE_COLLECTION besides the current balance
+BALANCE_SNAPSHOTS_ENABLED = os.environ.get('BALANCE_SNAPSHOTS_ENABLED', 'true').lower() == 'true'
+
+# daily and monthly totals per account in MONGO_ROLLUP_COLLECTION
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS_ENABLED', 'true').lower() == 'true'
+
+# balance of every account after each BALANCE_CHECKPOINT_INTERVAL events in MONGO_BALANCE_CHECKPOINT_COLLECTION, the
+# queries api answers the balance at a past time from the nearest earlier checkpoint and the transactions after it
+BALANCE_CHECKPOINTS_ENABLED = os.environ.get('BALANCE_CHECKPOINTS_ENABLED', 'true').lower() == 'true'
+BALANCE_CHECKPOINT_INTERVAL = int(os.environ.get('BALANCE_CHECKPOINT_INTERVAL', '100'))
+
+# Dapr bulk subscribe, the sidecar delivers up to BULK_SUBSCRIBE_MAX_MESSAGES events per request
+BULK_SUBSCRIBE_ENABLED = os.environ.get('BULK_SUBSCRIBE_ENABLED', 'true').lower() == 'true'
+BULK_SUBSCRIBE_MAX_MESSAGES = int(os.environ.get('BULK_SUBSCRIBE_MAX_MESSAGES', '100'))
+BULK_SUBSCRIBE_MAX_AWAIT_MS = int(os.environ.get('BULK_SUBSCRIBE_MAX_AWAIT_MS', '40'))
+
+# per-account ordered executor, events of an account always run in the same lane, lanes run concurrently
+EXECUTOR_LANES = int(os.environ.get('EXECUTOR_LANES', '16'))
+EXECUTOR_QUEUE_DEPTH = int(os.environ.get('EXECUTOR_QUEUE_DEPTH', '100'))
+
+# multi-process mode: with PROJECTION_WORKERS > 0 this process only receives the deliveries, their events are hashed
+# by account id onto PROJECTION_WORKERS worker processes (PROJECTION_WORKER_VNODES points each on the hash ring) that
+# apply them. A worker that exits is restarted in its slot with PROJECTION_WORKER_RESTART, otherwise its accounts are
+# rebalanced onto the remaining workers
+PROJECTION_WORKERS = int(os.environ.get('PROJECTION_WORKERS', '0'))
+PROJECTION_WORKER_VNODES = int(os.environ.get('PROJECTION_WORKER_VNODES', '64'))
+PROJECTION_WORKER_RESTART = os.environ.get('PROJECTION_WORKER_RESTART', 'true').lower() == 'true'
+
+# adaptive limit of the deliveries handled at once (AIMD): it grows by one while the deliveries are handled within
+# LIMITER_LATENCY_TOLERANCE times their usual latency and shrinks by LIMITER_BACKOFF_RATIO when they are slower or
+# fail transiently. Deliveries over the limit are answered with 429 and redelivered by Dapr
+LIMITER_ENABLED = os.environ.get('LIMITER_ENABLED', 'true').lower() == 'true'
+LIMITER_INITIAL_LIMIT = int(os.environ.get('LIMITER_INITIAL_LIMIT', '32'))
+LIMITER_MIN_LIMIT = int(os.environ.get('LIMITER_MIN_LIMIT', '4'))
+LIMITER_MAX_LIMIT = int(os.environ.get('LIMITER_MAX_LIMIT', '256'))
+LIMITER_LATENCY_TOLERANCE = float(os.environ.get('LIMITER_LATENCY_TOLERANCE', '2'))
+LIMITER_BACKOFF_RATIO = float(os.environ.get('LIMITER_BACKOFF_RATIO', '0.9'))
+
+# balance updates published to the queries api so it can invalidate its balance cache
+BALANCE_UPDATES_ENABLED = os.environ.get('BALANCE_UPDATES_ENABLED', 'true').lower() == 'true'
+BALANCE_UPDATES_PUBSUB_NAME = os.environ.get('BALANCE_UPDATES_PUBSUB_NAME', 'eventsource')
+BALANCE_UPDATES_TOPIC = os.environ.get('BALANCE_UPDATES_TOPIC', 'balances')
+DAPR_HTTP_PORT = os.environ.get('DAPR_HTTP_PORT', '3500')
+DAPR_URL = f'http://localhost:{DAPR_HTTP_PORT}'
+
+# transient failures (e.g. MongoDB unavailable) are retried in the lane of the account with exponential backoff before
+# asking Dapr to redeliver the event, permanent ones (invalid events, unknown accounts) are parked in
+# MONGO_DEAD_LETTER_COLLECTION and dropped from the topic
+RETRY_ATTEMPTS = int(os.environ.get('RETRY_ATTEMPTS', '3'))
+RETRY_BACKOFF_MS = int(os.environ.get('RETRY_BACKOFF_MS', '50'))
+RETRY_BACKOFF_MAX_MS = int(os.environ.get('RETRY_BACKOFF_MAX_MS', '1000'))
+# max parked events replayed per request of the admin api
+DEAD_LETTER_REPLAY_MAX = int(os.environ.get('DEAD_LETTER_REPLAY_MAX', '1000'))
+
+# events applied per batch by the replay script
+REPLAY_BATCH_SIZE = int(os.environ.get('REPLAY_BATCH_SIZE', '10000'))
+
+# opt-in request profiling, requests with the PROFILING_HEADER header and a PROFILING_SAMPLE_RATE fraction of the rest
+# are profiled with cProfile and written to PROFILING_DIR, the last ones are listed at /debug/profiles
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILING_HEADER = os.environ.get('PROFILING_HEADER', 'X-Profile')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/profiles')
+
+# users of the accounts, kept in an in-process LRU cache (they almost never change), the lookups that miss it are read
+# with one $in query per USER_BATCH_SIZE accounts. Accounts without a user are looked up again after
+# USER_CACHE_MISSING_TTL_SECONDS
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '100000'))
+USER_CACHE_MISSING_TTL_SECONDS = float(os.environ.get('USER_CACHE_MISSING_TTL_SECONDS', '60'))
+USER_BATCH_SIZE = int(os.environ.get('USER_BATCH_SIZE', '1000'))
+# accounts without a user document get a placeholder user instead of failing their events. No service creates the
+# users yet, enable it only in development and test environments
+USER_PLACEHOLDER_ENABLED = os.environ.get('USER_PLACEHOLDER_ENABLED', 'false').lower() == 'true'
+
+# logging, records are rendered and written by a background thread. LOG_SAMPLE_RATE is the fraction written of the
+# records below warning of the loggers bound with sampled=True, level and rate can be changed at /debug/logging.
+# LOG_FORMAT is console or json
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'console')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
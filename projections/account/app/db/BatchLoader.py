@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+from structlog import get_logger
+
+logger = get_logger().bind(logger='BatchLoader')
+
+
+class BatchLoader:
+    """DataLoader style batching: the keys loaded during the same event loop iteration, e.g. by concurrent events, are
+    read with one call of batch_fn per max_batch_size keys. batch_fn returns the values by key, keys it doesn't return
+    resolve to None. Loads of a key already being read share its result, cancelling one of them doesn't cancel the
+    others"""
+
+    def __init__(self, batch_fn: Callable[[list], Awaitable[dict]], max_batch_size: int):
+        self._batch_fn = batch_fn
+        self._max_batch_size = max_batch_size
+        self._pending: dict[Hashable, asyncio.Future] = {}
+        self._loading: dict[Hashable, asyncio.Future] = {}
+        # the dispatched batches, referenced until they finish so they aren't garbage collected
+        self._tasks = set()
+
+    def load(self, key: Hashable) -> asyncio.Future:
+        future = self._loading.get(key) or self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            if not self._pending:
+                # every load of this iteration is queued before the batch is dispatched
+                loop.call_soon(self._dispatch)
+            future = self._pending[key] = loop.create_future()
+        return asyncio.shield(future)
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, {}
+        self._loading.update(pending)
+        keys = list(pending)
+        for start in range(0, len(keys), self._max_batch_size):
+            batch = {key: pending[key] for key in keys[start:start + self._max_batch_size]}
+            task = asyncio.ensure_future(self._load_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _load_batch(self, batch: dict[Hashable, asyncio.Future]):
+        try:
+            values = await self._batch_fn(list(batch))
+        except Exception as e:
+            logger.error('Error loading batch', keys=len(batch), error=str(e))
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for key, future in batch.items():
+                if not future.done():
+                    future.set_result(values.get(key))
+        finally:
+            for key in batch:
+                self._loading.pop(key, None)
@@ -1,26 +1,196 @@
-import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from decimal import Decimal
+from typing import Optional
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.documents import to_document, to_decimal128
 from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.models.User import User as UserModel
+from com_ivansoft_corebank_lib.log import Lazy
+from com_ivansoft_corebank_lib.metrics import timed
+from com_ivansoft_corebank_lib.timestamp import naive_utc
 from structlog import get_logger
 from motor.motor_asyncio import AsyncIOMotorClient
-from app.db.MongoBase import MongoBase
-from app.config.settings import MONGO_DB_NAME, MONGO_BALANCE_COLLECTION
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.db.MongoBase import LazyClient, DUPLICATE_KEY_ERROR
+from app.config.settings import (MONGO_DB_NAME, MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION,
+                                 BALANCE_APPLIED_WINDOW)
 
-logger = get_logger().bind(logger='BalanceRepository')
+logger = get_logger().bind(logger='BalanceRepository', sampled=True)
 
 
 class BalanceRepository:
-    _client: AsyncIOMotorClient = MongoBase.get_client()
+    """The current balance of every account is a single document keyed by account id in the current balance
+    collection, it is updated in place with $inc together with the count of events applied to the account and the ids
+    of the last BALANCE_APPLIED_WINDOW transactions. The increment is conditional on its transactions not being among
+    them, so applying a transaction and recording it are one atomic write. The balance collection keeps the snapshot
+    history"""
+    _client: AsyncIOMotorClient = LazyClient()
 
+    @timed
     async def save(self, balance: BalanceModel):
-        to_save = json.loads(balance.model_dump_json())
-        logger.info('Saving balance', balance=balance)
+        to_save = to_document(balance)
+        logger.info('Saving balance', balance=Lazy(balance.model_dump))
         await BalanceRepository._client[MONGO_DB_NAME][MONGO_BALANCE_COLLECTION].insert_one(to_save)
 
+    @timed
+    async def save_many(self, balances: [BalanceModel]):
+        if not balances:
+            return
+        to_save = [to_document(balance) for balance in balances]
+        logger.info('Saving balances', count=len(to_save))
+        await BalanceRepository._client[MONGO_DB_NAME][MONGO_BALANCE_COLLECTION].insert_many(to_save)
+
+    @timed
+    async def increment(self, account_id: str, amount: Decimal, user: UserModel, transaction_id: str,
+                        timestamp: datetime) -> 'CurrentBalance':
+        """Atomically add amount (negative for withdrawals) of the transaction to the current balance, returns the
+        new balance or the current one when the transaction was already applied"""
+        logger.info('Incrementing balance', account_id=account_id, amount=amount, transaction_id=transaction_id)
+        collection = BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+        transactions = [(transaction_id, amount, timestamp)]
+        while True:
+            try:
+                balance = await collection.find_one_and_update(
+                    self._not_applied(account_id, transactions), self._increment_update(account_id, transactions, user),
+                    {'applied': False}, upsert=True, return_document=ReturnDocument.AFTER)
+                return self._to_current(balance, {transaction_id: balance['events']})
+            except DuplicateKeyError:
+                # the balance exists and didn't match, unless it was inserted meanwhile the transaction is applied
+                balance = await collection.find_one({'_id': account_id})
+                events = self._transaction_events(balance)
+                if transaction_id in events:
+                    logger.info('Transaction already applied', account_id=account_id, transaction_id=transaction_id)
+                    return self._to_current(balance, {transaction_id: events[transaction_id]}, {transaction_id})
+
+    @timed
+    async def increment_many(self, increments: dict[str, tuple[list[tuple[str, Decimal, datetime]], UserModel]]
+                             ) -> dict[str, 'CurrentBalance']:
+        """Apply the (transactions, user) increment of every account with one bulk write, transactions are
+        (transaction_id, amount, timestamp) tuples. An account whose balance already has some of them applied is
+        written again without them. Returns the current balance of every account, read with one query"""
+        collection = BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+        written = {}
+        # event of the account of the transactions that were already applied
+        already_applied = {}
+        pending = increments
+        while pending:
+            logger.info('Incrementing balances', count=len(pending))
+            account_ids = list(pending)
+            operations = [UpdateOne(self._not_applied(account_id, transactions),
+                                    self._increment_update(account_id, transactions, user), upsert=True)
+                          for account_id, (transactions, user) in pending.items()]
+            conflicts = []
+            try:
+                await collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors', [])
+                if any(error['code'] != DUPLICATE_KEY_ERROR for error in write_errors):
+                    raise
+                # the upserts of the balances that didn't match, the other increments are written
+                conflicts = [account_ids[error['index']] for error in write_errors]
+            written.update({account_id: transactions for account_id, (transactions, _) in pending.items()
+                            if account_id not in conflicts})
+            pending = await self._without_applied({account_id: pending[account_id] for account_id in conflicts},
+                                                  already_applied)
+        if already_applied:
+            logger.info('Transactions already applied', count=len(already_applied))
+
+        balances = {}
+        async for balance in collection.find({'_id': {'$in': list(increments)}}, {'applied': False}):
+            account_id = balance['_id']
+            # the transactions written last are the last events of the account
+            events = {transaction[0]: balance['events'] - len(written.get(account_id, [])) + position
+                      for position, transaction in enumerate(written.get(account_id, []), start=1)}
+            applied_before = {transaction[0] for transaction in increments[account_id][0]} & set(already_applied)
+            events.update({transaction_id: already_applied[transaction_id] for transaction_id in applied_before})
+            balances[account_id] = self._to_current(balance, events, applied_before)
+        return balances
+
+    @timed
     async def get(self, account_id: str) -> BalanceModel:
         logger.info('Retrieving balance', account_id=account_id)
 
-        # Get last balance, order by updated_at field
-        balance = await (BalanceRepository._client[MONGO_DB_NAME][MONGO_BALANCE_COLLECTION]
-                         .find_one({'account_id': account_id}, sort=[('updated_at', -1)]))
+        balance = await (BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+                         .find_one({'_id': account_id}, {'applied': False}))
+
+        return self._to_model(balance) if balance else None
+
+    @timed
+    async def get_many(self, account_ids: [str]) -> dict[str, BalanceModel]:
+        logger.info('Retrieving balances', count=len(account_ids))
+
+        balances = {}
+        async for balance in (BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+                              .find({'_id': {'$in': account_ids}}, {'applied': False})):
+            balances[balance['_id']] = self._to_model(balance)
+        return balances
+
+    async def _without_applied(self, increments: dict[str, tuple[list[tuple[str, Decimal, datetime]], UserModel]],
+                               already_applied: dict[str, int]) -> dict:
+        """The increments without the transactions their balances already have, which are added to already_applied
+        with their event of the account"""
+        if not increments:
+            return {}
+        remaining = {}
+        async for balance in (BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+                              .find({'_id': {'$in': list(increments)}}, {'applied': True, 'events': True})):
+            events = self._transaction_events(balance)
+            transactions, user = increments[balance['_id']]
+            already_applied.update({transaction[0]: events[transaction[0]] for transaction in transactions
+                                    if transaction[0] in events})
+            transactions = [transaction for transaction in transactions if transaction[0] not in events]
+            if transactions:
+                remaining[balance['_id']] = (transactions, user)
+        return remaining
+
+    @staticmethod
+    def _not_applied(account_id: str, transactions: list[tuple[str, Decimal, datetime]]) -> dict:
+        # on a balance with any of the transactions applied the upsert inserts its _id again and fails
+        return {'_id': account_id, 'applied': {'$nin': [transaction[0] for transaction in transactions]}}
+
+    @staticmethod
+    def _increment_update(account_id: str, transactions: list[tuple[str, Decimal, datetime]], user: UserModel) -> dict:
+        now = datetime.now().isoformat()
+        amount = sum((amount for _, amount, _ in transactions), Decimal(0))
+        return {
+            '$inc': {'balance': to_decimal128(amount), 'events': len(transactions)},
+            '$set': {'user_id': user.user_id, 'username': user.username, 'updated_at': now},
+            '$max': {'last_timestamp': max(naive_utc(timestamp) for _, _, timestamp in transactions)},
+            '$push': {'applied': {'$each': [transaction_id for transaction_id, _, _ in transactions],
+                                  '$slice': -BALANCE_APPLIED_WINDOW}},
+            '$setOnInsert': {'account_id': account_id, 'currency': BalanceModel.model_fields['currency'].default,
+                             'created_at': now},
+        }
+
+    @staticmethod
+    def _transaction_events(balance: dict) -> dict[str, int]:
+        """Event of the account of every transaction id in applied, the last one is the last event"""
+        applied = balance.get('applied', [])
+        return {transaction_id: balance['events'] - len(applied) + position
+                for position, transaction_id in enumerate(applied, start=1)}
+
+    def _to_current(self, balance: dict, transaction_events: dict[str, int],
+                    already_applied: set[str] = frozenset()) -> 'CurrentBalance':
+        return CurrentBalance(self._to_model(balance), balance['events'], balance.get('last_timestamp'),
+                              transaction_events, set(already_applied))
+
+    @staticmethod
+    def _to_model(balance: dict) -> BalanceModel:
+        if isinstance(balance['balance'], Decimal128):
+            balance['balance'] = balance['balance'].to_decimal()
+        return BalanceModel(**balance)
+
 
-        return BalanceModel(**balance) if balance else None
+@dataclass
+class CurrentBalance:
+    """Current balance of an account after an increment"""
+    balance: BalanceModel
+    # events applied to the account and the latest timestamp of their transactions
+    events: int
+    last_timestamp: Optional[datetime]
+    # number of every transaction of the increment among the events of the account, stored with it in the history
+    transaction_events: dict[str, int]
+    # transactions of the increment the balance already had applied
+    already_applied: set[str] = field(default_factory=set)
@@ -0,0 +1,36 @@
+from datetime import datetime
+from com_ivansoft_corebank_lib.documents import to_decimal128
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+from app.db.MongoBase import LazyClient, DUPLICATE_KEY_ERROR
+from app.config.settings import MONGO_DB_NAME, MONGO_BALANCE_CHECKPOINT_COLLECTION
+
+logger = get_logger().bind(logger='CheckpointRepository', sampled=True)
+
+
+class CheckpointRepository:
+    """Balance of an account after every BALANCE_CHECKPOINT_INTERVAL events, keyed by account id and event count so
+    writing a checkpoint again is a no-op. The balance at any time is the nearest earlier checkpoint plus the
+    transactions of the later events"""
+    _client: AsyncIOMotorClient = LazyClient()
+
+    @timed
+    async def save_many(self, checkpoints: [dict]):
+        """checkpoints have the account_id, the events applied to the account, the balance after the transaction
+        transaction_id of the last event and the latest timestamp of the transactions applied up to it"""
+        if not checkpoints:
+            return
+        logger.info('Saving balance checkpoints', count=len(checkpoints))
+        now = datetime.now().isoformat()
+        documents = [{**checkpoint, '_id': f'{checkpoint["account_id"]}:{checkpoint["events"]}',
+                      'balance': to_decimal128(checkpoint['balance']), 'created_at': now}
+                     for checkpoint in checkpoints]
+        try:
+            await CheckpointRepository._client[MONGO_DB_NAME][MONGO_BALANCE_CHECKPOINT_COLLECTION].insert_many(
+                documents, ordered=False)
+        except BulkWriteError as e:
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details.get('writeErrors', [])):
+                raise
+            logger.info('Balance checkpoints already saved', count=len(e.details['writeErrors']))
@@ -0,0 +1,53 @@
+from datetime import datetime
+from typing import Any, Optional
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, UpdateOne
+from app.db.MongoBase import LazyClient
+from app.config.settings import MONGO_DB_NAME, MONGO_DEAD_LETTER_COLLECTION
+
+logger = get_logger().bind(logger='DeadLetterRepository')
+
+PARKED = 'parked'
+REPLAYED = 'replayed'
+
+
+class DeadLetterRepository:
+    """Events that failed permanently, keyed by the CloudEvent id and stored as Dapr delivered them so they can be
+    replayed once the cause is fixed"""
+    _client: AsyncIOMotorClient = LazyClient()
+
+    @timed
+    async def park(self, events: [(str, Any, BaseException)]):
+        """Receives (event_id, event, error) triples. Parking an event again updates its error and counts the
+        failure"""
+        if not events:
+            return
+        now = datetime.now()
+        logger.warning('Parking events', count=len(events))
+        await DeadLetterRepository._client[MONGO_DB_NAME][MONGO_DEAD_LETTER_COLLECTION].bulk_write([
+            UpdateOne({'_id': event_id},
+                      {'$set': {'event': event, 'error': str(error), 'error_type': type(error).__name__,
+                                'status': PARKED, 'failed_at': now},
+                       '$setOnInsert': {'parked_at': now},
+                       '$inc': {'failures': 1}},
+                      upsert=True)
+            for event_id, event, error in events], ordered=False)
+
+    @timed
+    async def get_parked(self, limit: int, event_ids: Optional[list[str]] = None) -> list[dict]:
+        """Parked events, the oldest first"""
+        query = {'status': PARKED}
+        if event_ids is not None:
+            query['_id'] = {'$in': event_ids}
+        cursor = DeadLetterRepository._client[MONGO_DB_NAME][MONGO_DEAD_LETTER_COLLECTION].find(query)
+        return await cursor.sort('parked_at', ASCENDING).limit(limit).to_list(length=limit)
+
+    @timed
+    async def mark_replayed(self, event_ids: [str]):
+        """Replayed events are kept, with their status changed, as a record of what was replayed"""
+        if not event_ids:
+            return
+        await DeadLetterRepository._client[MONGO_DB_NAME][MONGO_DEAD_LETTER_COLLECTION].update_many(
+            {'_id': {'$in': list(event_ids)}}, {'$set': {'status': REPLAYED, 'replayed_at': datetime.now()}})
@@ -0,0 +1,63 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from app.config.settings import (MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION,
+                                 MONGO_TRANSACTION_COLLECTION, MONGO_PROCESSED_EVENT_COLLECTION, MONGO_ROLLUP_COLLECTION,
+                                 MONGO_USER_COLLECTION, MONGO_DEAD_LETTER_COLLECTION,
+                                 MONGO_BALANCE_CHECKPOINT_COLLECTION, MONGO_TRANSACTION_BUCKET_COLLECTION)
+
+# Indexes needed by the repositories queries, created at startup when missing. The names are shared with the
+# queries_bank_api service, which declares the same indexes for the collections both services read. Background builds
+# don't block the collection on servers older than 4.2, newer servers ignore the option
+INDEXES = {
+    MONGO_BALANCE_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('updated_at', DESCENDING)], name='account_id_updated_at', background=True),
+    ],
+    MONGO_TRANSACTION_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('timestamp', ASCENDING), ('id', ASCENDING)],
+                   name='account_id_timestamp_id', background=True),
+        IndexModel([('account_id', ASCENDING), ('event', ASCENDING)], name='account_id_event', background=True),
+    ],
+    MONGO_TRANSACTION_BUCKET_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('period', ASCENDING), ('sequence', ASCENDING)],
+                   name='account_id_period_sequence', background=True),
+        # a transaction is stored once per account whatever bucket it is in, the build fails on existing duplicates
+        IndexModel([('account_id', ASCENDING), ('transactions.id', ASCENDING)],
+                   name='account_id_transactions_id', unique=True, background=True),
+    ],
+    MONGO_ROLLUP_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('granularity', ASCENDING), ('period', ASCENDING)],
+                   name='account_id_granularity_period', background=True),
+    ],
+    MONGO_USER_COLLECTION: [
+        # multikey, one entry per account of the user
+        IndexModel([('account_ids', ASCENDING)], name='account_ids', background=True),
+    ],
+    MONGO_BALANCE_CHECKPOINT_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('timestamp', DESCENDING), ('events', DESCENDING)],
+                   name='account_id_timestamp_events', background=True),
+    ],
+    MONGO_DEAD_LETTER_COLLECTION: [
+        IndexModel([('status', ASCENDING), ('parked_at', ASCENDING)], name='status_parked_at', background=True),
+    ],
+}
+
+# indexes replaced by one of INDEXES, dropped at startup once the replacement exists. account_id_timestamp was
+# extended with id for the keyset pagination of the history
+SUPERSEDED_INDEXES = {
+    MONGO_TRANSACTION_COLLECTION: ['account_id_timestamp'],
+}
+
+# (query, collection, fields of the filter followed by the fields of the sort), every query pattern must be
+# supported by an index whose keys start with these fields
+QUERY_PATTERNS = [
+    ('BalanceRepository.get', MONGO_CURRENT_BALANCE_COLLECTION, ['_id']),
+    ('BalanceRepository.get_many', MONGO_CURRENT_BALANCE_COLLECTION, ['_id']),
+    ('TransactionRepository.get_by_account_id', MONGO_TRANSACTION_COLLECTION, ['account_id']),
+    ('TransactionBucketRepository.save_many', MONGO_TRANSACTION_BUCKET_COLLECTION, ['account_id', 'period']),
+    ('TransactionBucketRepository.get_by_account_id', MONGO_TRANSACTION_BUCKET_COLLECTION,
+     ['account_id', 'period', 'sequence']),
+    ('ProcessedEventRepository.get_processed', MONGO_PROCESSED_EVENT_COLLECTION, ['_id']),
+    ('RollupRepository.increment_many', MONGO_ROLLUP_COLLECTION, ['_id']),
+    ('UserRepository.find_many', MONGO_USER_COLLECTION, ['account_ids']),
+    ('DeadLetterRepository.get_parked', MONGO_DEAD_LETTER_COLLECTION, ['status', 'parked_at']),
+]
+
@@ -0,0 +1,47 @@
+from datetime import datetime
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError
+from app.db.MongoBase import LazyClient, DUPLICATE_KEY_ERROR
+from app.config.settings import MONGO_DB_NAME, MONGO_PROCESSED_EVENT_COLLECTION
+
+logger = get_logger().bind(logger='ProcessedEventRepository', sampled=True)
+
+
+class ProcessedEventRepository:
+    """Ledger of the transactions already applied to the projections, keyed by transaction id. It is read before
+    applying a transaction and written after its balance, so it skips the redeliveries of any age without holding a
+    claim while the event is applied. A redelivery of a transaction applied but not recorded yet is skipped by the
+    conditional balance increment instead"""
+    _client: AsyncIOMotorClient = LazyClient()
+
+    @timed
+    async def get_processed(self, transaction_ids: [str]) -> set[str]:
+        """Returns the transaction ids that were already processed"""
+        if not transaction_ids:
+            return set()
+        processed = {event['_id'] async for event in
+                     ProcessedEventRepository._client[MONGO_DB_NAME][MONGO_PROCESSED_EVENT_COLLECTION].find(
+                         {'_id': {'$in': list(transaction_ids)}}, {'_id': True})}
+        if processed:
+            logger.info('Transactions already processed', count=len(processed))
+        return processed
+
+    @timed
+    async def mark_processed(self, transactions: [(str, str)]):
+        """Receives (transaction_id, account_id) pairs, the ones already in the ledger are left as they are"""
+        transactions = list(dict(transactions).items())
+        if not transactions:
+            return
+        try:
+            await ProcessedEventRepository._client[MONGO_DB_NAME][MONGO_PROCESSED_EVENT_COLLECTION].insert_many(
+                [self._to_document(transaction_id, account_id) for transaction_id, account_id in transactions],
+                ordered=False)
+        except BulkWriteError as e:
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details.get('writeErrors', [])):
+                raise
+
+    @staticmethod
+    def _to_document(transaction_id: str, account_id: str) -> dict:
+        return {'_id': transaction_id, 'account_id': account_id, 'processed_at': datetime.now()}
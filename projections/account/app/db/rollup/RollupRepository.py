@@ -0,0 +1,48 @@
+from datetime import datetime
+from com_ivansoft_corebank_lib.documents import to_decimal128
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from app.db.MongoBase import LazyClient
+from app.config.settings import MONGO_DB_NAME, MONGO_ROLLUP_COLLECTION
+
+logger = get_logger().bind(logger='RollupRepository', sampled=True)
+
+
+class RollupRepository:
+    """One document per account, granularity and period with the totals of its transactions, updated in place with
+    $inc so a summary reads one document per period"""
+    _client: AsyncIOMotorClient = LazyClient()
+
+    @timed
+    async def increment_many(self, rollups: dict[tuple[str, RollupGranularity, str], dict]):
+        """rollups maps (account_id, granularity, period) to the count, deposits and withdrawals to add and the
+        closing_balance of the period, the balance after its transaction at last_timestamp. The closing balance is
+        only set when last_timestamp is the newest of the period, a transaction delivered late for an older period
+        keeps the balance after the newest one. The bulk write is ordered so it is set after last_timestamp"""
+        if not rollups:
+            return
+        logger.info('Incrementing rollups', count=len(rollups))
+        now = datetime.now().isoformat()
+        increments = []
+        closing_balances = []
+        for (account_id, granularity, period), totals in rollups.items():
+            _id = self._id(account_id, granularity, period)
+            increments.append(UpdateOne({'_id': _id}, {
+                '$inc': {'count': totals['count'], 'deposits': to_decimal128(totals['deposits']),
+                         'withdrawals': to_decimal128(totals['withdrawals'])},
+                '$max': {'last_timestamp': totals['last_timestamp']},
+                '$set': {'updated_at': now},
+                '$setOnInsert': {'account_id': account_id, 'granularity': granularity.value, 'period': period},
+            }, upsert=True))
+            closing_balances.append(UpdateOne({'_id': _id, 'last_timestamp': totals['last_timestamp']},
+                                              {'$set': {'closing_balance': to_decimal128(totals['closing_balance'])}}))
+        await RollupRepository._client[MONGO_DB_NAME][MONGO_ROLLUP_COLLECTION].bulk_write(
+            increments + closing_balances)
+
+    @staticmethod
+    def _id(account_id: str, granularity: RollupGranularity, period: str) -> str:
+        return f'{account_id}:{granularity.value}:{period}'
+
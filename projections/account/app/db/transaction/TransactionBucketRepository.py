@@ -0,0 +1,136 @@
+from decimal import Decimal
+from typing import Optional
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.documents import to_decimal128, to_document
+from com_ivansoft_corebank_lib.models.Money import to_money
+from com_ivansoft_corebank_lib.models.Transaction import Transaction as TransactionModel, TransactionType
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.db.MongoBase import LazyClient, DUPLICATE_KEY_ERROR
+from app.config.settings import (MONGO_DB_NAME, MONGO_TRANSACTION_BUCKET_COLLECTION, TRANSACTION_BUCKET_PERIOD,
+                                 TRANSACTION_BUCKET_SIZE)
+
+logger = get_logger().bind(logger='TransactionBucketRepository', sampled=True)
+
+_ZERO = Decimal128('0')
+
+
+class TransactionBucketRepository:
+    """Transaction history stored as one document per account and period (day or month) holding up to
+    TRANSACTION_BUCKET_SIZE transactions, a full bucket continues in the next sequence of the period. The header of a
+    bucket has the count, the deposits and withdrawals, the first and last timestamps and the last event of its
+    transactions, so a page of history reads one or two documents and the index has one entry per bucket instead of per transaction"""
+    _client: AsyncIOMotorClient = LazyClient()
+
+    granularity = RollupGranularity(TRANSACTION_BUCKET_PERIOD)
+
+    @timed
+    async def save(self, transaction: TransactionModel, event: int = None):
+        await self.save_many([transaction], {transaction.id: event} if event else None)
+
+    @timed
+    async def save_many(self, transactions: [TransactionModel], events: dict[str, int] = None):
+        """Pushes every transaction to the open bucket of its account and period. The push only matches a bucket that
+        isn't full and doesn't have the transaction, the next sequence is claimed by the upsert of its _id. Otherwise
+        the upsert fails with a duplicate key: of the bucket, when it is full or another writer opened it first, or of
+        the unique (account_id, transactions.id) index when any bucket of the account has the transaction. Those
+        transactions are pushed again to the buckets open then, unless they were already saved, which is ignored like
+        in the document layout. events has the number of every transaction among the events of its account, the
+        header keeps the last one of the bucket"""
+        events = events or {}
+        pending = transactions
+        while pending:
+            keys = [(transaction.account_id, self.granularity.period(transaction.timestamp))
+                    for transaction in pending]
+            open_buckets = await self._open_buckets(set(keys))
+            operations = []
+            for transaction, key in zip(pending, keys):
+                sequence, count = open_buckets.get(key, (0, 0))
+                if count >= TRANSACTION_BUCKET_SIZE:
+                    sequence, count = sequence + 1, 0
+                open_buckets[key] = (sequence, count + 1)
+                operations.append(self._push(transaction, events.get(transaction.id), *key, sequence))
+
+            logger.info('Saving transactions to buckets', count=len(operations))
+            try:
+                await TransactionBucketRepository._client[MONGO_DB_NAME][
+                    MONGO_TRANSACTION_BUCKET_COLLECTION].bulk_write(operations, ordered=False)
+                return
+            except BulkWriteError as e:
+                write_errors = e.details.get('writeErrors', [])
+                if any(error['code'] != DUPLICATE_KEY_ERROR for error in write_errors):
+                    raise
+                conflicts = [pending[error['index']] for error in write_errors]
+            saved = await self._saved(conflicts)
+            if saved:
+                logger.info('Transactions already saved', count=len(saved))
+            pending = [transaction for transaction in conflicts if transaction.id not in saved]
+
+    @timed
+    async def get_by_account_id(self, account_id: str) -> [TransactionModel]:
+        logger.info('Getting transactions by account_id', account_id=account_id)
+        transactions = []
+        async for bucket in (TransactionBucketRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_BUCKET_COLLECTION]
+                             .find({'account_id': account_id}).sort([('period', 1), ('sequence', 1)])):
+            transactions.extend(TransactionModel(**transaction) for transaction in bucket['transactions'])
+        return transactions
+
+    async def _open_buckets(self, keys: set[tuple[str, str]]) -> dict[tuple[str, str], tuple[int, int]]:
+        """(sequence, count) of the last bucket of every (account_id, period), read with one query"""
+        query = {'account_id': {'$in': list({account_id for account_id, _ in keys})},
+                 'period': {'$in': list({period for _, period in keys})}}
+        open_buckets = {}
+        async for bucket in (TransactionBucketRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_BUCKET_COLLECTION]
+                             .find(query, {'account_id': True, 'period': True, 'sequence': True, 'count': True})):
+            key = (bucket['account_id'], bucket['period'])
+            if key in keys and bucket['sequence'] >= open_buckets.get(key, (-1, 0))[0]:
+                open_buckets[key] = (bucket['sequence'], bucket['count'])
+        return open_buckets
+
+    async def _saved(self, transactions: [TransactionModel]) -> set[str]:
+        """Ids of the transactions stored in any bucket of their account"""
+        query = {'account_id': {'$in': list({transaction.account_id for transaction in transactions})},
+                 'transactions.id': {'$in': [transaction.id for transaction in transactions]}}
+        saved = set()
+        async for bucket in (TransactionBucketRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_BUCKET_COLLECTION]
+                             .find(query, {'account_id': True, 'transactions.id': True})):
+            saved.update((bucket['account_id'], transaction['id']) for transaction in bucket['transactions'])
+        return {transaction.id for transaction in transactions if (transaction.account_id, transaction.id) in saved}
+
+    @staticmethod
+    def _push(transaction: TransactionModel, event: Optional[int], account_id: str, period: str,
+              sequence: int) -> UpdateOne:
+        document = to_document(transaction, **({'event': event} if event else {}))
+        deposit = transaction.type == TransactionType.DEPOSIT
+        return UpdateOne({'_id': bucket_id(account_id, period, sequence), 'count': {'$lt': TRANSACTION_BUCKET_SIZE},
+                          'transactions.id': {'$ne': transaction.id}}, {
+            '$push': {'transactions': document},
+            '$inc': {'count': 1, 'deposits': document['amount'] if deposit else _ZERO,
+                     'withdrawals': _ZERO if deposit else document['amount']},
+            '$min': {'first_timestamp': transaction.timestamp},
+            '$max': {'last_timestamp': transaction.timestamp, 'last_event': event or 0},
+            '$setOnInsert': {'account_id': account_id, 'period': period, 'sequence': sequence},
+        }, upsert=True)
+
+
+def bucket_id(account_id: str, period: str, sequence: int) -> str:
+    return f'{account_id}:{period}:{sequence}'
+
+
+def bucket_document(account_id: str, period: str, sequence: int, transactions: list[dict]) -> dict:
+    """Bucket holding transactions, documents as stored in the document layout without their _id"""
+    amounts = {transaction_type: sum((to_money(transaction['amount']) for transaction in transactions
+                                      if transaction['type'] == transaction_type.value), Decimal(0))
+               for transaction_type in TransactionType}
+    return {'_id': bucket_id(account_id, period, sequence), 'account_id': account_id, 'period': period,
+            'sequence': sequence, 'count': len(transactions),
+            'deposits': to_decimal128(amounts[TransactionType.DEPOSIT]),
+            'withdrawals': to_decimal128(amounts[TransactionType.WITHDRAW]),
+            'first_timestamp': min(transaction['timestamp'] for transaction in transactions),
+            'last_timestamp': max(transaction['timestamp'] for transaction in transactions),
+            'last_event': max(transaction.get('event', 0) for transaction in transactions),
+            'transactions': transactions}
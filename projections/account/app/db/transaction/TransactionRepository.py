@@ -1,24 +1,53 @@
-import json
 from com_ivansoft_corebank_lib.models.Transaction import Transaction as TransactionModel
+from com_ivansoft_corebank_lib.documents import to_document
+from com_ivansoft_corebank_lib.log import Lazy
+from com_ivansoft_corebank_lib.metrics import timed
 from structlog import get_logger
 from motor.motor_asyncio import AsyncIOMotorClient
-from app.db.MongoBase import MongoBase
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.db.MongoBase import LazyClient, DUPLICATE_KEY_ERROR
 from app.config.settings import MONGO_DB_NAME, MONGO_TRANSACTION_COLLECTION
 
-logger = get_logger().bind(logger='TransactionRepository')
+logger = get_logger().bind(logger='TransactionRepository', sampled=True)
 
 
 class TransactionRepository:
-    _client: AsyncIOMotorClient = MongoBase.get_client()
+    _client: AsyncIOMotorClient = LazyClient()
 
-    async def save(self, transaction: TransactionModel):
-        to_save = json.loads(transaction.model_dump_json())
-        logger.info('Saving transaction', balance=transaction)
-        await TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION].insert_one(to_save)
+    # transactions are stored with the transaction id as _id, so saving an already stored transaction is a no-op. The
+    # event of a transaction is its number among the events of the account, the balance checkpoints are numbered by it
+    @timed
+    async def save(self, transaction: TransactionModel, event: int = None):
+        to_save = self._to_document(transaction, event)
+        logger.info('Saving transaction', transaction=Lazy(transaction.model_dump))
+        try:
+            await TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION].insert_one(to_save)
+        except DuplicateKeyError:
+            logger.info('Transaction already saved', transaction_id=transaction.id)
 
+    @timed
+    async def save_many(self, transactions: [TransactionModel], events: dict[str, int] = None):
+        if not transactions:
+            return
+        events = events or {}
+        to_save = [self._to_document(transaction, events.get(transaction.id)) for transaction in transactions]
+        logger.info('Saving transactions', count=len(to_save))
+        try:
+            await TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION].insert_many(
+                to_save, ordered=False)
+        except BulkWriteError as e:
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details.get('writeErrors', [])):
+                raise
+            logger.info('Transactions already saved', count=len(e.details['writeErrors']))
+
+    @timed
     async def get_by_account_id(self, account_id: str) -> [TransactionModel]:
         logger.info('Getting transactions by account_id', account_id=account_id)
         transactions = []
         async for transaction in TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION].find({"account_id": account_id}):
             transactions.append(TransactionModel(**transaction))
         return transactions
+
+    @staticmethod
+    def _to_document(transaction: TransactionModel, event: int = None) -> dict:
+        return to_document(transaction, _id=transaction.id, **({'event': event} if event else {}))
@@ -0,0 +1,47 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+from com_ivansoft_corebank_lib.models.User import User as UserModel
+from app.metrics import USER_CACHE_LOOKUPS
+
+
+class UserCache:
+    """LRU cache of the user of every account holding at most max_size accounts. Users are kept until they are
+    evicted, accounts without a user are cached as None for missing_ttl seconds so a user created later is found"""
+
+    def __init__(self, max_size: int, missing_ttl: float):
+        self._max_size = max_size
+        self._missing_ttl = missing_ttl
+        # account_id -> (user, monotonic time the entry expires, None for users)
+        self._users: OrderedDict[str, tuple[Optional[UserModel], Optional[float]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, account_id: str) -> tuple[bool, Optional[UserModel]]:
+        """(True, user) when the account is cached, user is None for accounts without a user"""
+        entry = self._users.get(account_id)
+        if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+            self._users.move_to_end(account_id)
+            self.hits += 1
+            USER_CACHE_LOOKUPS.labels('hit').inc()
+            return True, entry[0]
+        self.misses += 1
+        USER_CACHE_LOOKUPS.labels('miss').inc()
+        return False, None
+
+    def put(self, account_id: str, user: Optional[UserModel]):
+        self._users[account_id] = (user, None if user is not None else time.monotonic() + self._missing_ttl)
+        self._users.move_to_end(account_id)
+        if len(self._users) > self._max_size:
+            self._users.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {'size': len(self._users), 'max_size': self._max_size, 'hits': self.hits, 'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        self._users.clear()
+
+    def __len__(self):
+        return len(self._users)
@@ -1,8 +1,48 @@
-
+from typing import Optional
 from com_ivansoft_corebank_lib.models.User import User as UserModel
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.db.MongoBase import LazyClient
+from app.db.BatchLoader import BatchLoader
+from app.db.user.UserCache import UserCache
+from app.config.settings import (MONGO_DB_NAME, MONGO_USER_COLLECTION, USER_CACHE_SIZE, USER_CACHE_MISSING_TTL_SECONDS,
+                                 USER_BATCH_SIZE, USER_PLACEHOLDER_ENABLED)
+
+logger = get_logger().bind(logger='UserRepository', sampled=True)
+
+# user of the accounts without a user document when USER_PLACEHOLDER_ENABLED
+PLACEHOLDER_USER = UserModel(user_id=1, username='test_user')
 
 
 class UserRepository:
-    def get_by_account_id(self, account_id: str):
-        # for hypothetical purposes, we are returning a user with user_id=1 and username='test_user'
-        return UserModel(user_id=1, username='test_user')
+    """One document per user with the ids of its accounts in account_ids. Users are read through a process wide LRU
+    cache, the lookups that miss it during the same event loop iteration are read with one $in query"""
+    _client: AsyncIOMotorClient = LazyClient()
+    cache = UserCache(USER_CACHE_SIZE, USER_CACHE_MISSING_TTL_SECONDS)
+    _loader = BatchLoader(lambda account_ids: UserRepository.find_many(account_ids), USER_BATCH_SIZE)
+
+    async def get_by_account_id(self, account_id: str) -> Optional[UserModel]:
+        hit, user = UserRepository.cache.get(account_id)
+        if not hit:
+            user = await UserRepository._loader.load(account_id)
+        if user is None and USER_PLACEHOLDER_ENABLED:
+            return PLACEHOLDER_USER
+        return user
+
+    @staticmethod
+    @timed
+    async def find_many(account_ids: [str]) -> dict[str, UserModel]:
+        """Reads the users of the accounts from the database and caches them, accounts without a user included"""
+        logger.info('Loading users', accounts=len(account_ids))
+        requested = set(account_ids)
+        users = {}
+        cursor = UserRepository._client[MONGO_DB_NAME][MONGO_USER_COLLECTION].find(
+            {'account_ids': {'$in': account_ids}}, {'_id': False, 'user_id': True, 'username': True, 'account_ids': True})
+        async for document in cursor:
+            user = UserModel(user_id=document['user_id'], username=document['username'])
+            for account_id in requested.intersection(document['account_ids']):
+                users[account_id] = user
+        for account_id in account_ids:
+            UserRepository.cache.put(account_id, users.get(account_id))
+        return users
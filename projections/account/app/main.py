@@ -1,10 +1,69 @@
+import asyncio
 import json
-from fastapi import FastAPI, Response
-from app.api.eventsource.v1.subscribers import router as subscriber_handlers
+import os
+from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from com_ivansoft_corebank_lib.log import configure_logging, logging_settings, set_level, set_sample_rate
+from com_ivansoft_corebank_lib.metrics import MetricsMiddleware, latest
+from com_ivansoft_corebank_lib.mongo_indexes import bootstrap_indexes
+from com_ivansoft_corebank_lib.profiling import ProfileStore, ProfilingMiddleware
+from structlog import get_logger
+from app.api.eventsource.v1.subscribers import router as subscriber_handlers, limiter, record_limiter
+from app.api.admin.v1.dead_letters import router as dead_letter_handlers
+from app.db.MongoBase import MongoBase
+from app.services.AccountService import AccountService
+from app.services.WorkerPool import WorkerPool
+from app import worker
+from app.db.indexes import INDEXES, QUERY_PATTERNS, SUPERSEDED_INDEXES
+from app.config.settings import BULK_SUBSCRIBE_ENABLED, BULK_SUBSCRIBE_MAX_MESSAGES, BULK_SUBSCRIBE_MAX_AWAIT_MS
+from app.config.settings import PROFILING_ENABLED, PROFILING_HEADER, PROFILING_SAMPLE_RATE, PROFILING_DIR
+from app.config.settings import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE
+from app.config.settings import LIMITER_ENABLED, MONGO_DB_NAME
+from app.config.settings import PROJECTION_WORKERS, PROJECTION_WORKER_VNODES, PROJECTION_WORKER_RESTART
 
-app = FastAPI()
+configure_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE)
+logger = get_logger().bind(logger='main')
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the client and its connection pool live as long as the app, the repositories use it through MongoBase
+    client = MongoBase.get_client()
+    # same for the http client of the balance updates published to the sidecar
+    await app.state.account_service.balance_publisher.start()
+    # indexes are built in the background, the service starts receiving events meanwhile
+    indexes_task = asyncio.create_task(bootstrap_indexes(client[MONGO_DB_NAME], INDEXES, QUERY_PATTERNS,
+                                                         SUPERSEDED_INDEXES))
+    # the deliveries are limited in this process, the worker processes don't record the limiter gauges
+    record_limiter()
+    if PROJECTION_WORKERS > 0:
+        if not os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            logger.warning('PROMETHEUS_MULTIPROC_DIR is not set, /metrics only has the metrics of the front process')
+        app.state.worker_pool = WorkerPool(worker.run, PROJECTION_WORKERS, PROJECTION_WORKER_VNODES,
+                                           PROJECTION_WORKER_RESTART)
+        await app.state.worker_pool.start()
+    yield
+    if PROJECTION_WORKERS > 0:
+        await app.state.worker_pool.close()
+    indexes_task.cancel()
+    await app.state.account_service.balance_publisher.close()
+    MongoBase.close()
+
+
+app = FastAPI(lifespan=lifespan)
+# latency of every request per route, scraped with the rest of the metrics at /metrics
+app.add_middleware(MetricsMiddleware)
+# the services hold no request state, every request uses the same one
+app.state.account_service = AccountService()
+# on-demand profiling, the middleware is only added when enabled so it costs nothing otherwise
+profiles = ProfileStore(PROFILING_DIR) if PROFILING_ENABLED else None
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, store=profiles, header=PROFILING_HEADER, sample_rate=PROFILING_SAMPLE_RATE)
 # Include routers
 app.include_router(subscriber_handlers, prefix="/mybank/subscriber/v1")
+# operations on the projections, e.g. replaying the events parked in the dead letter collection
+app.include_router(dead_letter_handlers, prefix="/mybank/admin/v1")
 
 # Register Dapr pub/sub subscriptions for this projection app (CQRS pattern)
 # this endpoint is called by Dapr runtime to get the list of topics to subscribe (programmatic subscription)
@@ -16,18 +75,94 @@ app.include_router(subscriber_handlers, prefix="/mybank/subscriber/v1")
 # are related maintaining coherence between them. Even you can separate them in different microservices if you need to
 # scale them independently this decision depends on the business requirements and the complexity of the domain. In this
 # example, we are handling two projections in the same microservice.
+#
+# With bulk subscribe enabled the sidecar batches up to BULK_SUBSCRIBE_MAX_MESSAGES events per request to the bulk
+# route, so the projections are written with one bulk operation per collection instead of one per event.
 @app.get('/dapr/subscribe')
 def subscribe():
-    subscriptions = [
-        {
-            'pubsubname': 'eventsource',
-            'topic': 'transactions',
-            'route': '/mybank/subscriber/v1/account_projections/handler'
-        }]
+    if BULK_SUBSCRIBE_ENABLED:
+        subscriptions = [
+            {
+                'pubsubname': 'eventsource',
+                'topic': 'transactions',
+                'route': '/mybank/subscriber/v1/account_projections/bulk_handler',
+                'bulkSubscribe': {
+                    'enabled': True,
+                    'maxMessagesCount': BULK_SUBSCRIBE_MAX_MESSAGES,
+                    'maxAwaitDurationMs': BULK_SUBSCRIBE_MAX_AWAIT_MS
+                }
+            }]
+    else:
+        subscriptions = [
+            {
+                'pubsubname': 'eventsource',
+                'topic': 'transactions',
+                'route': '/mybank/subscriber/v1/account_projections/handler'
+            }]
     print(f'Subscribing... : {subscriptions}')
     return Response(content=json.dumps(subscriptions), media_type='application/json')
 
 
+# Prometheus metrics: request latency per route, MongoDB latency per repository method, projection lag and
+# events processed, duplicated and failed per transaction type
+@app.get('/metrics', include_in_schema=False)
+def metrics():
+    content, media_type = latest()
+    return Response(content=content, media_type=media_type)
+
+
+# connections of the MongoDB pool per server: open, checked out, idle and waiting ones and the check out wait times
+@app.get('/debug/pool', include_in_schema=False)
+def pool():
+    return {'options': MongoBase.options(), 'servers': MongoBase.pool_stats.snapshot()}
+
+
+# adaptive concurrency limit of the deliveries: the limit, the deliveries in flight and the ones shed over the limit
+@app.get('/debug/limiter', include_in_schema=False)
+def get_limiter():
+    return {'enabled': LIMITER_ENABLED, **limiter.stats()}
+
+
+# worker processes of the multi-process mode, their pid and the requests waiting for them
+@app.get('/debug/workers', include_in_schema=False)
+def get_workers():
+    if PROJECTION_WORKERS == 0:
+        return {'workers': {}}
+    return app.state.worker_pool.stats()
+
+
+# log level and sample rate of this process, e.g. PUT /debug/logging?level=debug&sample_rate=0.1
+@app.get('/debug/logging', include_in_schema=False)
+def get_logging():
+    return logging_settings()
+
+
+@app.put('/debug/logging', include_in_schema=False)
+def update_logging(level: Optional[str] = None, sample_rate: Optional[float] = None):
+    try:
+        if level is not None:
+            set_level(level)
+        if sample_rate is not None:
+            set_sample_rate(sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return logging_settings()
+
+
+# summaries of the last profiled requests, the pstats files are in PROFILING_DIR
+if PROFILING_ENABLED:
+    @app.get('/debug/profiles', include_in_schema=False)
+    def list_profiles():
+        return profiles.recent()
+
+    @app.get('/debug/profiles/{profile_id}', include_in_schema=False)
+    def get_profile(profile_id: str):
+        summary = profiles.get(profile_id)
+        if summary is None:
+            raise HTTPException(status_code=404, detail='Profile not found')
+        return summary
+
+
 # ping route
 @app.get("/")
 async def ping():
@@ -0,0 +1,40 @@
+"""Projection metrics, exposed at /metrics with the request and MongoDB metrics of the common library"""
+from datetime import datetime, timezone
+from prometheus_client import Counter, Gauge, Histogram
+from com_ivansoft_corebank_lib.models.Transaction import Transaction as TransactionModel
+from com_ivansoft_corebank_lib.timestamp import naive_utc
+
+PROJECTION_LAG_SECONDS = Histogram(
+    'projection_lag_seconds', 'Time from the transaction timestamp until the event is applied to the projections',
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+EVENTS_PROCESSED = Counter('projection_events_processed_total', 'Events applied to the projections', ['type'])
+EVENTS_DUPLICATED = Counter('projection_events_duplicated_total', 'Redelivered events already applied', ['type'])
+EVENTS_FAILED = Counter('projection_events_failed_total', 'Events that could not be applied', ['type'])
+EVENTS_DEAD_LETTERED = Counter('projection_events_dead_lettered_total', 'Events parked in the dead letter collection',
+                               ['error_type'])
+EVENT_RETRIES = Counter('projection_event_retries_total', 'Retries of events that failed with a transient error')
+# with worker processes (PROMETHEUS_MULTIPROC_DIR set) the gauges of the live processes are added up, only the app
+# process records these
+REQUESTS_IN_FLIGHT = Gauge('projection_requests_in_flight', 'Deliveries being handled', multiprocess_mode='livesum')
+CONCURRENCY_LIMIT = Gauge('projection_concurrency_limit', 'Adaptive limit of the deliveries handled at once',
+                          multiprocess_mode='livesum')
+REQUESTS_SHED = Counter('projection_requests_shed_total', 'Deliveries rejected over the concurrency limit', ['route'])
+USER_CACHE_LOOKUPS = Counter('user_cache_lookups_total', 'Lookups of the user of an account in the cache', ['result'])
+
+
+def record_processed(transactions: [TransactionModel]):
+    # both sides in UTC like the stored timestamps, the ones without timezone are UTC
+    now = naive_utc(datetime.now(timezone.utc))
+    for transaction in transactions:
+        EVENTS_PROCESSED.labels(transaction.type.value).inc()
+        PROJECTION_LAG_SECONDS.observe(max((now - naive_utc(transaction.timestamp)).total_seconds(), 0))
+
+
+def record_duplicated(transactions: [TransactionModel]):
+    for transaction in transactions:
+        EVENTS_DUPLICATED.labels(transaction.type.value).inc()
+
+
+def record_failed(transactions: [TransactionModel]):
+    for transaction in transactions:
+        EVENTS_FAILED.labels(transaction.type.value).inc()
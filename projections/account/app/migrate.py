@@ -0,0 +1,75 @@
+"""Converts the documents written by previous versions to the current storage types: amounts and balances stored as
+doubles or strings become Decimal128 and timestamps stored as strings become BSON dates, so MongoDB can sum, compare
+and sort them. Every update matches the old value, a document changed meanwhile (e.g. an $inc of the current balance)
+is left to the next run. Running it again only converts what is left"""
+import argparse
+import asyncio
+from typing import Any, Callable
+from pymongo import UpdateOne
+from structlog import get_logger
+from com_ivansoft_corebank_lib.log import configure_logging
+from com_ivansoft_corebank_lib.documents import to_decimal128
+from com_ivansoft_corebank_lib.models.Money import to_money
+from com_ivansoft_corebank_lib.timestamp import parse_timestamp
+from app.db.MongoBase import MongoBase
+from app.config.settings import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE
+from app.config.settings import (MONGO_DB_NAME, MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION,
+                                 MONGO_TRANSACTION_COLLECTION)
+
+logger = get_logger().bind(logger='migrate')
+
+
+def _to_decimal128(value: Any):
+    return to_decimal128(to_money(value))
+
+
+# (collection, field, BSON types to convert, conversion)
+MIGRATIONS: list[tuple[str, str, list[str], Callable[[Any], Any]]] = [
+    (MONGO_TRANSACTION_COLLECTION, 'amount', ['double', 'int', 'long', 'string'], _to_decimal128),
+    (MONGO_TRANSACTION_COLLECTION, 'timestamp', ['string'], parse_timestamp),
+    (MONGO_BALANCE_COLLECTION, 'balance', ['double', 'int', 'long', 'string'], _to_decimal128),
+    (MONGO_CURRENT_BALANCE_COLLECTION, 'balance', ['double', 'int', 'long', 'string'], _to_decimal128),
+]
+
+
+async def migrate_field(database, collection: str, field: str, types: list[str], convert: Callable[[Any], Any],
+                        batch_size: int) -> int:
+    """Converts field in the documents of collection where it has one of types, returns the converted documents"""
+    operations = []
+    migrated = 0
+    async for document in database[collection].find({field: {'$type': types}}, {field: True}):
+        try:
+            value = convert(document[field])
+        except (ValueError, ArithmeticError) as e:
+            logger.error('Value not converted', collection=collection, field=field, id=str(document['_id']),
+                         error=str(e))
+            continue
+        operations.append(UpdateOne({'_id': document['_id'], field: document[field]}, {'$set': {field: value}}))
+        if len(operations) == batch_size:
+            migrated += (await database[collection].bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        migrated += (await database[collection].bulk_write(operations, ordered=False)).modified_count
+    logger.info('Field migrated', collection=collection, field=field, documents=migrated)
+    return migrated
+
+
+async def migrate(batch_size: int) -> int:
+    database = MongoBase.get_client()[MONGO_DB_NAME]
+    migrated = 0
+    for collection, field, types, convert in MIGRATIONS:
+        migrated += await migrate_field(database, collection, field, types, convert, batch_size)
+    return migrated
+
+
+def main():
+    configure_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE)
+    parser = argparse.ArgumentParser(description='Convert the projections documents to the current storage types')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents updated per bulk write')
+    args = parser.parse_args()
+
+    asyncio.run(migrate(args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
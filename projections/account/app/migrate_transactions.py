@@ -0,0 +1,121 @@
+"""Copies the stored transaction history between the storage layouts: to buckets groups the transactions of every
+account and TRANSACTION_BUCKET_PERIOD in buckets of TRANSACTION_BUCKET_SIZE, oldest first, to documents stores every
+transaction of the buckets as its own document again. The source collection is left as it is, drop it once the
+services run with the new TRANSACTION_LAYOUT.
+
+Run it while the projections are stopped, or still writing the old layout, before switching both services. Bucket ids
+follow from the order of the transactions and documents are stored by transaction id, so running it again rewrites the
+same documents"""
+import argparse
+import asyncio
+import sys
+from pymongo import InsertOne, ReplaceOne
+from pymongo.errors import BulkWriteError
+from structlog import get_logger
+from com_ivansoft_corebank_lib.log import configure_logging
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from app.db.MongoBase import MongoBase, DUPLICATE_KEY_ERROR
+from app.db.transaction.TransactionBucketRepository import bucket_document, bucket_id
+from app.config.settings import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE
+from app.config.settings import (MONGO_DB_NAME, MONGO_TRANSACTION_COLLECTION, MONGO_TRANSACTION_BUCKET_COLLECTION,
+                                 TRANSACTION_BUCKET_PERIOD, TRANSACTION_BUCKET_SIZE)
+
+logger = get_logger().bind(logger='migrate_transactions')
+
+
+async def to_buckets(database, batch_size: int, bucket_size: int = TRANSACTION_BUCKET_SIZE,
+                     granularity: RollupGranularity = RollupGranularity(TRANSACTION_BUCKET_PERIOD)) -> int:
+    """Writes the buckets of the transactions collection, batch_size buckets per bulk write. Returns the buckets.
+    Raises ValueError before writing any bucket when there are timestamps stored as strings, MongoDB sorts them before
+    every date so the buckets would be numbered out of order"""
+    legacy = await database[MONGO_TRANSACTION_COLLECTION].find_one({'timestamp': {'$type': 'string'}}, {'id': True})
+    if legacy:
+        raise ValueError(f"Timestamp of transaction {legacy['id']} stored as a string, run migrate first")
+
+    operations = []
+    written = 0
+    key = None
+    sequence = 0
+    bucket = []
+
+    async def flush():
+        nonlocal operations, written
+        if operations:
+            await database[MONGO_TRANSACTION_BUCKET_COLLECTION].bulk_write(operations, ordered=False)
+            written += len(operations)
+            operations = []
+
+    def close_bucket():
+        if bucket:
+            operations.append(ReplaceOne({'_id': bucket_id(*key, sequence)},
+                                         bucket_document(*key, sequence, bucket), upsert=True))
+
+    # read in the order of the account_id_timestamp_id index, one account after the other
+    async for transaction in (database[MONGO_TRANSACTION_COLLECTION].find({}, {'_id': False})
+                              .sort([('account_id', 1), ('timestamp', 1), ('id', 1)])):
+        transaction_key = (transaction['account_id'], granularity.period(transaction['timestamp']))
+        if transaction_key != key or len(bucket) == bucket_size:
+            close_bucket()
+            sequence = sequence + 1 if transaction_key == key else 0
+            key = transaction_key
+            bucket = []
+            if len(operations) >= batch_size:
+                await flush()
+        bucket.append(transaction)
+    close_bucket()
+    await flush()
+    logger.info('Transactions migrated to buckets', buckets=written)
+    return written
+
+
+async def to_documents(database, batch_size: int) -> int:
+    """Stores the transactions of the buckets as documents, batch_size transactions per bulk write. Returns the
+    transactions written, transactions already stored are skipped"""
+    operations = []
+    written = 0
+
+    async def flush():
+        nonlocal operations, written
+        if not operations:
+            return
+        try:
+            result = await database[MONGO_TRANSACTION_COLLECTION].bulk_write(operations, ordered=False)
+            written += result.inserted_count
+        except BulkWriteError as e:
+            if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details.get('writeErrors', [])):
+                raise
+            written += e.details['nInserted']
+        operations = []
+
+    async for bucket in (database[MONGO_TRANSACTION_BUCKET_COLLECTION].find({})
+                         .sort([('account_id', 1), ('period', 1), ('sequence', 1)])):
+        for transaction in bucket['transactions']:
+            operations.append(InsertOne({**transaction, '_id': transaction['id']}))
+            if len(operations) == batch_size:
+                await flush()
+    await flush()
+    logger.info('Transactions migrated to documents', transactions=written)
+    return written
+
+
+async def migrate(layout: str, batch_size: int) -> int:
+    database = MongoBase.get_client()[MONGO_DB_NAME]
+    return await (to_buckets if layout == 'bucket' else to_documents)(database, batch_size)
+
+
+def main():
+    configure_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE)
+    parser = argparse.ArgumentParser(description='Copy the transaction history to another storage layout')
+    parser.add_argument('layout', choices=['bucket', 'document'], help='layout to copy the history to')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents written per bulk write')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(migrate(args.layout, args.batch_size))
+    except ValueError as e:
+        logger.error('Transactions not migrated', error=str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Offline rebuild of the projections from an archive of transaction events, one event per line either as a
+Transaction or as the CloudEvent Dapr delivered. Events are applied with AccountService.apply_transactions in batches
+of --batch-size events, so the balances and the history are written with one bulk operation per collection and batch.
+
+After every batch the byte offset of the archive is saved in the checkpoint file, an interrupted replay resumes from
+there. Events of a batch that was written but not checkpointed are skipped by the processed events ledger"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from structlog import get_logger
+from com_ivansoft_corebank_lib.log import configure_logging
+from app.api.eventsource.v1.subscribers import decode_transaction
+from app.db.MongoBase import MongoBase
+from app.services.AccountService import AccountService
+from app.services.BalancePublisher import BalancePublisher
+from app.config.settings import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE
+from app.config.settings import (MONGO_DB_NAME, MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION,
+                                 MONGO_TRANSACTION_COLLECTION, MONGO_PROCESSED_EVENT_COLLECTION, MONGO_ROLLUP_COLLECTION,
+                                 MONGO_TRANSACTION_BUCKET_COLLECTION, MONGO_BALANCE_CHECKPOINT_COLLECTION,
+                                 REPLAY_BATCH_SIZE)
+
+logger = get_logger().bind(logger='replay')
+
+
+def read_checkpoint(path: str, archive: str) -> dict:
+    if not os.path.exists(path):
+        return {'archive': archive, 'offset': 0, 'events': 0}
+    with open(path) as file:
+        checkpoint = json.load(file)
+    if checkpoint['archive'] != archive:
+        raise ValueError(f'Checkpoint {path} belongs to archive {checkpoint["archive"]}')
+    return checkpoint
+
+
+def write_checkpoint(path: str, checkpoint: dict):
+    # written to a temporary file and renamed, so an interruption never leaves a partial checkpoint
+    with open(f'{path}.tmp', 'w') as file:
+        json.dump(checkpoint, file)
+    os.replace(f'{path}.tmp', path)
+
+
+def read_batches(archive: str, offset: int, batch_size: int):
+    """Yields (transactions, invalid lines, offset after the batch) starting at offset"""
+    with open(archive, 'rb') as file:
+        file.seek(offset)
+        transactions = []
+        invalid = 0
+        for line in iter(file.readline, b''):
+            if not line.strip():
+                continue
+            try:
+                transactions.append(decode_transaction(json.loads(line)))
+            except Exception as e:
+                logger.error('Invalid event, skipping it', offset=file.tell() - len(line), error=str(e))
+                invalid += 1
+            if len(transactions) == batch_size:
+                yield transactions, invalid, file.tell()
+                transactions = []
+                invalid = 0
+        if transactions or invalid:
+            yield transactions, invalid, file.tell()
+
+
+async def reset_projections():
+    database = MongoBase.get_client()[MONGO_DB_NAME]
+    for collection in (MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION, MONGO_TRANSACTION_COLLECTION,
+                       MONGO_TRANSACTION_BUCKET_COLLECTION, MONGO_PROCESSED_EVENT_COLLECTION, MONGO_ROLLUP_COLLECTION,
+                       MONGO_BALANCE_CHECKPOINT_COLLECTION):
+        logger.info('Dropping collection', collection=collection)
+        await database.drop_collection(collection)
+
+
+async def replay(archive: str, checkpoint_path: str, batch_size: int, reset: bool = False) -> int:
+    """Applies the archive events after the checkpoint, returns the number of events that couldn't be applied"""
+    archive = os.path.abspath(archive)
+    if reset:
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        await reset_projections()
+    checkpoint = read_checkpoint(checkpoint_path, archive)
+    logger.info('Replaying events', archive=archive, offset=checkpoint['offset'], events=checkpoint['events'])
+
+    account_service = AccountService()
+    # the queries api caches balances, restart it after a rebuild instead of publishing every account
+    account_service.balance_publisher = BalancePublisher(enabled=False)
+
+    not_applied = 0
+    for transactions, invalid, offset in read_batches(archive, checkpoint['offset'], batch_size):
+        failed_accounts = await account_service.apply_transactions(transactions) if transactions else {}
+        if failed_accounts:
+            logger.error('Events of accounts not applied', accounts=sorted(failed_accounts))
+        not_applied += invalid + sum(1 for transaction in transactions if transaction.account_id in failed_accounts)
+
+        checkpoint['offset'] = offset
+        checkpoint['events'] += len(transactions)
+        write_checkpoint(checkpoint_path, checkpoint)
+        logger.info('Batch applied', events=checkpoint['events'], offset=offset)
+
+    logger.info('Replay finished', events=checkpoint['events'], not_applied=not_applied)
+    return not_applied
+
+
+def main():
+    configure_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE)
+    parser = argparse.ArgumentParser(description='Rebuild the account projections from an archive of events')
+    parser.add_argument('archive', help='JSONL file, one Transaction or CloudEvent per line')
+    parser.add_argument('--checkpoint', help='checkpoint file, defaults to <archive>.checkpoint')
+    parser.add_argument('--batch-size', type=int, default=REPLAY_BATCH_SIZE, help='events applied per batch')
+    parser.add_argument('--reset', action='store_true',
+                        help='drop the projections and the checkpoint before replaying')
+    args = parser.parse_args()
+
+    not_applied = asyncio.run(replay(args.archive, args.checkpoint or f'{args.archive}.checkpoint',
+                                     args.batch_size, args.reset))
+    sys.exit(1 if not_applied else 0)
+
+
+if __name__ == "__main__":
+    main()
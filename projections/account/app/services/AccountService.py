@@ -1,59 +1,272 @@
-from datetime import datetime
+import asyncio
 from com_ivansoft_corebank_lib.models.Transaction import TransactionType
-from app.db.balance.BalanceRepository import BalanceRepository
 from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.models.User import User as UserModel
+from com_ivansoft_corebank_lib.log import Lazy
+from com_ivansoft_corebank_lib.timestamp import naive_utc
+from app.db.balance.BalanceRepository import BalanceRepository, CurrentBalance
 from app.db.user.UserRepository import UserRepository
 from app.db.transaction.TransactionRepository import TransactionRepository, TransactionModel
+from app.db.transaction.TransactionBucketRepository import TransactionBucketRepository
+from app.db.processed_event.ProcessedEventRepository import ProcessedEventRepository
+from app.db.rollup.RollupRepository import RollupRepository
+from app.db.dead_letter.DeadLetterRepository import DeadLetterRepository
+from app.db.checkpoint.CheckpointRepository import CheckpointRepository
+from app.services.BalancePublisher import BalancePublisher
+from app.metrics import EVENTS_DEAD_LETTERED, record_duplicated, record_failed, record_processed
 from decimal import Decimal
+from typing import Any, Optional
+from app.config.settings import (BALANCE_SNAPSHOTS_ENABLED, ROLLUPS_ENABLED, BALANCE_CHECKPOINTS_ENABLED,
+                                 BALANCE_CHECKPOINT_INTERVAL, TRANSACTION_LAYOUT)
 from structlog import get_logger
 
-logger = get_logger().bind(logger='BalanceService')
+logger = get_logger().bind(logger='BalanceService', sampled=True)
 
 
 class AccountService:
     def __init__(self):
         self.balance_repository = BalanceRepository()
         self.user_repository = UserRepository()
-        self.history_transaction_repository = TransactionRepository()
+        self.history_transaction_repository = (TransactionBucketRepository() if TRANSACTION_LAYOUT == 'bucket'
+                                               else TransactionRepository())
+        self.processed_event_repository = ProcessedEventRepository()
+        self.rollup_repository = RollupRepository()
+        self.balance_publisher = BalancePublisher()
+        self.dead_letter_repository = DeadLetterRepository()
+        self.checkpoint_repository = CheckpointRepository()
 
-    async def save_transaction(self, transaction):
-        await self.history_transaction_repository.save(transaction)
+    async def process_transaction(self, transaction: TransactionModel) -> bool:
+        """Apply the transaction to the projections once, redeliveries of an already processed transaction are
+        skipped. Returns False when the transaction was a duplicate"""
+        if await self.processed_event_repository.get_processed([transaction.id]):
+            record_duplicated([transaction])
+            return False
 
-    async def update_balance(self, account_id: str, amount: Decimal, transaction_type: TransactionType):
-        previous_balance = await self.balance_repository.get(account_id)
-        user = self._get_user_by_account_id(account_id)
+        try:
+            current = await self.update_balance(transaction)
+            # saved after the balance with its event of the account, saving to history is idempotent and a redelivery
+            # finds the transaction applied with the same event
+            await self.save_transaction(transaction, current.transaction_events.get(transaction.id))
+        except Exception:
+            record_failed([transaction])
+            raise
 
-        logger.info('previous_balance', previous_balance=previous_balance)
+        already_applied = transaction.id in current.already_applied
+        if already_applied:
+            record_duplicated([transaction])
+        else:
+            record_processed([transaction])
+            await self.update_rollups([transaction], {transaction.account_id: current.balance.balance})
+            await self.update_checkpoints([transaction], {transaction.account_id: current})
+        # recorded last, a redelivery after a failure to record it is skipped by the balance update
+        await self.processed_event_repository.mark_processed([(transaction.id, transaction.account_id)])
+        return not already_applied
+
+    async def save_transaction(self, transaction: TransactionModel, event: int = None):
+        await self.history_transaction_repository.save(transaction, event)
+
+    async def update_balance(self, transaction: TransactionModel) -> CurrentBalance:
+        """Returns the balance after the transaction, it is only incremented when the transaction wasn't applied"""
+        account_id = transaction.account_id
+        user = self._check_user(account_id, await self.user_repository.get_by_account_id(account_id))
+
+        current = await self.balance_repository.increment(
+            account_id, self._signed_amount(transaction.amount, transaction.type), user, transaction.id,
+            transaction.timestamp)
+        if current.already_applied:
+            return current
+        logger.info('New balance', balance=Lazy(current.balance.model_dump))
+
+        await self.save_snapshots([current.balance])
+        await self.balance_publisher.publish_updated([account_id])
+        return current
+
+    async def save_snapshots(self, balances: [BalanceModel]):
+        """Keep a snapshot of the balances. Like the rollups, the balances are already applied when the snapshots are
+        saved, so an error is logged instead of failing the event"""
+        if not BALANCE_SNAPSHOTS_ENABLED:
+            return
+        try:
+            await self.balance_repository.save_many(balances)
+        except Exception as e:
+            logger.error('Error saving balance snapshots', balances=len(balances), error=str(e))
+
+    async def update_rollups(self, transactions: [TransactionModel], balances: dict[str, Decimal]):
+        """Add the transactions to the daily and monthly rollups of their accounts, balances has the balance of
+        every account after the transactions. The balances are already applied when the rollups are updated, so an
+        error is logged instead of failing the event, whose redelivery would apply the balance twice. Rollups can be
+        rebuilt with the replay command"""
+        if not ROLLUPS_ENABLED:
+            return
+        try:
+            await self.rollup_repository.increment_many(self._rollups(transactions, balances))
+        except Exception as e:
+            logger.error('Error updating rollups', transactions=len(transactions), error=str(e))
+
+    async def update_checkpoints(self, transactions: [TransactionModel], balances: dict[str, CurrentBalance]):
+        """Save a checkpoint of the balance at every transaction that completes BALANCE_CHECKPOINT_INTERVAL events
+        of its account, balances has the current balance of every account after the transactions. Like the rollups,
+        errors are logged instead of failing the already applied event, a missing checkpoint only makes the point in
+        time queries of that interval read the transactions since the previous one"""
+        if not BALANCE_CHECKPOINTS_ENABLED:
+            return
+        try:
+            checkpoints = self._checkpoints(self._group_by_account(transactions), balances)
+            await self.checkpoint_repository.save_many(checkpoints)
+        except Exception as e:
+            logger.error('Error saving balance checkpoints', transactions=len(transactions), error=str(e))
+
+    async def apply_transactions(self, transactions: [TransactionModel]) -> dict[str, Exception]:
+        """Apply a batch of transactions with one read and one write per projection, transactions of the same
+        account are applied in the order they were received and already processed transactions are skipped.
+        Returns the error of every account that could not be applied"""
+        transactions = self._unique_by_id(transactions)
+        processed = await self.processed_event_repository.get_processed(
+            [transaction.id for transaction in transactions])
+        record_duplicated([transaction for transaction in transactions if transaction.id in processed])
+        transactions = [transaction for transaction in transactions if transaction.id not in processed]
+        if not transactions:
+            return {}
+
+        try:
+            failed_accounts, already_applied = await self._apply_new_transactions(transactions)
+        except Exception:
+            record_failed(transactions)
+            raise
+        record_failed([transaction for transaction in transactions if transaction.account_id in failed_accounts])
+        record_duplicated([transaction for transaction in transactions if transaction.id in already_applied])
+        record_processed([transaction for transaction in transactions
+                          if transaction.account_id not in failed_accounts and transaction.id not in already_applied])
+        # recorded last, a redelivery after a failure to record them is skipped by the balance update
+        await self.processed_event_repository.mark_processed(
+            [(transaction.id, transaction.account_id) for transaction in transactions
+             if transaction.account_id not in failed_accounts])
+        return failed_accounts
+
+    async def _apply_new_transactions(self, transactions: [TransactionModel]) -> (dict[str, Exception], set[str]):
+        """Returns the failed accounts and the ids of the transactions the balances already had applied"""
+        transactions_by_account = self._group_by_account(transactions)
+
+        # looked up concurrently, so the users missing from the cache are read with one query
+        users = await asyncio.gather(*(self.user_repository.get_by_account_id(account_id)
+                                       for account_id in transactions_by_account))
+
+        failed_accounts = {}
+        increments = {}
+        history = []
+        for (account_id, account_transactions), user in zip(transactions_by_account.items(), users):
+            try:
+                self._check_user(account_id, user)
+                amounts = [(transaction.id, self._signed_amount(transaction.amount, transaction.type),
+                            transaction.timestamp) for transaction in account_transactions]
+            except ValueError as e:
+                logger.error('Error applying transactions', account_id=account_id, error=str(e))
+                failed_accounts[account_id] = e
+                continue
+            increments[account_id] = (amounts, user)
+            history.extend(account_transactions)
+
+        logger.info('Applying transactions', transactions=len(transactions), accounts=len(transactions_by_account),
+                    failed_accounts=len(failed_accounts))
+
+        balances = await self.balance_repository.increment_many(increments)
+        # saved after the balances with their event of the account, like in process_transaction
+        await self.history_transaction_repository.save_many(
+            history, {transaction_id: event for current in balances.values()
+                      for transaction_id, event in current.transaction_events.items()})
+        already_applied = {transaction_id for current in balances.values()
+                           for transaction_id in current.already_applied}
+        applied = [transaction for transaction in history if transaction.id not in already_applied]
+        applied_balances = {account_id: balances[account_id] for account_id in self._group_by_account(applied)}
+
+        if applied_balances:
+            # one snapshot per account with the balance after the batch
+            await self.save_snapshots([current.balance for current in applied_balances.values()])
+            await self.update_rollups(applied, {account_id: current.balance.balance
+                                                for account_id, current in applied_balances.items()})
+            await self.update_checkpoints(applied, applied_balances)
+            await self.balance_publisher.publish_updated(list(applied_balances))
+        return failed_accounts, already_applied
+
+    async def park_events(self, events: [(str, Any, BaseException)]):
+        """Park (event_id, event, error) triples of events that failed permanently in the dead letter collection"""
+        await self.dead_letter_repository.park(events)
+        for _, _, error in events:
+            EVENTS_DEAD_LETTERED.labels(type(error).__name__).inc()
+
+    async def get_dead_letters(self, limit: int, event_ids: Optional[list[str]] = None) -> list[dict]:
+        return await self.dead_letter_repository.get_parked(limit, event_ids)
+
+    async def mark_replayed(self, event_ids: [str]):
+        await self.dead_letter_repository.mark_replayed(event_ids)
+
+    def _rollups(self, transactions: [TransactionModel], balances: dict[str, Decimal]) -> dict:
+        """Totals per (account_id, granularity, period), the closing balance of a period is worked out backwards
+        from the balance after the last transaction of the account. It is the balance after the newest transaction
+        of the period, last_timestamp, a transaction delivered late doesn't change it"""
+        rollups = {}
+        for account_id, account_transactions in self._group_by_account(transactions).items():
+            if account_id not in balances:
+                continue
+            amounts = [self._signed_amount(transaction.amount, transaction.type) for transaction in account_transactions]
+            balance = balances[account_id] - sum(amounts, Decimal(0))
+            for transaction, amount in zip(account_transactions, amounts):
+                balance += amount
+                for granularity in RollupGranularity:
+                    totals = rollups.setdefault((account_id, granularity, granularity.period(transaction.timestamp)),
+                                                {'count': 0, 'deposits': Decimal(0), 'withdrawals': Decimal(0)})
+                    totals['count'] += 1
+                    totals['deposits' if transaction.type == TransactionType.DEPOSIT else 'withdrawals'] += abs(amount)
+                    timestamp = naive_utc(transaction.timestamp)
+                    if 'last_timestamp' not in totals or timestamp >= totals['last_timestamp']:
+                        totals['closing_balance'] = balance
+                        totals['last_timestamp'] = timestamp
+        return rollups
+
+    def _checkpoints(self, transactions_by_account: dict[str, list[TransactionModel]],
+                     balances: dict[str, CurrentBalance]) -> list[dict]:
+        """Checkpoints of the transactions that complete an interval, numbered by the event of the account of the
+        transaction. Balances are worked out backwards from the balance after the last transaction, the timestamp is
+        the latest of the transactions applied to the account up to the checkpoint, or after it in the same batch"""
+        checkpoints = []
+        for account_id, account_transactions in transactions_by_account.items():
+            current = balances.get(account_id)
+            if not current:
+                continue
+            amounts = [self._signed_amount(transaction.amount, transaction.type)
+                       for transaction in account_transactions]
+            balance = current.balance.balance - sum(amounts, Decimal(0))
+            for transaction, amount in zip(account_transactions, amounts):
+                balance += amount
+                event = current.transaction_events.get(transaction.id)
+                if event and event % BALANCE_CHECKPOINT_INTERVAL == 0:
+                    checkpoints.append({'account_id': account_id, 'events': event, 'balance': balance,
+                                        'timestamp': current.last_timestamp, 'transaction_id': transaction.id})
+        return checkpoints
 
-        balance = self._create_balance_model(account_id, amount, user, previous_balance, transaction_type)
-        logger.info('New balance', balance=balance)
+    @staticmethod
+    def _unique_by_id(transactions: [TransactionModel]) -> list[TransactionModel]:
+        # a redelivered event may come twice in the same batch
+        return list({transaction.id: transaction for transaction in transactions}.values())
 
-        await self.balance_repository.save(balance)
+    @staticmethod
+    def _group_by_account(transactions: [TransactionModel]) -> dict[str, list[TransactionModel]]:
+        transactions_by_account = {}
+        for transaction in transactions:
+            transactions_by_account.setdefault(transaction.account_id, []).append(transaction)
+        return transactions_by_account
 
-    def _get_user_by_account_id(self, account_id: str):
-        user = self.user_repository.get_by_account_id(account_id)
+    @staticmethod
+    def _check_user(account_id: str, user: Optional[UserModel]) -> UserModel:
         if not user:
             raise ValueError(f'User for account {account_id} not found')
         return user
 
-    def _create_balance_model(self, account_id: str, amount: Decimal, user, previous_balance, transaction_type: TransactionType) -> BalanceModel:
-        balance = BalanceModel(
-            balance=amount,
-            account_id=account_id,
-            user_id=user.user_id,
-            username=user.username,
-            created_at=previous_balance.created_at if previous_balance else datetime.now().isoformat(),
-            updated_at=datetime.now().isoformat() if previous_balance else None
-        )
-
-        if previous_balance:
-            balance.balance = self._calculate_new_balance(previous_balance.balance, amount, transaction_type)
-        return balance
-
-    def _calculate_new_balance(self, previous_amount: Decimal, amount: Decimal, transaction_type: TransactionType) -> Decimal:
+    def _signed_amount(self, amount: Decimal, transaction_type: TransactionType) -> Decimal:
         if transaction_type == TransactionType.DEPOSIT:
-            return previous_amount + amount
+            return amount
         elif transaction_type == TransactionType.WITHDRAW:
-            return previous_amount - amount
+            return -amount
         else:
-            raise ValueError(f'Invalid transaction type: {transaction_type}')
\ No newline at end of file
+            raise ValueError(f'Invalid transaction type: {transaction_type}')
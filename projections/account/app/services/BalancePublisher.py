@@ -0,0 +1,41 @@
+import httpx
+from typing import Optional
+from structlog import get_logger
+from app.config.settings import (BALANCE_UPDATES_ENABLED, BALANCE_UPDATES_PUBSUB_NAME, BALANCE_UPDATES_TOPIC,
+                                 DAPR_URL)
+
+logger = get_logger().bind(logger='BalancePublisher', sampled=True)
+
+
+class BalancePublisher:
+    """Publishes the accounts whose balance changed through the Dapr sidecar, consumers that cache balances drop
+    them when the event arrives. Every publish shares one http client and its connections to the sidecar, opened by
+    start (or the first publish) and closed by close"""
+
+    def __init__(self, enabled: bool = BALANCE_UPDATES_ENABLED, client: Optional[httpx.AsyncClient] = None):
+        self.enabled = enabled
+        self._client = client
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def publish_updated(self, account_ids: [str]):
+        if not self.enabled or not account_ids:
+            return
+
+        url = f'{DAPR_URL}/v1.0/publish/{BALANCE_UPDATES_PUBSUB_NAME}/{BALANCE_UPDATES_TOPIC}'
+        try:
+            await self.start()
+            response = await self._client.post(url, json={'account_ids': list(account_ids)})
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            # the projections are already written, a lost update only leaves the cached balances until evicted
+            logger.error('Error publishing balance updates', accounts=len(account_ids), error=str(e))
+            return
+        logger.info('Balance updates published', accounts=len(account_ids))
@@ -0,0 +1,66 @@
+from typing import Optional
+from structlog import get_logger
+
+logger = get_logger().bind(logger='ConcurrencyLimiter')
+
+# weight of a new latency in the recent latency and in the usual latency, the usual one follows lasting changes only
+_RECENT_WEIGHT = 0.2
+_USUAL_WEIGHT = 0.01
+
+
+class ConcurrencyLimiter:
+    """Adaptive limit of the requests handled at once, additive increase and multiplicative decrease (AIMD). The limit
+    grows by one per request while the requests use at least half of it and their recent latency stays within
+    tolerance times their usual latency, it is multiplied by backoff_ratio per request handled slower than that or
+    failed by overload. Requests over the limit are rejected, the shed count, so a slow MongoDB sheds the excess
+    deliveries instead of queueing them until they time out. Used from the event loop only, so it needs no lock"""
+
+    def __init__(self, initial_limit: int, min_limit: int, max_limit: int, tolerance: float = 2.0,
+                 backoff_ratio: float = 0.9):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff_ratio = backoff_ratio
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        self.shed = 0
+        self._recent_latency = None
+        self._usual_latency = None
+
+    def try_acquire(self) -> bool:
+        if self.in_flight >= int(self.limit):
+            self.shed += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self, latency: Optional[float], overloaded: bool = False):
+        """Release a request whose work took latency seconds, None when it has no latency to compare, overloaded when
+        it failed because of the load, e.g. a MongoDB timeout"""
+        in_flight = self.in_flight
+        self.in_flight -= 1
+        if latency is not None and self._recent_latency is None:
+            self._recent_latency = self._usual_latency = latency
+        elif latency is not None:
+            self._recent_latency += (latency - self._recent_latency) * _RECENT_WEIGHT
+            self._usual_latency += (latency - self._usual_latency) * _USUAL_WEIGHT
+
+        slower = self._recent_latency is not None and self._recent_latency > self._usual_latency * self.tolerance
+        if overloaded or slower:
+            limit = max(self.min_limit, self.limit * self.backoff_ratio)
+            if int(limit) < int(self.limit):
+                logger.warning('Concurrency limit decreased', limit=int(limit), in_flight=in_flight, **self._latencies(),
+                               overloaded=overloaded)
+            self.limit = limit
+        elif in_flight * 2 >= self.limit:
+            # only while the limit is in use, otherwise it would grow without bound while idle
+            self.limit = min(self.max_limit, self.limit + 1)
+
+    def stats(self) -> dict:
+        return {'limit': int(self.limit), 'in_flight': self.in_flight, 'shed': self.shed, **self._latencies()}
+
+    def _latencies(self) -> dict:
+        return {
+            'latency_ms': round(self._recent_latency * 1000, 3) if self._recent_latency is not None else None,
+            'usual_latency_ms': round(self._usual_latency * 1000, 3) if self._usual_latency is not None else None,
+        }
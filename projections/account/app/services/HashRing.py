@@ -0,0 +1,41 @@
+import bisect
+import hashlib
+from typing import Hashable, Iterable
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode(), usedforsecurity=False).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes. Every node owns vnodes points of the ring and a key belongs to the node
+    of the first point after its hash, so adding or removing a node only moves the keys of that node and the keys
+    of the rest stay where they were"""
+
+    def __init__(self, nodes: Iterable[Hashable], vnodes: int = 64):
+        self.vnodes = vnodes
+        self._hashes: list[int] = []
+        self._nodes: list[Hashable] = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> list:
+        return sorted(set(self._nodes))
+
+    def add(self, node: Hashable):
+        for vnode in range(self.vnodes):
+            point = _hash(f'{node}:{vnode}')
+            index = bisect.bisect(self._hashes, point)
+            self._hashes.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node: Hashable):
+        points = [(point, owner) for point, owner in zip(self._hashes, self._nodes) if owner != node]
+        self._hashes = [point for point, _ in points]
+        self._nodes = [owner for _, owner in points]
+
+    def node(self, key: str) -> Hashable:
+        if not self._hashes:
+            raise LookupError('The ring has no nodes')
+        return self._nodes[bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)]
@@ -0,0 +1,55 @@
+import asyncio
+import zlib
+from typing import Awaitable, Callable, TypeVar
+from structlog import get_logger
+
+logger = get_logger().bind(logger='KeyedExecutor')
+
+T = TypeVar('T')
+
+
+class _Lane:
+    def __init__(self, queue_depth: int):
+        # asyncio locks and semaphores wake their waiters in FIFO order
+        self.lock = asyncio.Lock()
+        self.slots = asyncio.Semaphore(queue_depth)
+
+
+class KeyedExecutor:
+    """Runs coroutines over a fixed number of lanes, every lane runs one coroutine at a time and queues at most
+    queue_depth of them. Keys are hashed to a lane, so work submitted with the same key runs strictly in submission
+    order while work for keys in different lanes runs concurrently, at most one coroutine per lane"""
+
+    def __init__(self, lanes: int, queue_depth: int):
+        self._lanes_count = lanes
+        self._queue_depth = queue_depth
+        self._lanes: list[_Lane] = []
+        self._loop = None
+
+    def lane(self, key: str) -> int:
+        # crc32 instead of hash() so the lane of a key doesn't change between processes
+        return zlib.crc32(key.encode()) % self._lanes_count
+
+    def partition(self, items: list, key: Callable) -> list[list]:
+        """Split items by lane keeping their order, every partition can be submitted with the key of any of its items"""
+        partitions = {}
+        for item in items:
+            partitions.setdefault(self.lane(key(item)), []).append(item)
+        return list(partitions.values())
+
+    async def submit(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn in the lane of key once the work submitted before it finished, waits for room when the lane
+        queue is full"""
+        lane = self._get_lanes()[self.lane(key)]
+        async with lane.slots:
+            async with lane.lock:
+                return await fn()
+
+    def _get_lanes(self) -> list[_Lane]:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # lanes are bound to the loop they are used in
+            self._loop = loop
+            self._lanes = [_Lane(self._queue_depth) for _ in range(self._lanes_count)]
+            logger.info('Executor lanes created', lanes=self._lanes_count, queue_depth=self._queue_depth)
+        return self._lanes
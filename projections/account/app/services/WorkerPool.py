@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import multiprocessing
+import threading
+from typing import Callable, Optional
+from structlog import get_logger
+from com_ivansoft_corebank_lib.metrics import current_mongo_time, process_exited
+from app.services.HashRing import HashRing
+
+logger = get_logger().bind(logger='WorkerPool')
+
+# seconds between the checks of the worker processes
+_WATCH_INTERVAL = 1.0
+
+
+class WorkerPool:
+    """Front of the projection worker processes. Entries are hashed by key (the account id) onto the workers with a
+    consistent hash ring, so the events of an account are always applied by the same worker, in the order they were
+    submitted, while the decoding, validation and the rest of the work of different accounts run on several cores.
+
+    target(slot, requests, results, setup) runs in every worker: it reads (request_id, entries) from its requests
+    queue and puts (request_id, statuses, mongo_seconds, mongo_operations) in the results queue shared by the workers,
+    the MongoDB time is added to the measure_mongo_time of the submitter. The requests of a worker that exits are
+    answered with RETRY. With restart the worker is started again in its slot and keeps its accounts,
+    otherwise it leaves the ring and its accounts are rebalanced onto the remaining workers.
+
+    The workers record their metrics in their own process, /metrics of the front process exposes them when
+    PROMETHEUS_MULTIPROC_DIR is set for every process"""
+
+    def __init__(self, target: Callable, workers: int, vnodes: int = 64, restart: bool = True,
+                 setup: Optional[Callable] = None):
+        # spawned, forking a process with a running event loop and MongoDB client is not safe
+        self._context = multiprocessing.get_context('spawn')
+        self._target = target
+        self._restart = restart
+        self._setup = setup
+        self._ring = HashRing(range(workers), vnodes)
+        self._workers: dict[int, tuple] = {}
+        self._results = self._context.Queue()
+        self._pending: dict[int, tuple] = {}
+        self._request_ids = itertools.count()
+        self._loop = None
+        self._reader = None
+        self._watcher = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        for slot in self._ring.nodes:
+            self._start_worker(slot)
+        self._reader = threading.Thread(target=self._read_results, name='worker-results', daemon=True)
+        self._reader.start()
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def submit(self, entries: [(str, object)], key: Callable) -> dict[str, str]:
+        """Apply (entry_id, event) pairs on the workers of their key(entry_id, event), returns the status of every
+        entry"""
+        partitions = {}
+        for entry in entries:
+            partitions.setdefault(self._ring.node(key(*entry)), []).append(entry)
+        futures = []
+        for slot, partition in partitions.items():
+            request_id = next(self._request_ids)
+            future = self._loop.create_future()
+            self._pending[request_id] = (slot, partition, future, current_mongo_time())
+            self._workers[slot][1].put((request_id, partition))
+            futures.append(future)
+        statuses = {}
+        for result in await asyncio.gather(*futures):
+            statuses.update(result)
+        return statuses
+
+    async def close(self, timeout: float = 10.0):
+        """Stop the workers once they applied the requests they received"""
+        if self._watcher is not None:
+            self._watcher.cancel()
+        for _, requests in self._workers.values():
+            requests.put(None)
+        await self._loop.run_in_executor(None, self._join, timeout)
+        for slot in list(self._workers):
+            self._fail_pending(slot)
+        self._results.put(None)
+
+    def stats(self) -> dict:
+        pending = {}
+        for slot, *_ in self._pending.values():
+            pending[slot] = pending.get(slot, 0) + 1
+        return {'restart': self._restart, 'vnodes': self._ring.vnodes,
+                'workers': {slot: {'pid': process.pid, 'alive': process.is_alive(), 'pending': pending.get(slot, 0)}
+                            for slot, (process, _) in self._workers.items()}}
+
+    def _start_worker(self, slot: int):
+        requests = self._context.Queue()
+        process = self._context.Process(target=self._target, args=(slot, requests, self._results, self._setup),
+                                        name=f'projection-worker-{slot}', daemon=True)
+        process.start()
+        self._workers[slot] = (process, requests)
+        logger.info('Projection worker started', slot=slot, pid=process.pid)
+
+    def _join(self, timeout: float):
+        for process, _ in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+            process_exited(process.pid)
+
+    def _read_results(self):
+        while True:
+            result = self._results.get()
+            if result is None:
+                return
+            self._loop.call_soon_threadsafe(self._resolve, *result)
+
+    def _resolve(self, request_id: int, statuses: dict[str, str], mongo_seconds: float = 0.0,
+                 mongo_operations: int = 0):
+        pending = self._pending.pop(request_id, None)
+        if pending is None:
+            return
+        _, _, future, mongo_time = pending
+        if mongo_time is not None:
+            mongo_time.add(mongo_seconds, mongo_operations)
+        if not future.done():
+            future.set_result(statuses)
+
+    def _fail_pending(self, slot: int):
+        # Dapr redelivers them, to the same slot or to the worker that took over its accounts
+        for request_id, (pending_slot, partition, future, _) in list(self._pending.items()):
+            if pending_slot == slot:
+                del self._pending[request_id]
+                if not future.done():
+                    future.set_result({entry_id: 'RETRY' for entry_id, _ in partition})
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(_WATCH_INTERVAL)
+            for slot, (process, _) in list(self._workers.items()):
+                if process.is_alive():
+                    continue
+                logger.error('Projection worker exited', slot=slot, pid=process.pid, exit_code=process.exitcode)
+                process_exited(process.pid)
+                self._fail_pending(slot)
+                if self._restart or len(self._workers) == 1:
+                    self._start_worker(slot)
+                else:
+                    del self._workers[slot]
+                    self._ring.remove(slot)
+                    logger.warning('Projection worker accounts rebalanced', slot=slot, workers=len(self._workers))
@@ -0,0 +1,43 @@
+import asyncio
+import random
+from typing import Awaitable, Callable, TypeVar
+from bson.errors import InvalidDocument
+from structlog import get_logger
+from app.metrics import EVENT_RETRIES
+from app.config.settings import RETRY_ATTEMPTS, RETRY_BACKOFF_MS, RETRY_BACKOFF_MAX_MS
+
+logger = get_logger().bind(logger='retry')
+
+T = TypeVar('T')
+
+# errors of the event itself, applying it again fails the same way: invalid events (pydantic ValidationError is a
+# ValueError), unknown accounts and documents MongoDB can't store. Any other error, e.g. MongoDB unavailable or a
+# timeout, is expected to pass
+PERMANENT_ERRORS = (ValueError, TypeError, KeyError, InvalidDocument)
+
+
+def is_permanent(error: BaseException) -> bool:
+    return isinstance(error, PERMANENT_ERRORS)
+
+
+def backoff_seconds(attempt: int, backoff_ms: int = RETRY_BACKOFF_MS, max_backoff_ms: int = RETRY_BACKOFF_MAX_MS) -> float:
+    """Exponential backoff of the attempt (0 based) capped at max_backoff_ms, with jitter so the retries of the
+    lanes don't hit MongoDB at the same time"""
+    return min(backoff_ms * 2 ** attempt, max_backoff_ms) * random.uniform(0.5, 1) / 1000
+
+
+async def retry_transient(fn: Callable[[], Awaitable[T]], attempts: int = RETRY_ATTEMPTS) -> T:
+    """Run fn retrying transient errors up to attempts times with exponential backoff, permanent errors and the error
+    of the last attempt are raised. fn runs again from the start, so every write it made before the error has to be
+    idempotent: the projections skip the transactions already applied to a balance"""
+    for attempt in range(attempts + 1):
+        try:
+            return await fn()
+        except Exception as e:
+            if is_permanent(e) or attempt == attempts:
+                raise
+            delay = backoff_seconds(attempt)
+            logger.warning('Transient error, retrying', attempt=attempt + 1, attempts=attempts,
+                           delay_ms=round(delay * 1000), error=str(e))
+            EVENT_RETRIES.inc()
+            await asyncio.sleep(delay)
@@ -0,0 +1,50 @@
+"""Projection worker process of the multi-process mode (PROJECTION_WORKERS > 0), started by the WorkerPool of the
+front process. The worker has its own MongoDB client and applies the entries it receives like the bulk handler does,
+the entries of an account always come to the same worker"""
+import asyncio
+from typing import Callable, Optional
+from structlog import get_logger
+from com_ivansoft_corebank_lib.log import configure_logging
+from com_ivansoft_corebank_lib.metrics import measure_mongo_time
+from app.api.eventsource.v1.subscribers import apply_entries
+from app.db.MongoBase import MongoBase
+from app.services.AccountService import AccountService
+from app.config.settings import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE
+
+logger = get_logger().bind(logger='worker')
+
+
+def run(slot: int, requests, results, setup: Optional[Callable] = None):
+    configure_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE)
+    # e.g. the benchmark points the repositories to an in-memory database
+    if setup is not None:
+        setup()
+    asyncio.run(serve(slot, requests, results))
+
+
+async def serve(slot: int, requests, results):
+    """Apply the requests until the None sent by WorkerPool.close, requests run concurrently and the executor lanes
+    keep the events of an account in the order they were received"""
+    logger.info('Projection worker ready', slot=slot)
+    account_service = AccountService()
+    loop = asyncio.get_running_loop()
+    tasks = set()
+    while (request := await loop.run_in_executor(None, requests.get)) is not None:
+        task = asyncio.create_task(_apply(account_service, *request, results))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks)
+    await account_service.balance_publisher.close()
+    MongoBase.close()
+    logger.info('Projection worker stopped', slot=slot)
+
+
+async def _apply(account_service: AccountService, request_id: int, entries: [(str, object)], results):
+    with measure_mongo_time() as mongo_time:
+        try:
+            statuses = await apply_entries(account_service, entries)
+        except Exception as e:
+            logger.error('Error applying entries', entries=len(entries), error=str(e))
+            statuses = {entry_id: 'RETRY' for entry_id, _ in entries}
+    # the front process adds the MongoDB time to the one of the delivery, for its concurrency limit
+    results.put((request_id, statuses, mongo_time.seconds, mongo_time.operations))
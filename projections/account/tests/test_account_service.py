@@ -1,15 +1,26 @@
 import pytest
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from unittest.mock import Mock, AsyncMock
+from prometheus_client import REGISTRY
 from app.services.AccountService import AccountService
+from app.db.balance.BalanceRepository import CurrentBalance
 from com_ivansoft_corebank_lib.models.Transaction import Transaction, TransactionType
 from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
 from com_ivansoft_corebank_lib.models.User import User
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
 from app.config import settings
 # db for testing
 settings.MONGO_DB_NAME = "testdb"
 
+def _current(account_id, user, amounts, events, already_applied=()):
+    """Balance of 1000 plus the (transaction_id, amount, timestamp) amounts, which are the last events"""
+    balance = BalanceModel(balance=Decimal("1000.0") + sum(amount for _, amount, _ in amounts), account_id=account_id,
+                           user_id=user.user_id, username=user.username)
+    return CurrentBalance(balance, events, max(timestamp for _, _, timestamp in amounts),
+                          {transaction_id: events - len(amounts) + position
+                           for position, (transaction_id, _, _) in enumerate(amounts, start=1)}, set(already_applied))
+
 @pytest.fixture
 def account_service():
     service = AccountService()
@@ -17,23 +28,44 @@ def account_service():
     service.balance_repository = Mock()
     service.balance_repository.get = AsyncMock()
     service.balance_repository.save = AsyncMock()
+    service.balance_repository.get_many = AsyncMock(return_value={})
+    service.balance_repository.save_many = AsyncMock()
+    service.balance_repository.increment = AsyncMock(
+        side_effect=lambda account_id, amount, user, transaction_id, timestamp: _current(
+            account_id, user, [(transaction_id, amount, timestamp)], 1))
+    service.balance_repository.increment_many = AsyncMock(
+        side_effect=lambda increments: {account_id: _current(account_id, user, amounts, len(amounts))
+                                        for account_id, (amounts, user) in increments.items()})
     service.user_repository = Mock()
+    service.user_repository.get_by_account_id = AsyncMock()
     service.history_transaction_repository = Mock()
     service.history_transaction_repository.save = AsyncMock()
+    service.history_transaction_repository.save_many = AsyncMock()
+    service.processed_event_repository = Mock()
+    service.processed_event_repository.get_processed = AsyncMock(return_value=set())
+    service.processed_event_repository.mark_processed = AsyncMock()
+    service.rollup_repository = Mock()
+    service.rollup_repository.increment_many = AsyncMock()
+    service.checkpoint_repository = Mock()
+    service.checkpoint_repository.save_many = AsyncMock()
+    service.balance_publisher = Mock()
+    service.balance_publisher.publish_updated = AsyncMock()
     return service
 
 @pytest.fixture
 def mock_user():
     return User(user_id=1, username="testuser", account_id="acc123")
 
-@pytest.fixture
-def mock_balance():
-    return BalanceModel(
-        balance=Decimal("1000.0"),
-        account_id="acc123",
-        user_id=1,
-        username="testuser",
-        created_at=datetime.now().isoformat()
+def _transaction(tx_id, account_id, amount, tx_type=TransactionType.DEPOSIT, timestamp=None):
+    return Transaction(
+        id=tx_id,
+        account_id=account_id,
+        amount=amount,
+        type=tx_type,
+        status="PENDING",
+        description="Test",
+        timestamp=timestamp or datetime.now(),
+        version=1,
     )
 
 @pytest.mark.asyncio
@@ -54,55 +86,58 @@ async def test_save_transaction(account_service):
     await account_service.save_transaction(transaction)
 
     # Assert
-    account_service.history_transaction_repository.save.assert_called_once_with(transaction)
+    account_service.history_transaction_repository.save.assert_called_once_with(transaction, None)
 
 @pytest.mark.asyncio
-async def test_update_balance_deposit(account_service, mock_user, mock_balance):
+async def test_update_balance_deposit(account_service, mock_user):
     # Arrange
-    account_service.balance_repository.get.return_value = mock_balance
     account_service.user_repository.get_by_account_id.return_value = mock_user
     
+    transaction = _transaction("tx1", "acc123", 500.0)
+
     # Act
-    await account_service.update_balance("acc123", Decimal("500.0"), TransactionType.DEPOSIT)
+    current = await account_service.update_balance(transaction)
 
     # Assert
-    account_service.balance_repository.save.assert_called_once()
-    saved_balance = account_service.balance_repository.save.call_args[0][0]
+    account_service.balance_repository.increment.assert_called_once_with(
+        "acc123", Decimal("500.0"), mock_user, "tx1", transaction.timestamp)
+    assert current.transaction_events == {"tx1": 1}
+    account_service.balance_repository.save_many.assert_called_once()
+    (saved_balance,) = account_service.balance_repository.save_many.call_args[0][0]
     assert saved_balance.balance == Decimal("1500.0")
     assert saved_balance.account_id == "acc123"
+    account_service.balance_publisher.publish_updated.assert_called_once_with(["acc123"])
 
 @pytest.mark.asyncio
-async def test_update_balance_withdraw(account_service, mock_user, mock_balance):
+async def test_update_balance_withdraw(account_service, mock_user):
     # Arrange
-    account_service.balance_repository.get.return_value = mock_balance
     account_service.user_repository.get_by_account_id.return_value = mock_user
     
+    transaction = _transaction("tx1", "acc123", 300.0, TransactionType.WITHDRAW)
+
     # Act
-    await account_service.update_balance("acc123", Decimal("300.0"), TransactionType.WITHDRAW)
+    await account_service.update_balance(transaction)
 
     # Assert
-    account_service.balance_repository.save.assert_called_once()
-    saved_balance = account_service.balance_repository.save.call_args[0][0]
+    account_service.balance_repository.increment.assert_called_once_with(
+        "acc123", Decimal("-300.0"), mock_user, "tx1", transaction.timestamp)
+    account_service.balance_repository.save_many.assert_called_once()
+    (saved_balance,) = account_service.balance_repository.save_many.call_args[0][0]
     assert saved_balance.balance == Decimal("700.0")
     assert saved_balance.account_id == "acc123"
     assert saved_balance.user_id == 1
 
 @pytest.mark.asyncio
-async def test_update_balance_new_account(account_service, mock_user):
+async def test_update_balance_does_not_read_previous_balance(account_service, mock_user):
     # Arrange
-    account_service.balance_repository.get.return_value = None
     account_service.user_repository.get_by_account_id.return_value = mock_user
     
     # Act
-    await account_service.update_balance("acc123", Decimal("500.0"), TransactionType.DEPOSIT)
+    await account_service.update_balance(_transaction("tx1", "acc123", 500.0))
 
     # Assert
-    account_service.balance_repository.save.assert_called_once()
-    saved_balance = account_service.balance_repository.save.call_args[0][0]
-    assert saved_balance.balance == Decimal("500.0")
-    assert saved_balance.account_id == "acc123"
-    assert saved_balance.user_id == 1
-    assert saved_balance.updated_at is None
+    account_service.balance_repository.get.assert_not_called()
+    account_service.balance_repository.increment.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_update_balance_invalid_user(account_service):
@@ -111,14 +146,286 @@ async def test_update_balance_invalid_user(account_service):
     
     # Act & Assert
     with pytest.raises(ValueError, match="User for account acc123 not found"):
-        await account_service.update_balance("acc123", Decimal("500.0"), TransactionType.DEPOSIT)
+        await account_service.update_balance(_transaction("tx1", "acc123", 500.0))
 
 @pytest.mark.asyncio
-async def test_update_balance_invalid_transaction_type(account_service, mock_user, mock_balance):
+async def test_update_balance_invalid_transaction_type(account_service, mock_user):
     # Arrange
-    account_service.balance_repository.get.return_value = mock_balance
     account_service.user_repository.get_by_account_id.return_value = mock_user
     
     # Act & Assert
     with pytest.raises(ValueError, match="Invalid transaction type"):
-        await account_service.update_balance("acc123", Decimal("500.0"), "INVALID_TYPE")
+        await account_service.update_balance(
+            _transaction("tx1", "acc123", 500.0).model_copy(update={"type": "INVALID_TYPE"}))
+
+@pytest.mark.asyncio
+async def test_apply_transactions_groups_by_account(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transactions = [
+        _transaction("tx1", "acc123", 100.0),
+        _transaction("tx2", "acc456", 50.0),
+        _transaction("tx3", "acc123", 300.0, TransactionType.WITHDRAW),
+    ]
+
+    # Act
+    failed_accounts = await account_service.apply_transactions(transactions)
+
+    # Assert
+    assert failed_accounts == {}
+    increments = account_service.balance_repository.increment_many.call_args[0][0]
+    assert increments == {
+        "acc123": ([("tx1", Decimal("100.0"), transactions[0].timestamp),
+                    ("tx3", Decimal("-300.0"), transactions[2].timestamp)], mock_user),
+        "acc456": ([("tx2", Decimal("50.0"), transactions[1].timestamp)], mock_user)}
+    saved_history, events = account_service.history_transaction_repository.save_many.call_args[0]
+    assert [tx.id for tx in saved_history] == ["tx1", "tx3", "tx2"]
+    assert events == {"tx1": 1, "tx3": 2, "tx2": 1}
+    account_service.balance_repository.get_many.assert_not_called()
+    account_service.balance_publisher.publish_updated.assert_called_once_with(["acc123", "acc456"])
+
+@pytest.mark.asyncio
+async def test_apply_transactions_failed_account(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.side_effect = \
+        lambda account_id: None if account_id == "acc456" else mock_user
+    transactions = [_transaction("tx1", "acc123", 100.0), _transaction("tx2", "acc456", 50.0)]
+
+    # Act
+    failed_accounts = await account_service.apply_transactions(transactions)
+
+    # Assert
+    assert list(failed_accounts) == ["acc456"]
+    assert isinstance(failed_accounts["acc456"], ValueError)
+    account_service.processed_event_repository.mark_processed.assert_called_once_with([("tx1", "acc123")])
+    increments = account_service.balance_repository.increment_many.call_args[0][0]
+    assert list(increments) == ["acc123"]
+    saved_history = account_service.history_transaction_repository.save_many.call_args[0][0]
+    assert [tx.id for tx in saved_history] == ["tx1"]
+    account_service.balance_publisher.publish_updated.assert_called_once_with(["acc123"])
+
+@pytest.mark.asyncio
+async def test_process_transaction(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transaction = _transaction("tx1", "acc123", 100.0)
+
+    # Act
+    processed = await account_service.process_transaction(transaction)
+
+    # Assert
+    assert processed is True
+    account_service.processed_event_repository.get_processed.assert_called_once_with(["tx1"])
+    account_service.history_transaction_repository.save.assert_called_once_with(transaction, 1)
+    (saved_balance,) = account_service.balance_repository.save_many.call_args[0][0]
+    assert saved_balance.balance == Decimal("1100.0")
+    account_service.processed_event_repository.mark_processed.assert_called_once_with([("tx1", "acc123")])
+
+@pytest.mark.asyncio
+async def test_process_transaction_already_processed(account_service):
+    # Arrange
+    account_service.processed_event_repository.get_processed.return_value = {"tx1"}
+
+    # Act
+    processed = await account_service.process_transaction(_transaction("tx1", "acc123", 100.0))
+
+    # Assert
+    assert processed is False
+    account_service.balance_repository.increment.assert_not_called()
+    account_service.balance_repository.save_many.assert_not_called()
+    account_service.history_transaction_repository.save.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_transaction_failure_is_not_recorded(account_service):
+    # Arrange
+    account_service.user_repository.get_by_account_id.return_value = None
+
+    # Act & Assert
+    with pytest.raises(ValueError, match="User for account acc123 not found"):
+        await account_service.process_transaction(_transaction("tx1", "acc123", 100.0))
+    account_service.processed_event_repository.mark_processed.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_transaction_already_applied_to_the_balance(account_service, mock_user):
+    # Arrange - applied before, but the ledger wasn't written
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transaction = _transaction("tx1", "acc123", 100.0)
+    account_service.balance_repository.increment.side_effect = None
+    account_service.balance_repository.increment.return_value = _current(
+        "acc123", mock_user, [("tx1", Decimal("100.0"), transaction.timestamp)], 7, {"tx1"})
+
+    # Act
+    processed = await account_service.process_transaction(transaction)
+
+    # Assert
+    assert processed is False
+    account_service.balance_repository.save_many.assert_not_called()
+    account_service.rollup_repository.increment_many.assert_not_called()
+    account_service.balance_publisher.publish_updated.assert_not_called()
+    account_service.checkpoint_repository.save_many.assert_not_called()
+    # the history is saved with the event the transaction had
+    account_service.history_transaction_repository.save.assert_called_once_with(transaction, 7)
+    account_service.processed_event_repository.mark_processed.assert_called_once_with([("tx1", "acc123")])
+
+@pytest.mark.asyncio
+async def test_apply_transactions_skips_processed(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    account_service.processed_event_repository.get_processed.return_value = {"tx1"}
+    transactions = [
+        _transaction("tx1", "acc123", 100.0),
+        _transaction("tx2", "acc123", 50.0, timestamp=datetime(2024, 3, 30, 10)),
+        # redelivered in the same batch
+        _transaction("tx2", "acc123", 50.0, timestamp=datetime(2024, 3, 30, 10)),
+    ]
+
+    # Act
+    failed_accounts = await account_service.apply_transactions(transactions)
+
+    # Assert
+    assert failed_accounts == {}
+    account_service.processed_event_repository.get_processed.assert_called_once_with(["tx1", "tx2"])
+    increments = account_service.balance_repository.increment_many.call_args[0][0]
+    assert increments == {"acc123": ([("tx2", Decimal("50.0"), transactions[1].timestamp)], mock_user)}
+    saved_history = account_service.history_transaction_repository.save_many.call_args[0][0]
+    assert [tx.id for tx in saved_history] == ["tx2"]
+
+@pytest.mark.asyncio
+async def test_apply_transactions_skips_transactions_already_applied_to_the_balance(account_service, mock_user):
+    # Arrange - tx1 was applied before, but the ledger wasn't written
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transactions = [_transaction("tx1", "acc123", 100.0), _transaction("tx2", "acc123", 50.0)]
+    account_service.balance_repository.increment_many.side_effect = None
+    account_service.balance_repository.increment_many.return_value = {"acc123": _current(
+        "acc123", mock_user, [(tx.id, Decimal(str(tx.amount)), tx.timestamp) for tx in transactions], 2, {"tx1"})}
+
+    # Act
+    failed_accounts = await account_service.apply_transactions(transactions)
+
+    # Assert - only tx2 is added to the rollups, both are recorded
+    assert failed_accounts == {}
+    rollups = account_service.rollup_repository.increment_many.call_args[0][0]
+    day = transactions[0].timestamp.strftime("%Y-%m-%d")
+    assert rollups[("acc123", RollupGranularity.DAY, day)]["count"] == 1
+    account_service.processed_event_repository.mark_processed.assert_called_once_with(
+        [("tx1", "acc123"), ("tx2", "acc123")])
+
+@pytest.mark.asyncio
+async def test_process_transaction_updates_rollups(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transaction = _transaction("tx1", "acc123", 100.0)
+
+    # Act
+    await account_service.process_transaction(transaction)
+
+    # Assert
+    rollups = account_service.rollup_repository.increment_many.call_args[0][0]
+    day = transaction.timestamp.strftime("%Y-%m-%d")
+    assert rollups[("acc123", RollupGranularity.DAY, day)] == {
+        "count": 1, "deposits": Decimal("100.0"), "withdrawals": Decimal(0), "closing_balance": Decimal("1100.0"),
+        "last_timestamp": transaction.timestamp}
+    assert ("acc123", RollupGranularity.MONTH, day[:7]) in rollups
+
+@pytest.mark.asyncio
+async def test_apply_transactions_rollups_closing_balance_per_period(account_service, mock_user):
+    # Arrange - the balance after the batch is 1250
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transactions = [
+        _transaction("tx1", "acc123", 100.0, timestamp=datetime(2024, 3, 30, 10)),
+        _transaction("tx2", "acc123", 50.0, TransactionType.WITHDRAW, timestamp=datetime(2024, 3, 31, 10)),
+        _transaction("tx3", "acc123", 200.0, timestamp=datetime(2024, 4, 1, 10)),
+    ]
+
+    # Act
+    await account_service.apply_transactions(transactions)
+
+    # Assert
+    rollups = account_service.rollup_repository.increment_many.call_args[0][0]
+    assert rollups[("acc123", RollupGranularity.DAY, "2024-03-30")]["closing_balance"] == Decimal("1100.0")
+    assert rollups[("acc123", RollupGranularity.DAY, "2024-03-31")]["closing_balance"] == Decimal("1050.0")
+    assert rollups[("acc123", RollupGranularity.MONTH, "2024-03")] == {
+        "count": 2, "deposits": Decimal("100.0"), "withdrawals": Decimal("50.0"), "closing_balance": Decimal("1050.0"),
+        "last_timestamp": datetime(2024, 3, 31, 10)}
+    assert rollups[("acc123", RollupGranularity.MONTH, "2024-04")]["closing_balance"] == Decimal("1250.0")
+
+@pytest.mark.asyncio
+async def test_apply_transactions_rollups_closing_balance_of_late_transaction(account_service, mock_user):
+    # Arrange - tx2 was delivered late, the balance after the batch is 1150
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    transactions = [
+        _transaction("tx1", "acc123", 100.0, timestamp=datetime(2024, 3, 31, 10)),
+        _transaction("tx2", "acc123", 50.0, timestamp=datetime(2024, 3, 30, 10)),
+    ]
+
+    # Act
+    await account_service.apply_transactions(transactions)
+
+    # Assert - the month closes with the balance after tx1, its newest transaction
+    rollups = account_service.rollup_repository.increment_many.call_args[0][0]
+    assert rollups[("acc123", RollupGranularity.MONTH, "2024-03")]["closing_balance"] == Decimal("1100.0")
+    assert rollups[("acc123", RollupGranularity.MONTH, "2024-03")]["last_timestamp"] == datetime(2024, 3, 31, 10)
+
+@pytest.mark.asyncio
+async def test_apply_transactions_checkpoints_every_interval(account_service, mock_user, monkeypatch):
+    # Arrange - acc123 had 3 events before the batch, the balance after the batch is 1050 and after 5 events
+    monkeypatch.setattr("app.services.AccountService.BALANCE_CHECKPOINT_INTERVAL", 4)
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    account_service.balance_repository.increment_many.side_effect = \
+        lambda increments: {account_id: _current(account_id, user, amounts, 5)
+                            for account_id, (amounts, user) in increments.items()}
+    transactions = [
+        _transaction("tx1", "acc123", 100.0, timestamp=datetime(2024, 3, 30, 10)),
+        _transaction("tx2", "acc123", 50.0, TransactionType.WITHDRAW, timestamp=datetime(2024, 3, 31, 10)),
+    ]
+
+    # Act
+    await account_service.apply_transactions(transactions)
+
+    # Assert - the 4th event of the account is tx1, the timestamp is the latest one applied to the balance
+    account_service.checkpoint_repository.save_many.assert_called_once_with([
+        {"account_id": "acc123", "events": 4, "balance": Decimal("1100.0"), "timestamp": datetime(2024, 3, 31, 10),
+         "transaction_id": "tx1"}])
+    saved_history, events = account_service.history_transaction_repository.save_many.call_args[0]
+    assert events == {"tx1": 4, "tx2": 5}
+
+@pytest.mark.asyncio
+async def test_rollup_errors_are_not_raised(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.return_value = mock_user
+    account_service.rollup_repository.increment_many.side_effect = Exception("Database error")
+
+    # Act
+    processed = await account_service.process_transaction(_transaction("tx1", "acc123", 100.0))
+
+    # Assert - the balance is applied and recorded
+    assert processed is True
+    account_service.processed_event_repository.mark_processed.assert_called_once_with([("tx1", "acc123")])
+
+def _events(name, transaction_type=TransactionType.DEPOSIT):
+    return REGISTRY.get_sample_value(f"projection_events_{name}_total", {"type": transaction_type.value}) or 0
+
+@pytest.mark.asyncio
+async def test_apply_transactions_metrics(account_service, mock_user):
+    # Arrange
+    account_service.user_repository.get_by_account_id.side_effect = \
+        lambda account_id: None if account_id == "acc456" else mock_user
+    account_service.processed_event_repository.get_processed.return_value = {"tx3"}
+    transactions = [
+        # stored timestamps without timezone are UTC
+        _transaction("tx1", "acc123", 100.0,
+                     timestamp=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=30)),
+        _transaction("tx2", "acc456", 50.0),
+        _transaction("tx3", "acc123", 10.0),
+    ]
+    before = {name: _events(name) for name in ("processed", "failed", "duplicated")}
+    lag_count = REGISTRY.get_sample_value("projection_lag_seconds_count")
+    lag_sum = REGISTRY.get_sample_value("projection_lag_seconds_sum")
+
+    # Act
+    await account_service.apply_transactions(transactions)
+
+    # Assert
+    assert {name: _events(name) - before[name] for name in before} == {"processed": 1, "failed": 1, "duplicated": 1}
+    assert REGISTRY.get_sample_value("projection_lag_seconds_count") == lag_count + 1
+    assert 30 <= REGISTRY.get_sample_value("projection_lag_seconds_sum") - lag_sum < 60
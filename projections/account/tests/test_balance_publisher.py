@@ -0,0 +1,64 @@
+import json
+import httpx
+import pytest
+from unittest.mock import patch
+from app.services.BalancePublisher import BalancePublisher
+
+
+def _transport(requests, status_code=204):
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(status_code)
+    return httpx.MockTransport(handler)
+
+@pytest.mark.asyncio
+async def test_publish_updated():
+    # Arrange
+    requests = []
+    publisher = BalancePublisher(client=httpx.AsyncClient(transport=_transport(requests)))
+
+    # Act
+    await publisher.publish_updated(["acc123", "acc456"])
+
+    # Assert
+    assert len(requests) == 1
+    assert requests[0].url.path == "/v1.0/publish/eventsource/balances"
+    assert json.loads(requests[0].read()) == {"account_ids": ["acc123", "acc456"]}
+
+@pytest.mark.asyncio
+async def test_publish_updated_reuses_the_client():
+    # Arrange
+    requests = []
+    client = httpx.AsyncClient(transport=_transport(requests))
+    publisher = BalancePublisher()
+
+    # Act
+    with patch('app.services.BalancePublisher.httpx.AsyncClient', return_value=client) as client_class:
+        await publisher.start()
+        await publisher.publish_updated(["acc123"])
+        await publisher.publish_updated(["acc456"])
+        await publisher.close()
+
+    # Assert
+    client_class.assert_called_once()
+    assert len(requests) == 2
+    assert client.is_closed
+
+@pytest.mark.asyncio
+async def test_publish_updated_nothing_to_publish():
+    with patch('app.services.BalancePublisher.httpx.AsyncClient') as client:
+        await BalancePublisher().publish_updated([])
+
+    client.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_publish_updated_error_is_not_raised():
+    # Arrange - the sidecar rejects the message
+    requests = []
+    publisher = BalancePublisher(client=httpx.AsyncClient(transport=_transport(requests, status_code=500)))
+
+    # Act
+    await publisher.publish_updated(["acc123"])
+
+    # Assert
+    assert len(requests) == 1
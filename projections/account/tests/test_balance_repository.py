@@ -7,8 +7,13 @@ from motor.motor_asyncio import AsyncIOMotorClient
 # for testing
 settings.MONGO_DB_NAME = "testdb"
 
-from app.db.balance.BalanceRepository import BalanceRepository
+from app.db.balance.BalanceRepository import BalanceRepository, MONGO_DB_NAME
 from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.models.User import User
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+
+NOW = datetime(2024, 3, 20, 12)
+LATER = datetime(2024, 3, 20, 13)
 
 @pytest.fixture(scope="session")
 def event_loop():
@@ -35,31 +40,33 @@ async def balance_repository(mongodb_client):
     yield repo
     # Clean up
     await mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_BALANCE_COLLECTION].drop()
+    await mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_CURRENT_BALANCE_COLLECTION].drop()
 
 @pytest.fixture
-def sample_balance():
-    return BalanceModel(
-        account_id="test_account_123",
-        balance=Decimal("1000.00"),
-        currency="MXN",
-        user_id=456,  # Integer user_id
-        username="testuser",
-        created_at=datetime.now().isoformat()
-    )
+def in_memory_repository(monkeypatch):
+    monkeypatch.setattr(BalanceRepository, '_client', InMemoryMongoClient())
+    return BalanceRepository()
+
+@pytest.fixture
+def sample_user():
+    return User(user_id=456, username="testuser")
 
 @pytest.mark.asyncio
-async def test_save_balance_success(balance_repository, sample_balance):
+async def test_increment_new_account(balance_repository, sample_user):
     # Act
-    await balance_repository.save(sample_balance)
-
-    # Assert - Verify we can retrieve the saved balance
-    saved_balance = await balance_repository.get(sample_balance.account_id)
-    assert saved_balance is not None
-    assert saved_balance.account_id == sample_balance.account_id
-    assert saved_balance.balance == sample_balance.balance
-    assert saved_balance.user_id == sample_balance.user_id
-    assert saved_balance.username == sample_balance.username
+    current = await balance_repository.increment("test_account_123", Decimal("1000.00"), sample_user, "tx1", NOW)
+
+    # Assert - Verify we can retrieve the current balance
+    saved_balance = await balance_repository.get("test_account_123")
+    assert saved_balance == current.balance
+    assert (current.events, current.transaction_events) == (1, {"tx1": 1})
+    assert saved_balance.account_id == "test_account_123"
+    assert saved_balance.balance == Decimal("1000.00")
+    assert saved_balance.user_id == sample_user.user_id
+    assert saved_balance.username == sample_user.username
     assert saved_balance.currency == "MXN"
+    assert saved_balance.created_at is not None
+    assert saved_balance.updated_at is not None
 
 @pytest.mark.asyncio
 async def test_get_nonexistent_balance(balance_repository):
@@ -70,77 +77,100 @@ async def test_get_nonexistent_balance(balance_repository):
     assert balance is None
 
 @pytest.mark.asyncio
-async def test_update_existing_balance(balance_repository, sample_balance):
+async def test_update_existing_balance(balance_repository, sample_user):
     # Arrange
-    await balance_repository.save(sample_balance)
-    
-    # Update the balance
-    updated_balance = BalanceModel(
-        account_id=sample_balance.account_id,
-        balance=Decimal("2000.00"),
-        currency="MXN",
-        user_id=sample_balance.user_id,
-        username=sample_balance.username,
-        created_at=sample_balance.created_at,
-        updated_at=datetime.now().isoformat()
-    )
+    await balance_repository.increment("test_account_123", Decimal("1000.00"), sample_user, "tx1", NOW)
 
     # Act
-    await balance_repository.save(updated_balance)
+    await balance_repository.increment("test_account_123", Decimal("1500.00"), sample_user, "tx2", NOW)
+    await balance_repository.increment("test_account_123", Decimal("-500.00"), sample_user, "tx3", NOW)
 
     # Assert
-    retrieved_balance = await balance_repository.get(sample_balance.account_id)
+    retrieved_balance = await balance_repository.get("test_account_123")
     assert retrieved_balance is not None
     assert retrieved_balance.balance == Decimal("2000.00")
-    assert retrieved_balance.updated_at is not None
 
 @pytest.mark.asyncio
-async def test_save_balance_with_decimal_precision(balance_repository):
-    # Arrange
-    balance = BalanceModel(
-        account_id="test_precision_account",
-        balance=Decimal("1000.45"),  # Test decimal precision
-        currency="MXN",
-        user_id=789,
-        username="precisionuser",
-        created_at=datetime.now().isoformat()
-    )
-
+async def test_increment_with_decimal_precision(balance_repository, sample_user):
     # Act
-    await balance_repository.save(balance)
+    await balance_repository.increment("test_precision_account", Decimal("1000.45"), sample_user, "tx1", NOW)
+    await balance_repository.increment("test_precision_account", Decimal("0.10"), sample_user, "tx2", NOW)
 
     # Assert
-    saved_balance = await balance_repository.get(balance.account_id)
+    saved_balance = await balance_repository.get("test_precision_account")
     assert saved_balance is not None
-    assert saved_balance.balance == Decimal("1000.45")
+    assert saved_balance.balance == Decimal("1000.55")
     assert isinstance(saved_balance.balance, Decimal)
 
 @pytest.mark.asyncio
-async def test_save_multiple_balances(balance_repository):
+async def test_increment_many_balances(balance_repository, sample_user):
     # Arrange
-    balances = [
-        BalanceModel(
-            account_id=f"test_account_{i}",
-            balance=Decimal(f"{i}000.00"),
-            currency="MXN",
-            user_id=i,  # Integer user_id
-            username=f"testuser_{i}",
-            created_at=datetime.now().isoformat()
-        )
-        for i in range(1, 4)  # Starting from 1 to avoid user_id 0
-    ]
+    increments = {f"test_account_{i}": ([(f"tx{i}", Decimal(f"{i}000.00"), NOW)], sample_user) for i in range(1, 4)}
+
+    # Act
+    await balance_repository.increment_many(increments)
+    await balance_repository.increment_many(
+        {account_id: ([(f"{transaction_id}b", amount, NOW) for transaction_id, amount, _ in transactions], user)
+         for account_id, (transactions, user) in increments.items()})
+
+    # Assert
+    saved_balances = await balance_repository.get_many(list(increments) + ["nonexistent_account"])
+    assert set(saved_balances) == set(increments)
+    for account_id, ([(_, amount, _)], _) in increments.items():
+        assert saved_balances[account_id].account_id == account_id
+        assert saved_balances[account_id].balance == amount * 2
+        assert isinstance(saved_balances[account_id].user_id, int)
+
+@pytest.mark.asyncio
+async def test_increment_skips_applied_transactions(in_memory_repository, sample_user):
+    # Arrange
+    await in_memory_repository.increment("acc1", Decimal("100.00"), sample_user, "tx1", NOW)
 
     # Act
-    for balance in balances:
-        await balance_repository.save(balance)
+    redelivered = await in_memory_repository.increment("acc1", Decimal("100.00"), sample_user, "tx1", NOW)
+    balances = await in_memory_repository.increment_many({
+        "acc1": ([("tx1", Decimal("100.00"), NOW), ("tx2", Decimal("-30.00"), LATER)], sample_user),
+        "acc2": ([("tx3", Decimal("5.00"), NOW)], sample_user)})
+
+    # Assert - only the new transactions changed the balances, each one keeps its event of the account
+    assert (redelivered.already_applied, redelivered.transaction_events) == ({"tx1"}, {"tx1": 1})
+    assert (balances["acc1"].already_applied, balances["acc2"].already_applied) == ({"tx1"}, set())
+    assert (balances["acc1"].balance.balance, balances["acc2"].balance.balance) == (Decimal("70.00"), Decimal("5.00"))
+    assert balances["acc1"].transaction_events == {"tx1": 1, "tx2": 2}
+    assert (balances["acc1"].events, balances["acc1"].last_timestamp) == (2, LATER)
+
+@pytest.mark.asyncio
+async def test_increment_keeps_the_last_applied_ids(in_memory_repository, sample_user, monkeypatch):
+    # Arrange
+    monkeypatch.setattr("app.db.balance.BalanceRepository.BALANCE_APPLIED_WINDOW", 2)
+
+    # Act
+    for i in range(1, 4):
+        current = await in_memory_repository.increment("acc1", Decimal("1.00"), sample_user, f"tx{i}", NOW)
 
     # Assert
-    for balance in balances:
-        saved_balance = await balance_repository.get(balance.account_id)
-        assert saved_balance is not None
-        assert saved_balance.account_id == balance.account_id
-        assert saved_balance.balance == balance.balance
-        assert isinstance(saved_balance.user_id, int)
+    balance = await BalanceRepository._client[MONGO_DB_NAME][settings.MONGO_CURRENT_BALANCE_COLLECTION].find_one(
+        {"_id": "acc1"})
+    assert balance["applied"] == ["tx2", "tx3"]
+    assert current.transaction_events == {"tx3": 3}
+
+@pytest.mark.asyncio
+async def test_save_balance_snapshot(balance_repository):
+    # Arrange
+    balance = BalanceModel(
+        account_id="test_account_123",
+        balance=Decimal("1000.00"),
+        currency="MXN",
+        user_id=456,
+        username="testuser",
+        created_at=datetime.now().isoformat()
+    )
+
+    # Act
+    await balance_repository.save(balance)
+
+    # Assert - snapshots don't change the current balance
+    assert await balance_repository.get(balance.account_id) is None
 
 @pytest.mark.asyncio
 async def test_invalid_user_id_type():
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock
+from app.db.BatchLoader import BatchLoader
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_are_batched():
+    # Arrange
+    batch_fn = AsyncMock(side_effect=lambda keys: {key: key.upper() for key in keys if key != "c"})
+    loader = BatchLoader(batch_fn, max_batch_size=10)
+
+    # Act
+    values = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"), loader.load("c"))
+
+    # Assert
+    assert values == ["A", "B", "A", None]
+    batch_fn.assert_called_once_with(["a", "b", "c"])
+
+@pytest.mark.asyncio
+async def test_batches_are_split_by_max_batch_size():
+    # Arrange
+    batch_fn = AsyncMock(side_effect=lambda keys: {key: key for key in keys})
+    loader = BatchLoader(batch_fn, max_batch_size=2)
+
+    # Act
+    values = await asyncio.gather(*(loader.load(key) for key in range(5)))
+
+    # Assert
+    assert values == [0, 1, 2, 3, 4]
+    assert [call.args[0] for call in batch_fn.call_args_list] == [[0, 1], [2, 3], [4]]
+
+@pytest.mark.asyncio
+async def test_load_of_key_being_read_shares_the_result():
+    # Arrange
+    started = asyncio.Event()
+
+    async def batch_fn(keys):
+        started.set()
+        await asyncio.sleep(0.01)
+        return {key: object() for key in keys}
+
+    loader = BatchLoader(batch_fn, max_batch_size=10)
+
+    # Act
+    first = asyncio.ensure_future(loader.load("a"))
+    await started.wait()
+    second = await loader.load("a")
+
+    # Assert
+    assert await first is second
+
+@pytest.mark.asyncio
+async def test_cancelled_load_does_not_cancel_the_others():
+    # Arrange
+    started = asyncio.Event()
+
+    async def batch_fn(keys):
+        started.set()
+        await asyncio.sleep(0.01)
+        return {key: key.upper() for key in keys}
+
+    loader = BatchLoader(batch_fn, max_batch_size=10)
+    first = asyncio.ensure_future(loader.load("a"))
+    second = asyncio.ensure_future(loader.load("a"))
+    await started.wait()
+
+    # Act
+    first.cancel()
+
+    # Assert
+    assert await second == "A"
+    assert first.cancelled()
+    assert await loader.load("a") == "A"
+
+@pytest.mark.asyncio
+async def test_error_fails_every_load_of_the_batch():
+    # Arrange
+    loader = BatchLoader(AsyncMock(side_effect=ConnectionError("down")), max_batch_size=10)
+
+    # Act
+    results = await asyncio.gather(loader.load("a"), loader.load("b"), return_exceptions=True)
+
+    # Assert
+    assert all(isinstance(result, ConnectionError) for result in results)
@@ -0,0 +1,119 @@
+"""Throughput and latency of the event handlers against the in-memory MongoDB of the common library, driven in-process
+through ASGI. The results are compared with tests/benchmark_baseline.json, set BENCHMARK_UPDATE_BASELINE=true to
+record a new baseline and run with -s to see the report"""
+import json
+import os
+from decimal import Decimal
+import pytest
+from httpx import ASGITransport, AsyncClient
+from com_ivansoft_corebank_lib.testing.benchmark import calibrate, check, run_benchmark
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from com_ivansoft_corebank_lib.mongo_indexes import ensure_indexes, verify_query_patterns
+from app.main import app
+from app.api.eventsource.v1.subscribers import get_account_service
+from app.config import settings
+from app.db.indexes import INDEXES, QUERY_PATTERNS
+from app.db.MongoBase import MongoBase
+# the database the repositories were imported with, other test modules change settings.MONGO_DB_NAME
+from app.db.balance.BalanceRepository import MONGO_DB_NAME
+from app.db.user.UserCache import UserCache
+from app.db.user.UserRepository import UserRepository
+from app.services.AccountService import AccountService
+from app.services.BalancePublisher import BalancePublisher
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+ACCOUNTS = 50
+SINGLE_EVENTS = 300
+BULK_MESSAGES = 20
+BULK_ENTRIES = 100
+
+
+def _transaction(i: int) -> dict:
+    return {
+        "id": f"tx{i}",
+        "account_id": f"acc{i % ACCOUNTS}",
+        "amount": 100.45,
+        "type": "DEPOSIT",
+        "status": "PENDING",
+        "description": "Deposit of $100.45",
+        "timestamp": f"2024-03-{i % 28 + 1:02d}T12:00:00Z",
+        "version": 1,
+    }
+
+
+def _cloud_event(i: int) -> dict:
+    return {
+        "specversion": "1.0",
+        "type": "com.dapr.event.sent",
+        "source": "benchmark",
+        "id": str(i),
+        "datacontenttype": "application/json",
+        "data": json.dumps(_transaction(i)),
+        "topic": "transactions",
+        "pubsubname": "eventsource",
+        "tracestate": "",
+        "traceid": "",
+    }
+
+
+@pytest.fixture
+async def mongo(monkeypatch):
+    client = InMemoryMongoClient()
+    # the client of every repository, none of them reaches a real MongoDB
+    monkeypatch.setattr(MongoBase, '_client', client)
+    monkeypatch.setattr(UserRepository, 'cache', UserCache(max_size=ACCOUNTS, missing_ttl=60))
+    # the queries run on the indexes the service declares, like they do in MongoDB
+    await ensure_indexes(client[MONGO_DB_NAME], INDEXES)
+    assert await verify_query_patterns(client[MONGO_DB_NAME], QUERY_PATTERNS) == []
+    await client[MONGO_DB_NAME][settings.MONGO_USER_COLLECTION].insert_many(
+        [{"user_id": i, "username": f"user{i}", "account_ids": [f"acc{i}"]} for i in range(ACCOUNTS)])
+    return client[MONGO_DB_NAME]
+
+
+@pytest.fixture
+async def client(mongo):
+    def get_benchmark_account_service():
+        service = AccountService()
+        # there is no sidecar to publish to
+        service.balance_publisher = BalancePublisher(enabled=False)
+        yield service
+
+    app.dependency_overrides[get_account_service] = get_benchmark_account_service
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test/mybank/subscriber/v1") as client:
+        yield client
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_handlers_benchmark(client, mongo):
+    async def single_event(i):
+        response = await client.post("/account_projections/handler", json=_cloud_event(i))
+        assert response.status_code == 200
+
+    async def bulk_message(i):
+        first = 100000 + i * BULK_ENTRIES
+        entries = [{"entryId": str(n), "contentType": "application/cloudevents+json", "event": _cloud_event(n)}
+                   for n in range(first, first + BULK_ENTRIES)]
+        response = await client.post("/account_projections/bulk_handler", json={"entries": entries})
+        assert all(status["status"] == "SUCCESS" for status in response.json()["statuses"])
+
+    async def redelivered_event(i):
+        response = await client.post("/account_projections/handler", json=_cloud_event(i % SINGLE_EVENTS))
+        assert response.json() == {"message": "Transaction already processed"}
+
+    calibration = calibrate()
+    results = [
+        await run_benchmark("single_handler_events", single_event, SINGLE_EVENTS, warmup=0),
+        await run_benchmark("bulk_handler_events", bulk_message, BULK_MESSAGES, BULK_ENTRIES, warmup=1),
+        await run_benchmark("redelivered_events", redelivered_event, SINGLE_EVENTS, warmup=0),
+    ]
+
+    # every event was applied once
+    events = SINGLE_EVENTS + (BULK_MESSAGES + 1) * BULK_ENTRIES
+    balance = await mongo[settings.MONGO_CURRENT_BALANCE_COLLECTION].find_one({"_id": "acc0"})
+    assert balance["balance"].to_decimal() == Decimal("100.45") * (events // ACCOUNTS)
+    assert balance["username"] == "user0"
+    assert await mongo[settings.MONGO_TRANSACTION_COLLECTION].count_documents({}) == events
+
+    regressions = check(results, BASELINE, calibration)
+    assert not regressions, regressions
@@ -0,0 +1,77 @@
+from app.services.ConcurrencyLimiter import ConcurrencyLimiter
+
+
+def _run(limiter, requests, latency, overloaded=False):
+    """Handle requests at once, all of them taking latency seconds"""
+    acquired = sum(limiter.try_acquire() for _ in range(requests))
+    for _ in range(acquired):
+        limiter.release(latency, overloaded)
+    return acquired
+
+def test_sheds_requests_over_the_limit():
+    # Arrange
+    limiter = ConcurrencyLimiter(initial_limit=4, min_limit=1, max_limit=10)
+
+    # Act
+    acquired = [limiter.try_acquire() for _ in range(6)]
+
+    # Assert
+    assert acquired == [True, True, True, True, False, False]
+    assert limiter.stats()["in_flight"] == 4 and limiter.stats()["shed"] == 2
+
+def test_limit_grows_while_in_use_up_to_max():
+    # Arrange
+    limiter = ConcurrencyLimiter(initial_limit=4, min_limit=1, max_limit=10)
+
+    # Act - the limit is saturated and the latency stays the same
+    for _ in range(5):
+        _run(limiter, 20, 0.01)
+
+    # Assert
+    assert limiter.limit == 10
+
+def test_limit_does_not_grow_while_idle():
+    # Arrange
+    limiter = ConcurrencyLimiter(initial_limit=8, min_limit=1, max_limit=100)
+
+    # Act - one request at a time
+    for _ in range(50):
+        _run(limiter, 1, 0.01)
+
+    # Assert
+    assert limiter.limit == 8
+
+def test_limit_decreases_when_latency_grows_or_overloaded():
+    # Arrange
+    limiter = ConcurrencyLimiter(initial_limit=64, min_limit=4, max_limit=256, tolerance=2, backoff_ratio=0.5)
+    _run(limiter, 64, 0.01)
+    limit = limiter.limit
+
+    # Act - MongoDB gets 10 times slower
+    _run(limiter, 4, 0.1)
+
+    # Assert
+    assert limiter.limit < limit
+
+    # Act - failures count as overload whatever their latency, the limit stops at min_limit
+    _run(limiter, 64, 0.01, overloaded=True)
+
+    # Assert
+    assert limiter.limit == 4
+
+def test_requests_without_latency_only_count_overload():
+    # Arrange
+    limiter = ConcurrencyLimiter(initial_limit=8, min_limit=1, max_limit=100, backoff_ratio=0.5)
+
+    # Act - e.g. deliveries answered without MongoDB operations
+    _run(limiter, 8, None)
+    limit = limiter.limit
+
+    # Assert - the limit is in use, it grows
+    assert limit > 8 and limiter.stats()["latency_ms"] is None
+
+    # Act
+    _run(limiter, 1, None, overloaded=True)
+
+    # Assert
+    assert limiter.limit == limit * 0.5
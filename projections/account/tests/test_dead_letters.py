@@ -0,0 +1,66 @@
+import json
+import pytest
+from unittest.mock import AsyncMock
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.admin.v1.dead_letters import router
+from app.api.eventsource.v1.subscribers import get_account_service
+from app.services.AccountService import AccountService
+
+
+def _dead_letter(event_id, transaction_data):
+    return {"_id": event_id, "status": "parked", "failures": 1, "error": "User for account not found",
+            "event": {"id": event_id, "specversion": "1.0", "type": "com.dapr.event.sent", "source": "test",
+                      "datacontenttype": "application/json", "data": json.dumps(transaction_data),
+                      "topic": "transactions", "pubsubname": "eventsource"}}
+
+@pytest.fixture
+def account_service():
+    service = AccountService()
+    service.apply_transactions = AsyncMock(return_value={"acc456": ValueError("User for account acc456 not found")})
+    service.dead_letter_repository.park = AsyncMock()
+    service.dead_letter_repository.mark_replayed = AsyncMock()
+    return service
+
+@pytest.fixture
+def client(account_service):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_account_service] = lambda: account_service
+    return TestClient(app)
+
+def test_replay_dead_letters(client, account_service):
+    # Arrange
+    transaction_data = {
+        "id": "tx123",
+        "account_id": "acc123",
+        "amount": 100.0,
+        "type": "DEPOSIT",
+        "status": "PENDING",
+        "description": "Deposit of $100",
+        "timestamp": "2024-03-20T12:00:00Z",
+        "version": 1,
+    }
+    account_service.dead_letter_repository.get_parked = AsyncMock(return_value=[
+        _dead_letter("1", transaction_data),
+        _dead_letter("2", {**transaction_data, "id": "tx456", "account_id": "acc456"}),
+        _dead_letter("3", {"account_id": "acc123"}),
+    ])
+
+    # Act
+    response = client.post("/dead_letters/replay", json={"ids": ["1", "2", "3"], "limit": 10})
+
+    # Assert - the applied event is marked as replayed, the failing ones are parked again with their new error
+    assert response.status_code == 200
+    assert response.json() == {"replayed": 1, "failed": 2, "retry": 0, "ids": ["1"]}
+    account_service.dead_letter_repository.get_parked.assert_called_once_with(10, ["1", "2", "3"])
+    account_service.dead_letter_repository.mark_replayed.assert_called_once_with(["1"])
+    parked = account_service.dead_letter_repository.park.call_args[0][0]
+    assert sorted(event_id for event_id, _, _ in parked) == ["2", "3"]
+
+def test_replay_dead_letters_limit(client):
+    # Act
+    response = client.post("/dead_letters/replay", json={"limit": 0})
+
+    # Assert
+    assert response.status_code == 422
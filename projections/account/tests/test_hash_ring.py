@@ -0,0 +1,37 @@
+import pytest
+from app.services.HashRing import HashRing
+
+
+def test_keys_are_spread_over_the_nodes():
+    # Arrange
+    ring = HashRing(range(4), vnodes=64)
+
+    # Act
+    nodes = [ring.node(f"acc{i}") for i in range(4000)]
+
+    # Assert - every node gets its share, within the variance of 64 points per node
+    assert ring.nodes == [0, 1, 2, 3]
+    assert all(600 < nodes.count(node) < 1400 for node in range(4))
+    assert [ring.node(f"acc{i}") for i in range(4000)] == nodes
+
+def test_removing_a_node_only_moves_its_keys():
+    # Arrange
+    ring = HashRing(range(4))
+    before = {f"acc{i}": ring.node(f"acc{i}") for i in range(1000)}
+
+    # Act
+    ring.remove(2)
+    after = {key: ring.node(key) for key in before}
+
+    # Assert
+    assert ring.nodes == [0, 1, 3]
+    assert all(after[key] == node for key, node in before.items() if node != 2)
+    assert 2 not in after.values()
+
+def test_empty_ring():
+    # Arrange
+    ring = HashRing([])
+
+    # Act / Assert
+    with pytest.raises(LookupError):
+        ring.node("acc1")
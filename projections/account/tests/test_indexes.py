@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.config import settings
+from com_ivansoft_corebank_lib.mongo_indexes import ensure_indexes, verify_query_patterns
+from app.db.indexes import INDEXES, QUERY_PATTERNS, SUPERSEDED_INDEXES
+
+
+def _database(index_information: dict):
+    """Mock database whose collections return the index information of index_information[collection]"""
+    collections = {}
+
+    def get_collection(name):
+        if name not in collections:
+            collection = MagicMock()
+            collection.index_information = AsyncMock(
+                return_value={'_id_': {'key': [('_id', 1)]}, **index_information.get(name, {})})
+            collection.create_indexes = AsyncMock()
+            collections[name] = collection
+        return collections[name]
+
+    database = MagicMock()
+    database.__getitem__.side_effect = get_collection
+    return database, get_collection
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_creates_missing():
+    # Arrange
+    database, collection = _database({
+        settings.MONGO_BALANCE_COLLECTION: {'account_id_updated_at': {'key': [('account_id', 1), ('updated_at', -1)]}},
+    })
+
+    # Act
+    await ensure_indexes(database, INDEXES)
+
+    # Assert
+    collection(settings.MONGO_BALANCE_COLLECTION).create_indexes.assert_not_called()
+    created = collection(settings.MONGO_TRANSACTION_COLLECTION).create_indexes.call_args[0][0]
+    assert [index.document['name'] for index in created] == ['account_id_timestamp_id', 'account_id_event']
+
+@pytest.mark.asyncio
+async def test_verify_query_patterns_reports_unsupported():
+    # Arrange - transactions, transaction buckets, users and dead letters only have the _id index
+    database, _ = _database({})
+
+    # Act
+    unsupported = await verify_query_patterns(database, QUERY_PATTERNS)
+
+    # Assert
+    assert unsupported == ['TransactionRepository.get_by_account_id', 'TransactionBucketRepository.save_many',
+                           'TransactionBucketRepository.get_by_account_id', 'UserRepository.find_many',
+                           'DeadLetterRepository.get_parked']
+
+@pytest.mark.asyncio
+async def test_verify_query_patterns_prefix_of_compound_index():
+    # Arrange
+    database, _ = _database({
+        settings.MONGO_TRANSACTION_COLLECTION: {'account_id_timestamp_id': {'key': [('account_id', 1), ('timestamp', 1), ('id', 1)]}},
+        settings.MONGO_TRANSACTION_BUCKET_COLLECTION: {'account_id_period_sequence': {
+            'key': [('account_id', 1), ('period', 1), ('sequence', 1)]}},
+        settings.MONGO_USER_COLLECTION: {'account_ids': {'key': [('account_ids', 1)]}},
+        settings.MONGO_DEAD_LETTER_COLLECTION: {'status_parked_at': {'key': [('status', 1), ('parked_at', 1)]}},
+    })
+
+    # Act
+    unsupported = await verify_query_patterns(database, QUERY_PATTERNS)
+
+    # Assert
+    assert unsupported == []
+
+def test_superseded_indexes_are_not_declared():
+    # Act / Assert - a declared index would be created and dropped on every startup
+    for collection, names in SUPERSEDED_INDEXES.items():
+        declared = {index.document['name'] for index in INDEXES[collection]}
+        assert not declared.intersection(names), collection
@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from app.services.KeyedExecutor import KeyedExecutor
+
+
+@pytest.fixture
+def executor():
+    return KeyedExecutor(lanes=4, queue_depth=10)
+
+@pytest.mark.asyncio
+async def test_same_key_runs_in_submission_order(executor):
+    # Arrange
+    applied = []
+
+    async def apply(value):
+        # later submissions finish their sleep first, ordering must still hold
+        await asyncio.sleep(0.01 / (value + 1))
+        applied.append(value)
+        return value
+
+    # Act
+    results = await asyncio.gather(*(executor.submit("acc123", lambda value=value: apply(value)) for value in range(5)))
+
+    # Assert
+    assert results == [0, 1, 2, 3, 4]
+    assert applied == [0, 1, 2, 3, 4]
+
+@pytest.mark.asyncio
+async def test_different_lanes_run_concurrently(executor):
+    # Arrange
+    keys = ["acc0", "acc1", "acc2", "acc3", "acc4", "acc5"]
+    keys_by_lane = {executor.lane(key): key for key in keys}
+    assert len(keys_by_lane) > 1
+    running = 0
+    max_running = 0
+
+    async def apply():
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    # Act
+    await asyncio.gather(*(executor.submit(key, apply) for key in keys_by_lane.values()))
+
+    # Assert
+    assert max_running == len(keys_by_lane)
+
+@pytest.mark.asyncio
+async def test_exception_is_raised_to_submitter(executor):
+    # Arrange
+    async def fail():
+        raise ValueError("Invalid transaction type")
+
+    async def succeed():
+        return "ok"
+
+    # Act & Assert - the lane keeps working after a failure
+    with pytest.raises(ValueError, match="Invalid transaction type"):
+        await executor.submit("acc123", fail)
+    assert await executor.submit("acc123", succeed) == "ok"
+
+@pytest.mark.asyncio
+async def test_queue_depth_bounds_waiting_work():
+    # Arrange
+    executor = KeyedExecutor(lanes=1, queue_depth=2)
+    release = asyncio.Event()
+    started = []
+
+    async def apply(value):
+        started.append(value)
+        await release.wait()
+
+    # Act - the third submission waits for room before being queued
+    tasks = [asyncio.create_task(executor.submit("acc123", lambda value=value: apply(value))) for value in range(3)]
+    await asyncio.sleep(0.01)
+    lane = executor._lanes[0]
+    waiting_for_room = len(lane.slots._waiters or [])
+    release.set()
+    await asyncio.gather(*tasks)
+
+    # Assert
+    assert waiting_for_room == 1
+    assert started == [0, 1, 2]
+
+def test_partition_keeps_order_by_lane(executor):
+    # Arrange
+    items = [("acc1", 1), ("acc2", 2), ("acc1", 3), ("acc3", 4), ("acc2", 5)]
+
+    # Act
+    partitions = executor.partition(items, key=lambda item: item[0])
+
+    # Assert
+    assert sorted(item for partition in partitions for item in partition) == sorted(items)
+    for partition in partitions:
+        assert len({executor.lane(key) for key, _ in partition}) == 1
+        assert [value for _, value in partition] == sorted(value for _, value in partition)
@@ -0,0 +1,92 @@
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from bson.decimal128 import Decimal128
+from app.config import settings
+from app.migrate import migrate_field, _to_decimal128
+from app.migrate_transactions import to_buckets, to_documents
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from com_ivansoft_corebank_lib.timestamp import parse_timestamp
+
+
+def _database(documents: list[dict]):
+    """Mock database whose collection finds documents"""
+    async def find(*args, **kwargs):
+        for document in documents:
+            yield document
+
+    collection = MagicMock()
+    collection.find.side_effect = find
+    collection.bulk_write = AsyncMock(side_effect=lambda operations, ordered: MagicMock(modified_count=len(operations)))
+    database = MagicMock()
+    database.__getitem__.return_value = collection
+    return database, collection
+
+@pytest.mark.asyncio
+async def test_migrate_amounts():
+    # Arrange
+    database, collection = _database([{'_id': 'tx1', 'amount': 100.45}, {'_id': 'tx2', 'amount': '5'},
+                                      {'_id': 'tx3', 'amount': 7}])
+
+    # Act
+    migrated = await migrate_field(database, 'transactions', 'amount', ['double'], _to_decimal128, batch_size=2)
+
+    # Assert
+    assert migrated == 3
+    assert collection.bulk_write.call_count == 2
+    operations = [operation for call in collection.bulk_write.call_args_list for operation in call.args[0]]
+    # the update only applies if the document still has the old value
+    assert operations[0]._filter == {'_id': 'tx1', 'amount': 100.45}
+    assert [operation._doc['$set']['amount'] for operation in operations] == \
+        [Decimal128('100.45'), Decimal128('5'), Decimal128('7')]
+
+@pytest.mark.asyncio
+async def test_migrate_skips_invalid_values():
+    # Arrange
+    database, collection = _database([{'_id': 'tx1', 'timestamp': 'yesterday'},
+                                      {'_id': 'tx2', 'timestamp': '2024-03-20T12:00:00'}])
+
+    # Act
+    migrated = await migrate_field(database, 'transactions', 'timestamp', ['string'], parse_timestamp, batch_size=10)
+
+    # Assert
+    assert migrated == 1
+    operations = collection.bulk_write.call_args.args[0]
+    assert [operation._doc['$set']['timestamp'] for operation in operations] == [datetime(2024, 3, 20, 12, 0)]
+
+@pytest.mark.asyncio
+async def test_migrate_transactions_to_buckets_and_back():
+    # Arrange
+    database = InMemoryMongoClient()['testdb']
+    documents = [{'_id': f'tx{i}', 'id': f'tx{i}', 'account_id': f'acc{i % 2}', 'amount': Decimal128('100.45'),
+                  'type': 'DEPOSIT' if i < 4 else 'WITHDRAWAL', 'status': 'PENDING', 'description': 'Deposit',
+                  'timestamp': datetime(2024, 3 if i < 5 else 4, 20, 12, i), 'version': 1} for i in range(6)]
+    await database[settings.MONGO_TRANSACTION_COLLECTION].insert_many(documents)
+
+    # Act
+    buckets = await to_buckets(database, batch_size=2, bucket_size=2, granularity=RollupGranularity.MONTH)
+    await database.drop_collection(settings.MONGO_TRANSACTION_COLLECTION)
+    transactions = await to_documents(database, batch_size=4)
+
+    # Assert
+    stored = await database[settings.MONGO_TRANSACTION_BUCKET_COLLECTION].find({}).sort('_id', 1).to_list(None)
+    assert buckets == 4
+    assert [(bucket['_id'], bucket['count']) for bucket in stored] == [
+        ('acc0:2024-03:0', 2), ('acc0:2024-03:1', 1), ('acc1:2024-03:0', 2), ('acc1:2024-04:0', 1)]
+    assert (stored[1]['deposits'], stored[1]['withdrawals']) == (Decimal128('0'), Decimal128('100.45'))
+    assert transactions == 6
+    assert await database[settings.MONGO_TRANSACTION_COLLECTION].find({}).sort('_id', 1).to_list(None) == documents
+
+@pytest.mark.asyncio
+async def test_migrate_transactions_to_buckets_requires_date_timestamps():
+    # Arrange
+    database = InMemoryMongoClient()['testdb']
+    await database[settings.MONGO_TRANSACTION_COLLECTION].insert_many([
+        {'_id': 'tx1', 'id': 'tx1', 'account_id': 'acc1', 'timestamp': datetime(2024, 3, 20, 12)},
+        {'_id': 'tx2', 'id': 'tx2', 'account_id': 'acc1', 'timestamp': '2024-03-21T12:00:00'}])
+
+    # Act / Assert
+    with pytest.raises(ValueError, match='tx2'):
+        await to_buckets(database, batch_size=2)
+    assert await database[settings.MONGO_TRANSACTION_BUCKET_COLLECTION].count_documents({}) == 0
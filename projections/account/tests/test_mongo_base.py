@@ -0,0 +1,39 @@
+import pytest
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+import app.db.MongoBase as mongo_base_module
+from app.db.MongoBase import MongoBase
+from app.db.balance.BalanceRepository import BalanceRepository
+
+@pytest.fixture
+def settings(monkeypatch):
+    def set_settings(**values):
+        for name, value in values.items():
+            monkeypatch.setattr(mongo_base_module, name, value)
+    return set_settings
+
+def test_options_from_settings(settings):
+    # Arrange
+    settings(MONGO_MAX_POOL_SIZE=20, MONGO_MIN_POOL_SIZE=5, MONGO_WAIT_QUEUE_TIMEOUT_MS="2000",
+             MONGO_COMPRESSORS="zstd,zlib", MONGO_WRITE_CONCERN_W="2", MONGO_WRITE_CONCERN_JOURNAL="true",
+             MONGO_WRITE_CONCERN_TIMEOUT_MS=None)
+
+    # Act
+    options = MongoBase.options()
+
+    # Assert - unset options are left to the driver defaults
+    assert options == {"maxPoolSize": 20, "minPoolSize": 5, "waitQueueTimeoutMS": 2000, "compressors": "zstd,zlib",
+                       "w": 2, "journal": True}
+
+def test_write_concern_tag_set(settings):
+    settings(MONGO_WRITE_CONCERN_W="majority")
+
+    assert MongoBase.options()["w"] == "majority"
+
+def test_repositories_use_the_client_of_mongo_base(monkeypatch):
+    # Arrange
+    client = InMemoryMongoClient()
+    monkeypatch.setattr(MongoBase, "_client", client)
+
+    # Act & Assert - resolved when used, not when the repository was imported
+    assert BalanceRepository._client is client
+    assert BalanceRepository()._client is client
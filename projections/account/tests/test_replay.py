@@ -0,0 +1,77 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.replay import read_batches, replay
+from com_ivansoft_corebank_lib.models.Transaction import TransactionType
+
+
+def _transaction(tx_id, account_id="acc123"):
+    return {
+        "id": tx_id,
+        "account_id": account_id,
+        "amount": 100.0,
+        "type": TransactionType.DEPOSIT,
+        "status": "PENDING",
+        "description": "Deposit of $100",
+        "timestamp": "2024-03-20T12:00:00Z",
+        "version": 1,
+    }
+
+@pytest.fixture
+def archive(tmp_path):
+    # events as transactions and as the CloudEvents Dapr delivers, with an invalid line
+    lines = [
+        json.dumps(_transaction("tx1")),
+        json.dumps({"id": "1", "topic": "transactions", "data": json.dumps(_transaction("tx2", "acc456"))}),
+        "{not json",
+        "",
+        json.dumps(_transaction("tx3")),
+    ]
+    path = tmp_path / "events.jsonl"
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+def test_read_batches(archive):
+    # Act
+    batches = list(read_batches(str(archive), 0, 2))
+
+    # Assert
+    assert [[tx.id for tx in transactions] for transactions, _, _ in batches] == [["tx1", "tx2"], ["tx3"]]
+    assert [invalid for _, invalid, _ in batches] == [0, 1]
+    assert batches[-1][2] == archive.stat().st_size
+
+    # the offset of a batch resumes after it
+    resumed = list(read_batches(str(archive), batches[0][2], 2))
+    assert [[tx.id for tx in transactions] for transactions, _, _ in resumed] == [["tx3"]]
+
+@pytest.mark.asyncio
+async def test_replay_resumes_from_checkpoint(archive, tmp_path):
+    # Arrange
+    checkpoint = tmp_path / "events.checkpoint"
+    with patch('app.replay.AccountService') as account_service_class:
+        account_service = account_service_class.return_value
+        account_service.apply_transactions = AsyncMock(return_value=set())
+
+        # Act - the first replay is interrupted after its first batch
+        account_service.apply_transactions.side_effect = [set(), KeyboardInterrupt()]
+        with pytest.raises(KeyboardInterrupt):
+            await replay(str(archive), str(checkpoint), 2)
+        account_service.apply_transactions.side_effect = None
+        account_service.apply_transactions.reset_mock()
+        not_applied = await replay(str(archive), str(checkpoint), 2)
+
+    # Assert
+    applied = [tx.id for call in account_service.apply_transactions.call_args_list for tx in call.args[0]]
+    assert applied == ["tx3"]
+    assert not_applied == 1
+    assert json.loads(checkpoint.read_text())["events"] == 3
+
+@pytest.mark.asyncio
+async def test_replay_counts_failed_accounts(archive, tmp_path):
+    with patch('app.replay.AccountService') as account_service_class:
+        account_service_class.return_value.apply_transactions = AsyncMock(side_effect=[{"acc456"}, set()])
+
+        not_applied = await replay(str(archive), str(tmp_path / "events.checkpoint"), 2)
+
+    # tx2 of the failed account and the invalid line
+    assert not_applied == 2
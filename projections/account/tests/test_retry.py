@@ -0,0 +1,131 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from functools import partial
+from unittest.mock import AsyncMock, patch
+from pymongo.errors import AutoReconnect
+from com_ivansoft_corebank_lib.models.Transaction import Transaction, TransactionType
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from app.config import settings
+# the database the repositories were imported with, other test modules change settings.MONGO_DB_NAME
+from app.db.balance.BalanceRepository import BalanceRepository, MONGO_DB_NAME
+from app.db.checkpoint.CheckpointRepository import CheckpointRepository
+from app.db.processed_event.ProcessedEventRepository import ProcessedEventRepository
+from app.db.rollup.RollupRepository import RollupRepository
+from app.db.transaction.TransactionRepository import TransactionRepository
+from app.db.user.UserCache import UserCache
+from app.db.user.UserRepository import UserRepository
+from app.services.AccountService import AccountService
+from app.services.BalancePublisher import BalancePublisher
+from app.services.retry import backoff_seconds, is_permanent, retry_transient
+
+
+def test_is_permanent():
+    # Assert
+    assert is_permanent(ValueError("User for account acc123 not found"))
+    assert is_permanent(KeyError("data"))
+    assert not is_permanent(AutoReconnect("connection refused"))
+    assert not is_permanent(TimeoutError())
+
+def test_backoff_is_exponential_and_bounded():
+    # Act
+    with patch('app.services.retry.random.uniform', return_value=1):
+        delays = [backoff_seconds(attempt, backoff_ms=50, max_backoff_ms=300) for attempt in range(5)]
+
+    # Assert
+    assert delays == [0.05, 0.1, 0.2, 0.3, 0.3]
+
+@pytest.mark.asyncio
+async def test_retry_transient_gives_up_after_attempts():
+    # Arrange
+    fn = AsyncMock(side_effect=AutoReconnect("connection refused"))
+
+    # Act
+    with patch('app.services.retry.asyncio.sleep', new=AsyncMock()) as sleep:
+        with pytest.raises(AutoReconnect):
+            await retry_transient(fn, attempts=3)
+
+    # Assert
+    assert fn.call_count == 4
+    assert sleep.call_count == 3
+
+@pytest.mark.asyncio
+async def test_retry_transient_raises_permanent_errors_at_once():
+    # Arrange
+    fn = AsyncMock(side_effect=ValueError("Invalid transaction type"))
+
+    # Act
+    with patch('app.services.retry.asyncio.sleep', new=AsyncMock()) as sleep:
+        with pytest.raises(ValueError):
+            await retry_transient(fn, attempts=3)
+
+    # Assert
+    assert fn.call_count == 1
+    sleep.assert_not_called()
+
+@pytest.fixture
+async def account_service(monkeypatch):
+    client = InMemoryMongoClient()
+    for repository in (BalanceRepository, TransactionRepository, ProcessedEventRepository, RollupRepository,
+                       CheckpointRepository, UserRepository):
+        monkeypatch.setattr(repository, '_client', client)
+    monkeypatch.setattr(UserRepository, 'cache', UserCache(max_size=10, missing_ttl=60))
+    await client[MONGO_DB_NAME][settings.MONGO_USER_COLLECTION].insert_one(
+        {"user_id": 1, "username": "alice", "account_ids": ["acc1"]})
+    service = AccountService()
+    service.balance_publisher = BalancePublisher(enabled=False)
+    return service
+
+def _fail_once_after(fn):
+    """fn runs, then the first call raises as if its acknowledgement was lost"""
+    calls = []
+
+    async def wrapper(*args, **kwargs):
+        result = await fn(*args, **kwargs)
+        calls.append(args)
+        if len(calls) == 1:
+            raise AutoReconnect("connection reset")
+        return result
+    return wrapper
+
+async def _document(collection, _id):
+    return await BalanceRepository._client[MONGO_DB_NAME][collection].find_one({"_id": _id})
+
+def _deposit(tx_id):
+    return Transaction(id=tx_id, account_id="acc1", amount=100, type=TransactionType.DEPOSIT, status="PENDING",
+                       description="Deposit of $100", timestamp=datetime(2024, 3, 20, 12), version=1)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("method", ["increment", "save_many"])
+async def test_retried_transaction_is_applied_once(account_service, method):
+    # Arrange - the balance was written when the error is raised
+    repository = account_service.balance_repository
+    setattr(repository, method, _fail_once_after(getattr(repository, method)))
+
+    # Act
+    with patch('app.services.retry.asyncio.sleep', new=AsyncMock()):
+        await retry_transient(partial(account_service.process_transaction, _deposit("tx1")))
+
+    # Assert
+    assert (await account_service.balance_repository.get("acc1")).balance == Decimal(100)
+    assert (await _document(settings.MONGO_CURRENT_BALANCE_COLLECTION, "acc1"))["events"] == 1
+    assert (await _document(settings.MONGO_TRANSACTION_COLLECTION, "tx1"))["event"] == 1
+
+@pytest.mark.asyncio
+async def test_retried_batch_is_applied_once(account_service):
+    # Arrange - the balances were written when the error is raised
+    repository = account_service.processed_event_repository
+    repository.mark_processed = _fail_once_after(repository.mark_processed)
+    balances = account_service.balance_repository
+    balances.increment_many = _fail_once_after(balances.increment_many)
+
+    # Act
+    with patch('app.services.retry.asyncio.sleep', new=AsyncMock()):
+        await retry_transient(partial(account_service.apply_transactions, [_deposit("tx1"), _deposit("tx2")]))
+        await retry_transient(partial(account_service.apply_transactions, [_deposit("tx2"), _deposit("tx3")]))
+
+    # Assert
+    assert (await account_service.balance_repository.get("acc1")).balance == Decimal(300)
+    assert (await _document(settings.MONGO_CURRENT_BALANCE_COLLECTION, "acc1"))["events"] == 3
+    assert [(await _document(settings.MONGO_TRANSACTION_COLLECTION, tx_id))["event"]
+            for tx_id in ("tx1", "tx2", "tx3")] == [1, 2, 3]
@@ -0,0 +1,53 @@
+import pytest
+from datetime import datetime
+from decimal import Decimal
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from app.config import settings
+from app.db.rollup.RollupRepository import RollupRepository, MONGO_DB_NAME
+
+KEY = ("acc1", RollupGranularity.MONTH, "2024-03")
+
+
+def _totals(amount: str, closing_balance: str, last_timestamp: datetime) -> dict:
+    return {"count": 1, "deposits": Decimal(amount), "withdrawals": Decimal(0),
+            "closing_balance": Decimal(closing_balance), "last_timestamp": last_timestamp}
+
+
+@pytest.fixture
+async def rollups(monkeypatch):
+    client = InMemoryMongoClient()
+    monkeypatch.setattr(RollupRepository, '_client', client)
+    return client[MONGO_DB_NAME][settings.MONGO_ROLLUP_COLLECTION]
+
+@pytest.mark.asyncio
+async def test_increments_and_closing_balance_of_newest_transaction(rollups):
+    # Arrange
+    repository = RollupRepository()
+
+    # Act
+    await repository.increment_many({KEY: _totals("100", "1100", datetime(2024, 3, 30))})
+    await repository.increment_many({KEY: _totals("50", "1150", datetime(2024, 3, 31))})
+
+    # Assert
+    rollup = await rollups.find_one({"_id": "acc1:month:2024-03"})
+    assert rollup["count"] == 2
+    assert rollup["deposits"].to_decimal() == Decimal("150")
+    assert rollup["closing_balance"].to_decimal() == Decimal("1150")
+    assert rollup["last_timestamp"] == datetime(2024, 3, 31)
+
+@pytest.mark.asyncio
+async def test_late_transaction_keeps_the_closing_balance(rollups):
+    # Arrange - the balance after the newest transaction of the month is 1100
+    repository = RollupRepository()
+    await repository.increment_many({KEY: _totals("100", "1100", datetime(2024, 3, 31))})
+
+    # Act - a March transaction delivered late, its balance includes the newer transactions
+    await repository.increment_many({KEY: _totals("50", "1500", datetime(2024, 3, 30))})
+
+    # Assert
+    rollup = await rollups.find_one({"_id": "acc1:month:2024-03"})
+    assert rollup["count"] == 2
+    assert rollup["deposits"].to_decimal() == Decimal("150")
+    assert rollup["closing_balance"].to_decimal() == Decimal("1100")
+    assert rollup["last_timestamp"] == datetime(2024, 3, 31)
@@ -1,11 +1,14 @@
+import asyncio
 import pytest
 from fastapi.testclient import TestClient
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 from decimal import Decimal
 from app.api.eventsource.v1.subscribers import router, get_account_service
 from app.api.schemas.CloudEventModel import CloudEventModel
 from app.services.AccountService import AccountService
 from com_ivansoft_corebank_lib.models.Transaction import TransactionType
+from com_ivansoft_corebank_lib.metrics import timed
+from pymongo.errors import AutoReconnect
 import json
 
 @pytest.fixture
@@ -13,6 +16,11 @@ def mock_account_service():
     service = AccountService()
     service.update_balance = AsyncMock()
     service.save_transaction = AsyncMock()
+    service.update_rollups = AsyncMock()
+    service.update_checkpoints = AsyncMock()
+    service.processed_event_repository.get_processed = AsyncMock(return_value=set())
+    service.processed_event_repository.mark_processed = AsyncMock()
+    service.dead_letter_repository.park = AsyncMock()
     return service
 
 @pytest.fixture
@@ -26,6 +34,12 @@ def test_app():
         service = AccountService()
         service.update_balance = AsyncMock()
         service.save_transaction = AsyncMock()
+        service.update_rollups = AsyncMock()
+        service.update_checkpoints = AsyncMock()
+        service.processed_event_repository.get_processed = AsyncMock(return_value=set())
+        service.processed_event_repository.mark_processed = AsyncMock()
+        service.apply_transactions = AsyncMock(return_value={"acc456": ValueError("User for account acc456 not found")})
+        service.dead_letter_repository.park = AsyncMock()
         return service
     
     app.dependency_overrides[get_account_service] = override_get_account_service
@@ -68,6 +82,42 @@ def test_account_projections_handler_success(client):
     assert response.status_code == 200
     assert response.json() == {"message": "Projections processed successfully"}
 
+@pytest.mark.asyncio
+async def test_account_projections_handler_duplicate_event(mock_account_service):
+    # Arrange
+    transaction_data = {
+        "id": "tx123",
+        "account_id": "acc123",
+        "amount": 100.0,
+        "type": TransactionType.DEPOSIT,
+        "status": "PENDING",
+        "description": "Deposit of $100",
+        "timestamp": "2024-03-20T12:00:00Z",
+        "version": 1,
+    }
+    cloud_event = CloudEventModel(
+        specversion="1.0",
+        type="com.dapr.event.sent",
+        source="test",
+        id="123",
+        datacontenttype="application/json",
+        data=json.dumps(transaction_data),
+        topic="transaction",
+        pubsubname="eventsource",
+        tracestate="test",
+        traceid="test",
+    )
+    mock_account_service.processed_event_repository.get_processed.return_value = {"tx123"}
+
+    # Act
+    from app.api.eventsource.v1.subscribers import account_projections_handler
+    response = await account_projections_handler(cloud_event, mock_account_service)
+
+    # Assert
+    assert response == {"message": "Transaction already processed"}
+    mock_account_service.update_balance.assert_not_called()
+    mock_account_service.save_transaction.assert_not_called()
+
 def test_account_projections_handler_invalid_transaction_data(client):
     # Arrange
     invalid_transaction_data = {
@@ -89,10 +139,12 @@ def test_account_projections_handler_invalid_transaction_data(client):
         "traceid": "test",
     }
 
-    # this will fail due pydantic validation, so we expect an exception not a 422
-    with pytest.raises(Exception):
-        # Act
-        client.post("/account_projections/handler", json=cloud_event)
+    # Act
+    response = client.post("/account_projections/handler", json=cloud_event)
+
+    # Assert - the pydantic validation will fail on every redelivery, so the event is parked and dropped
+    assert response.status_code == 200
+    assert response.json() == {"status": "DROP"}
 
 
 @pytest.mark.asyncio
@@ -128,11 +180,9 @@ async def test_account_projections_handler_service_integration(mock_account_serv
         await account_projections_handler(cloud_event, mock_account_service)
 
     # Assert
-    mock_account_service.update_balance.assert_called_once_with(
-        "acc123",
-        Decimal("100.0"),
-        TransactionType.DEPOSIT
-    )
+    (transaction,) = mock_account_service.update_balance.call_args[0]
+    assert (transaction.account_id, transaction.amount, transaction.type, transaction.id) == \
+        ("acc123", Decimal("100.0"), TransactionType.DEPOSIT, "tx123")
     mock_account_service.save_transaction.assert_called_once()
 
 @pytest.mark.asyncio
@@ -168,8 +218,220 @@ async def test_account_projections_handler_decimal_precision(mock_account_servic
         await account_projections_handler(cloud_event, mock_account_service)
 
     # Assert
-    mock_account_service.update_balance.assert_called_once_with(
-        "acc123",
-        100.45,
-        TransactionType.DEPOSIT
+    (transaction,) = mock_account_service.update_balance.call_args[0]
+    assert (transaction.account_id, transaction.amount, transaction.type, transaction.id) == \
+        ("acc123", Decimal("100.45"), TransactionType.DEPOSIT, "tx123")
+
+@pytest.mark.asyncio
+async def test_account_projections_handler_retries_transient_errors(mock_account_service):
+    # Arrange
+    transaction_data = {
+        "id": "tx123",
+        "account_id": "acc123",
+        "amount": 100.0,
+        "type": TransactionType.DEPOSIT,
+        "status": "PENDING",
+        "description": "Deposit of $100",
+        "timestamp": "2024-03-20T12:00:00Z",
+        "version": 1,
+    }
+    cloud_event = CloudEventModel(
+        specversion="1.0",
+        type="com.dapr.event.sent",
+        source="test",
+        id="123",
+        datacontenttype="application/json",
+        data=json.dumps(transaction_data),
+        topic="transaction",
+        pubsubname="eventsource",
+        tracestate="test",
+        traceid="test",
+    )
+    mock_account_service.update_balance.side_effect = [AutoReconnect("connection refused"), MagicMock()]
+
+    # Act
+    from app.api.eventsource.v1.subscribers import account_projections_handler
+    with patch('app.services.retry.asyncio.sleep', new=AsyncMock()) as sleep:
+        response = await account_projections_handler(cloud_event, mock_account_service)
+
+    # Assert - applied on the second attempt, recorded once
+    assert response == {"message": "Projections processed successfully"}
+    assert mock_account_service.update_balance.call_count == 2
+    mock_account_service.processed_event_repository.mark_processed.assert_called_once_with([("tx123", "acc123")])
+    sleep.assert_called_once()
+    mock_account_service.dead_letter_repository.park.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_account_projections_handler_parks_permanent_errors(mock_account_service):
+    # Arrange
+    transaction_data = {
+        "id": "tx123",
+        "account_id": "acc123",
+        "amount": 100.0,
+        "type": TransactionType.DEPOSIT,
+        "status": "PENDING",
+        "description": "Deposit of $100",
+        "timestamp": "2024-03-20T12:00:00Z",
+        "version": 1,
+    }
+    cloud_event = CloudEventModel(
+        specversion="1.0",
+        type="com.dapr.event.sent",
+        source="test",
+        id="123",
+        datacontenttype="application/json",
+        data=json.dumps(transaction_data),
+        topic="transaction",
+        pubsubname="eventsource",
+        tracestate="test",
+        traceid="test",
     )
+    mock_account_service.update_balance.side_effect = ValueError("User for account acc123 not found")
+
+    # Act
+    from app.api.eventsource.v1.subscribers import account_projections_handler
+    response = await account_projections_handler(cloud_event, mock_account_service)
+
+    # Assert - not retried, parked with the original CloudEvent
+    assert response == {"status": "DROP"}
+    assert mock_account_service.update_balance.call_count == 1
+    ((event_id, event, error),) = mock_account_service.dead_letter_repository.park.call_args[0][0]
+    assert event_id == "123" and event == cloud_event.model_dump() and isinstance(error, ValueError)
+
+    # Act - the dead letter collection is unavailable, the event is redelivered instead of lost
+    mock_account_service.dead_letter_repository.park.side_effect = AutoReconnect("connection refused")
+    response = await account_projections_handler(cloud_event, mock_account_service)
+
+    # Assert
+    assert response == {"status": "RETRY"}
+
+def _bulk_entry(entry_id, transaction_data):
+    return {
+        "entryId": entry_id,
+        "contentType": "application/cloudevents+json",
+        "event": {
+            "specversion": "1.0",
+            "type": "com.dapr.event.sent",
+            "source": "test",
+            "id": entry_id,
+            "datacontenttype": "application/json",
+            "data": json.dumps(transaction_data),
+            "topic": "transactions",
+            "pubsubname": "eventsource",
+        },
+    }
+
+def test_account_projections_bulk_handler_statuses(client):
+    # Arrange
+    transaction_data = {
+        "id": "tx123",
+        "account_id": "acc123",
+        "amount": 100.0,
+        "type": TransactionType.DEPOSIT,
+        "status": "PENDING",
+        "description": "Deposit of $100",
+        "timestamp": "2024-03-20T12:00:00Z",
+        "version": 1,
+    }
+    bulk_message = {
+        "id": "bulk1",
+        "topic": "transactions",
+        "pubsubname": "eventsource",
+        "entries": [
+            _bulk_entry("1", transaction_data),
+            _bulk_entry("2", {**transaction_data, "id": "tx456", "account_id": "acc456"}),
+            # missing required fields
+            _bulk_entry("3", {"account_id": "acc123"}),
+        ],
+    }
+
+    # Act
+    response = client.post("/account_projections/bulk_handler", json=bulk_message)
+
+    # Assert
+    assert response.status_code == 200
+    assert response.json() == {"statuses": [
+        {"entryId": "1", "status": "SUCCESS"},
+        {"entryId": "2", "status": "DROP"},
+        {"entryId": "3", "status": "DROP"},
+    ]}
+
+def test_account_projections_bulk_handler_sheds_over_the_limit(client):
+    # Arrange - the limit is in use by other deliveries
+    from app.api.eventsource.v1.subscribers import limiter
+    bulk_message = {"entries": [_bulk_entry("1", {"account_id": "acc123"})]}
+
+    # Act
+    with patch.object(limiter, 'limit', 1), patch.object(limiter, 'in_flight', 1):
+        response = client.post("/account_projections/bulk_handler", json=bulk_message)
+
+    # Assert - Dapr redelivers the entries of a failed bulk request
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "1"
+
+class SlowRepository:
+    @timed
+    async def get(self):
+        await asyncio.sleep(0.01)
+
+def test_limiter_gets_the_latency_of_the_mongo_operations(test_app):
+    # Arrange - the delivery backs off before its MongoDB operation succeeds
+    from app.api.eventsource.v1.subscribers import limiter
+    service = AccountService()
+
+    async def apply_transactions(transactions):
+        await asyncio.sleep(0.2)
+        await SlowRepository().get()
+        return {}
+    service.apply_transactions = apply_transactions
+    test_app.dependency_overrides[get_account_service] = lambda: service
+    bulk_message = {"entries": [_bulk_entry("1", {"id": "tx1", "account_id": "acc123", "amount": 100.0,
+                                                  "type": "DEPOSIT", "status": "PENDING", "description": "Deposit",
+                                                  "timestamp": "2024-03-20T12:00:00Z", "version": 1})]}
+
+    # Act
+    with patch.object(limiter, 'release', wraps=limiter.release) as release:
+        response = TestClient(test_app).post("/account_projections/bulk_handler", json=bulk_message)
+
+    # Assert - without the backoff
+    assert response.json() == {"statuses": [{"entryId": "1", "status": "SUCCESS"}]}
+    assert 0.01 <= release.call_args[0][0] < 0.2
+
+def test_routing_key():
+    from app.api.eventsource.v1.subscribers import routing_key
+    transaction_data = {"id": "tx123", "account_id": "acc123", "amount": 100.0}
+
+    # Assert - the account id of the data string, object or escaped in a CloudEvent string
+    assert routing_key("1", _bulk_entry("1", transaction_data)["event"]) == "acc123"
+    assert routing_key("1", {"data": transaction_data}) == "acc123"
+    assert routing_key("1", json.dumps({"data": json.dumps(transaction_data)})) == "acc123"
+    # invalid events are routed by entry id
+    assert routing_key("1", {"data": "not json"}) == "1"
+
+def test_metrics_endpoint():
+    from app.main import app
+    client = TestClient(app)
+
+    # Act
+    client.get("/")
+    response = client.get("/metrics")
+
+    # Assert
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/",status="200"}' in response.text
+    assert "projection_lag_seconds_bucket" in response.text
+
+def test_logging_endpoint():
+    from app.main import app
+    client = TestClient(app)
+
+    # Act
+    response = client.put("/debug/logging", params={"level": "warning", "sample_rate": 0.25})
+    invalid = client.put("/debug/logging", params={"level": "verbose"})
+    client.put("/debug/logging", params={"level": "info", "sample_rate": 1})
+
+    # Assert
+    assert response.status_code == 200
+    assert response.json()["level"] == "warning" and response.json()["sample_rate"] == 0.25
+    assert invalid.status_code == 400
+    assert client.get("/debug/logging").json()["level"] == "info"
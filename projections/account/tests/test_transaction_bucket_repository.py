@@ -0,0 +1,98 @@
+import pytest
+from datetime import datetime
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from com_ivansoft_corebank_lib.models.Transaction import Transaction, TransactionType
+from app.config import settings
+from app.db.transaction import TransactionBucketRepository as bucket_repository_module
+from app.db.transaction.TransactionBucketRepository import TransactionBucketRepository, MONGO_DB_NAME
+from app.db.indexes import INDEXES
+
+
+@pytest.fixture
+async def buckets(monkeypatch):
+    client = InMemoryMongoClient()
+    monkeypatch.setattr(TransactionBucketRepository, '_client', client)
+    monkeypatch.setattr(bucket_repository_module, 'TRANSACTION_BUCKET_SIZE', 2)
+    collection = client[MONGO_DB_NAME][settings.MONGO_TRANSACTION_BUCKET_COLLECTION]
+    await collection.create_indexes(INDEXES[settings.MONGO_TRANSACTION_BUCKET_COLLECTION])
+    return collection
+
+
+def _transaction(i: int, day: int, transaction_type: TransactionType = TransactionType.DEPOSIT) -> Transaction:
+    return Transaction(id=f"tx{i}", account_id="acc1", amount=100.45, type=transaction_type, status="PENDING",
+                       description="Deposit of $100.45", timestamp=datetime(2024, 3, day, 12, i), version=1)
+
+@pytest.mark.asyncio
+async def test_save_many_fills_buckets_up_to_the_size(buckets):
+    # Arrange
+    repository = TransactionBucketRepository()
+    await repository.save_many([_transaction(1, 20), _transaction(2, 21, TransactionType.WITHDRAW)])
+
+    # Act
+    await repository.save_many([_transaction(3, 22), _transaction(4, 1), _transaction(5, 23)])
+
+    # Assert
+    stored = await buckets.find({}).sort([('period', 1), ('sequence', 1)]).to_list(None)
+    assert [(bucket['_id'], [transaction['id'] for transaction in bucket['transactions']]) for bucket in stored] == [
+        ('acc1:2024-03:0', ['tx1', 'tx2']), ('acc1:2024-03:1', ['tx3', 'tx4']), ('acc1:2024-03:2', ['tx5'])]
+    first = stored[0]
+    assert (first['count'], first['deposits'], first['withdrawals']) == (2, Decimal128('100.45'), Decimal128('100.45'))
+    assert (stored[1]['first_timestamp'], stored[1]['last_timestamp']) == (datetime(2024, 3, 1, 12, 4),
+                                                                           datetime(2024, 3, 22, 12, 3))
+    assert [transaction.id for transaction in await repository.get_by_account_id('acc1')] == \
+        ['tx1', 'tx2', 'tx3', 'tx4', 'tx5']
+
+@pytest.mark.asyncio
+async def test_save_many_skips_transactions_already_in_the_bucket(buckets):
+    # Arrange
+    repository = TransactionBucketRepository()
+    await repository.save_many([_transaction(1, 20)])
+
+    # Act
+    await repository.save_many([_transaction(1, 20), _transaction(2, 21)])
+
+    # Assert
+    stored = await buckets.find({}).sort([('period', 1), ('sequence', 1)]).to_list(None)
+    assert [transaction['id'] for bucket in stored for transaction in bucket['transactions']] == ['tx1', 'tx2']
+    assert stored[0]['count'] == 1
+
+@pytest.mark.asyncio
+async def test_save_many_skips_transactions_already_in_a_full_bucket(buckets):
+    # Arrange
+    repository = TransactionBucketRepository()
+    await repository.save_many([_transaction(1, 20), _transaction(2, 21), _transaction(3, 22)])
+
+    # Act - tx1 is redelivered once its bucket is full
+    await repository.save_many([_transaction(1, 20), _transaction(4, 23)])
+
+    # Assert
+    assert [transaction.id for transaction in await repository.get_by_account_id('acc1')] == \
+        ['tx1', 'tx2', 'tx3', 'tx4']
+    stored = await buckets.find({}).sort([('period', 1), ('sequence', 1)]).to_list(None)
+    # the redelivery took a place of the open bucket, like in the bucket that has it
+    assert [bucket['count'] for bucket in stored] == [2, 1, 1]
+
+@pytest.mark.asyncio
+async def test_save_many_moves_to_the_next_bucket_when_the_open_one_fills_meanwhile(buckets, monkeypatch):
+    # Arrange - another writer fills the bucket after it was read as open
+    repository = TransactionBucketRepository()
+    await repository.save_many([_transaction(1, 20)])
+    open_buckets = repository._open_buckets
+    filled = []
+
+    async def stale_open_buckets(keys):
+        result = await open_buckets(keys)
+        if not filled:
+            filled.append(await buckets.update_one({'_id': 'acc1:2024-03:0'},
+                                                   {'$push': {'transactions': {'id': 'tx9'}}, '$inc': {'count': 1}}))
+        return result
+    monkeypatch.setattr(repository, '_open_buckets', stale_open_buckets)
+
+    # Act
+    await repository.save_many([_transaction(2, 21)])
+
+    # Assert
+    stored = await buckets.find({}).sort([('period', 1), ('sequence', 1)]).to_list(None)
+    assert [(bucket['count'], [transaction['id'] for transaction in bucket['transactions']]) for bucket in stored] == \
+        [(2, ['tx1', 'tx9']), (1, ['tx2'])]
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from unittest.mock import patch
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from com_ivansoft_corebank_lib.models.User import User
+from app.config import settings
+from app.db.user import UserRepository as user_repository_module
+from app.db.user.UserCache import UserCache
+from app.db.user.UserRepository import UserRepository, MONGO_DB_NAME
+
+
+@pytest.fixture
+async def users(monkeypatch):
+    client = InMemoryMongoClient()
+    monkeypatch.setattr(UserRepository, '_client', client)
+    monkeypatch.setattr(UserRepository, 'cache', UserCache(max_size=100, missing_ttl=60))
+    monkeypatch.setattr(user_repository_module, 'USER_PLACEHOLDER_ENABLED', False)
+    collection = client[MONGO_DB_NAME][settings.MONGO_USER_COLLECTION]
+    await collection.insert_many([
+        {'user_id': 1, 'username': 'alice', 'account_ids': ['acc1', 'acc2']},
+        {'user_id': 2, 'username': 'bob', 'account_ids': ['acc3']},
+    ])
+    return collection
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_are_read_with_one_query(users):
+    # Arrange
+    repository = UserRepository()
+
+    # Act
+    with patch.object(users, 'find', wraps=users.find) as find:
+        found = await asyncio.gather(*(repository.get_by_account_id(account_id)
+                                       for account_id in ('acc1', 'acc2', 'acc3', 'acc4')))
+
+    # Assert
+    assert found == [User(user_id=1, username='alice'), User(user_id=1, username='alice'),
+                     User(user_id=2, username='bob'), None]
+    find.assert_called_once()
+    assert find.call_args[0][0] == {'account_ids': {'$in': ['acc1', 'acc2', 'acc3', 'acc4']}}
+
+@pytest.mark.asyncio
+async def test_cached_lookups_skip_the_database(users):
+    # Arrange
+    repository = UserRepository()
+    await repository.get_by_account_id('acc1')
+    await repository.get_by_account_id('acc4')
+
+    # Act
+    with patch.object(users, 'find', wraps=users.find) as find:
+        user = await repository.get_by_account_id('acc1')
+        missing = await repository.get_by_account_id('acc4')
+
+    # Assert
+    assert (user, missing) == (User(user_id=1, username='alice'), None)
+    find.assert_not_called()
+    assert UserRepository.cache.stats() == {'size': 2, 'max_size': 100, 'hits': 2, 'misses': 2, 'hit_ratio': 0.5}
+
+@pytest.mark.asyncio
+async def test_placeholder_user(users, monkeypatch):
+    monkeypatch.setattr(user_repository_module, 'USER_PLACEHOLDER_ENABLED', True)
+
+    user = await UserRepository().get_by_account_id('acc4')
+
+    assert user == user_repository_module.PLACEHOLDER_USER
+
+def test_cache_evicts_least_recently_used():
+    # Arrange
+    cache = UserCache(max_size=2, missing_ttl=60)
+    cache.put('acc1', User(user_id=1, username='alice'))
+    cache.put('acc2', User(user_id=2, username='bob'))
+    cache.get('acc1')
+
+    # Act
+    cache.put('acc3', None)
+
+    # Assert
+    assert cache.get('acc1')[0] and cache.get('acc3') == (True, None)
+    assert cache.get('acc2') == (False, None)
+
+def test_cache_missing_accounts_expire():
+    cache = UserCache(max_size=2, missing_ttl=0)
+
+    cache.put('acc4', None)
+
+    assert cache.get('acc4') == (False, None)
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from com_ivansoft_corebank_lib.metrics import latest, measure_mongo_time
+from app import worker
+from app.api.eventsource.v1.subscribers import routing_key
+from app.benchmark_workers import cloud_event, use_in_memory_mongo
+from app.services.WorkerPool import WorkerPool
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_applies_and_rebalances(monkeypatch):
+    # Arrange - two worker processes with their own in-memory database
+    monkeypatch.setenv("BALANCE_UPDATES_ENABLED", "false")
+    pool = WorkerPool(worker.run, workers=2, restart=False, setup=use_in_memory_mongo)
+    await pool.start()
+    entries = [(str(i), cloud_event(i, accounts=10)) for i in range(50)]
+    try:
+        # Act
+        with measure_mongo_time() as mongo_time:
+            statuses = await pool.submit(entries + [("invalid", "{}")], key=routing_key)
+
+        # Assert - with the MongoDB time of the workers for the concurrency limit
+        assert statuses == {**{str(i): "SUCCESS" for i in range(50)}, "invalid": "DROP"}
+        assert mongo_time.operations > 0
+        assert [worker["alive"] for worker in pool.stats()["workers"].values()] == [True, True]
+
+        # Act - a worker dies, its accounts move to the other one
+        pool._workers[0][0].terminate()
+        await asyncio.sleep(2.5)
+        statuses = await pool.submit([(str(i), cloud_event(i, accounts=10)) for i in range(50, 60)], key=routing_key)
+
+        # Assert
+        assert list(pool.stats()["workers"]) == [1]
+        assert set(statuses.values()) == {"SUCCESS"}
+    finally:
+        await pool.close()
+
+@pytest.mark.asyncio
+async def test_worker_metrics_are_exposed_by_the_front_process(monkeypatch, tmp_path):
+    # Arrange - the workers inherit the metrics directory
+    monkeypatch.setenv("BALANCE_UPDATES_ENABLED", "false")
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    pool = WorkerPool(worker.run, workers=2, setup=use_in_memory_mongo)
+    await pool.start()
+    try:
+        # Act
+        await pool.submit([(str(i), cloud_event(i, accounts=10)) for i in range(20)], key=routing_key)
+    finally:
+        await pool.close()
+    content, _ = latest()
+
+    # Assert - the events applied by both workers
+    assert b'projection_events_processed_total{type="DEPOSIT"} 20.0' in content
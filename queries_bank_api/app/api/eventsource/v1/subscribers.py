@@ -0,0 +1,31 @@
+import json
+from fastapi import APIRouter, Depends, Request
+from structlog import get_logger
+from app.api.schemas.CloudEventModel import CloudEventModel
+from app.services.AccountService import AccountService
+
+logger = get_logger().bind(logger='subscribers')
+
+router = APIRouter()
+
+def get_account_service(request: Request) -> AccountService:
+    # created once per app in main.py
+    return request.app.state.account_service
+
+"""this endpoint handlers is for programmatic method to subscribe to a topic, check main.py for subscription details"""
+
+@router.post('/balance_cache/handler', response_model=None)
+async def balance_cache_handler(event: CloudEventModel, account_service: AccountService = Depends(get_account_service)):
+    """Balance updates published by the account projections, the cached balances of the accounts are dropped so the
+    next query reads the new balance. Invalid updates would fail every redelivery, they are dropped and the cached
+    balances expire after BALANCE_CACHE_MAX_AGE"""
+    try:
+        data = json.loads(event.data) if isinstance(event.data, str) else event.data
+        account_ids = data['account_ids']
+        if not isinstance(account_ids, list) or not all(isinstance(account_id, str) for account_id in account_ids):
+            raise ValueError('account_ids must be a list of account ids')
+    except (ValueError, KeyError, TypeError) as e:
+        logger.error('Invalid balance update', event_id=event.id, error=str(e))
+        return {"status": "DROP"}
+    account_service.invalidate_balances(account_ids)
+    return {"message": "Balances invalidated"}
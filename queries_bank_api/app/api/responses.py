@@ -0,0 +1,27 @@
+from decimal import Decimal
+from typing import Any
+import orjson
+from bson.decimal128 import Decimal128
+from fastapi.responses import JSONResponse
+
+
+def _default(value: Any) -> Any:
+    # amounts are numbers in the responses, as the default FastAPI encoder does for Decimal
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def dumps(content: Any) -> bytes:
+    """orjson encoding of content, datetimes in ISO format and Decimal amounts as numbers"""
+    return orjson.dumps(content, default=_default)
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response encoded with orjson. Return it from the handlers with the model_dump of the models, FastAPI
+    doesn't run jsonable_encoder on the content of a returned Response"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -1,28 +1,105 @@
-from fastapi import APIRouter, Depends, HTTPException
+from datetime import date, datetime
+from typing import AsyncIterator, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from app.api.schemas.BalancesRequestModel import BalancesRequestModel
+from app.api.responses import ORJSONResponse, dumps
+from app.api.schemas.HistoryCursor import encode_cursor, decode_cursor
+from app.config.settings import HISTORY_PAGE_DEFAULT_LIMIT, HISTORY_PAGE_MAX_LIMIT, HISTORY_STREAM_BATCH_SIZE
 from app.services.AccountService import AccountService
 
 router = APIRouter()
 
-def get_account_service():
-    service = AccountService()
-    yield service
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+
+def get_account_service(request: Request) -> AccountService:
+    # created once per app in main.py
+    return request.app.state.account_service
 
 @router.get("/account/{account_id}/balance")
-async def get_balance(account_id: str, account_service: AccountService = Depends(get_account_service)):
+async def get_balance(account_id: str, as_of: Optional[datetime] = None,
+                      account_service: AccountService = Depends(get_account_service)):
+    """Current balance, or with as_of the balance at that time worked out from the balance checkpoints of the
+    projections service"""
     try:
+        if as_of:
+            return ORJSONResponse(await account_service.get_balance_as_of(account_id, as_of))
         balance = await account_service.get_current_balance(account_id)
-        return balance.model_dump()
+        return ORJSONResponse(balance.model_dump())
     except ValueError as e:
         if str(e) == 'Not Found':
             raise HTTPException(status_code=404, detail=f"Balance for account id: {account_id} not found")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/accounts/balances")
+async def get_balances(request: BalancesRequestModel, account_service: AccountService = Depends(get_account_service)):
+    """Current balances of many accounts in one call, streamed as {"balances": [...], "missing": [...]} where missing
+    has the requested accounts without a balance"""
+    balances = account_service.get_balances(request.account_ids)
+    return StreamingResponse(_to_balances_json(request.account_ids, balances), media_type='application/json')
+
 @router.get("/account/{account_id}/history")
-async def get_transaction_history(account_id: str, account_service: AccountService = Depends(get_account_service)):
+async def get_transaction_history(account_id: str,
+                                  limit: int = Query(HISTORY_PAGE_DEFAULT_LIMIT, ge=1, le=HISTORY_PAGE_MAX_LIMIT),
+                                  cursor: Optional[str] = None, accept: Optional[str] = Header(None),
+                                  account_service: AccountService = Depends(get_account_service)):
+    """Transaction history newest first, one page per request. When there are more transactions the X-Next-Cursor
+    header has the cursor of the next page. With Accept: application/x-ndjson the whole history is streamed instead,
+    one transaction per line"""
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        try:
+            batches = await account_service.stream_history(account_id, HISTORY_STREAM_BATCH_SIZE)
+        except ValueError as e:
+            if str(e) == 'Not Found':
+                raise HTTPException(status_code=404, detail=f"History for account id: {account_id} not found")
+            raise HTTPException(status_code=500, detail=str(e))
+        return StreamingResponse(_to_ndjson(batches), media_type=NDJSON_MEDIA_TYPE)
+
     try:
-        history = await account_service.get_history_transactions(account_id)
-        return [balance.model_dump() for balance in history]
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+    try:
+        history, next_key = await account_service.get_history_page(account_id, limit, after)
+        headers = {'X-Next-Cursor': encode_cursor(next_key)} if next_key else None
+        return ORJSONResponse([transaction.model_dump() for transaction in history], headers=headers)
     except ValueError as e:
         if str(e) == 'Not Found':
             raise HTTPException(status_code=404, detail=f"History for account id: {account_id} not found")
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/account/{account_id}/summary")
+async def get_summary(account_id: str, granularity: RollupGranularity = RollupGranularity.DAY,
+                      from_date: Optional[date] = Query(None, alias='from'), to: Optional[date] = None,
+                      account_service: AccountService = Depends(get_account_service)):
+    """Deposits, withdrawals, count and closing balance of the account per day or month, oldest first. The
+    summary is read from the rollups of the projections service, one document per period with transactions"""
+    try:
+        rollups = await account_service.get_summary(account_id, granularity, from_date, to)
+        return ORJSONResponse([rollup.model_dump() for rollup in rollups])
+    except ValueError as e:
+        if str(e) == 'Invalid Range':
+            raise HTTPException(status_code=400, detail=f"Invalid range, from: {from_date} is after to: {to}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _to_ndjson(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    # documents are encoded as they are stored, one chunk per batch, without going through the pydantic models
+    async for batch in batches:
+        yield b''.join(dumps(document) + b'\n' for document in batch)
+
+
+async def _to_balances_json(account_ids: [str], balances: AsyncIterator[BalanceModel]) -> AsyncIterator[bytes]:
+    # every balance is sent as soon as it is read, the missing accounts are only known at the end
+    found = set()
+    separator = b''
+    yield b'{"balances":['
+    async for balance in balances:
+        found.add(balance.account_id)
+        yield separator + dumps(balance.model_dump())
+        separator = b','
+    missing = [account_id for account_id in dict.fromkeys(account_ids) if account_id not in found]
+    yield b'],"missing":' + dumps(missing) + b'}'
@@ -0,0 +1,6 @@
+from pydantic import BaseModel, Field
+from app.config.settings import BALANCES_MAX_ACCOUNTS
+
+
+class BalancesRequestModel(BaseModel):
+    account_ids: list[str] = Field(min_length=1, max_length=BALANCES_MAX_ACCOUNTS)
@@ -1,4 +1,5 @@
 
+from typing import Union
 from pydantic import BaseModel
 
 
@@ -7,7 +8,8 @@ class CloudEventModel(BaseModel):
     source: str
     topic: str
     pubsubname: str
-    data: str
+    # a json string, or the json object itself when the message was published as application/json
+    data: Union[str, dict]
     id: str
     specversion: str
     tracestate: str
@@ -0,0 +1,22 @@
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(key: tuple) -> str:
+    """Opaque token of the (timestamp, id) key of the last transaction of a history page"""
+    timestamp, transaction_id = key
+    payload = {'t': timestamp, 'i': transaction_id}
+    if isinstance(timestamp, datetime):
+        # timestamps stored as dates, the ones written before are ISO strings
+        payload = {'t': timestamp.isoformat(), 'd': 1, 'i': transaction_id}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        timestamp = datetime.fromisoformat(payload['t']) if payload.get('d') else payload['t']
+        return timestamp, payload['i']
+    except (ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
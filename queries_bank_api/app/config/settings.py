@@ -4,6 +4,60 @@ MONGO_HOST = os.environ.get('MONGO_HOST', 'localhost')
 MONGO_URL = f'mongodb://{MONGO_HOST}:27017/'
 MONGO_DB_NAME = 'mydb'
 MONGO_BALANCE_COLLECTION = 'balance'
+MONGO_CURRENT_BALANCE_COLLECTION = 'balance_current'
 MONGO_USER_COLLECTION = 'user'
 MONGO_TRANSACTION_COLLECTION = 'transactions'
-MONGO_ACCOUNT_COLLECTION = 'account'
\ No newline at end of file
+MONGO_TRANSACTION_BUCKET_COLLECTION = 'transaction_buckets'
+MONGO_ACCOUNT_COLLECTION = 'account'
+MONGO_ROLLUP_COLLECTION = 'balance_rollups'
+MONGO_BALANCE_CHECKPOINT_COLLECTION = 'balance_checkpoints'
+
+# MongoDB client, the connection pool is per process and shared by every request. Unset timeouts use the driver
+# defaults, MONGO_COMPRESSORS is a comma separated list (zstd and snappy need their python packages, zlib doesn't)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = os.environ.get('MONGO_MAX_IDLE_TIME_MS')
+MONGO_WAIT_QUEUE_TIMEOUT_MS = os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS')
+MONGO_CONNECT_TIMEOUT_MS = os.environ.get('MONGO_CONNECT_TIMEOUT_MS')
+MONGO_SERVER_SELECTION_TIMEOUT_MS = os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS')
+MONGO_SOCKET_TIMEOUT_MS = os.environ.get('MONGO_SOCKET_TIMEOUT_MS')
+MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', '')
+
+# storage layout of the transaction history written by the account projections, set both services alike: document
+# reads one document per transaction from MONGO_TRANSACTION_COLLECTION, bucket one document per account and
+# TRANSACTION_BUCKET_PERIOD (day or month) holding many transactions from MONGO_TRANSACTION_BUCKET_COLLECTION
+TRANSACTION_LAYOUT = os.environ.get('TRANSACTION_LAYOUT', 'document')
+TRANSACTION_BUCKET_PERIOD = os.environ.get('TRANSACTION_BUCKET_PERIOD', 'month')
+
+# transaction history pagination
+HISTORY_PAGE_DEFAULT_LIMIT = int(os.environ.get('HISTORY_PAGE_DEFAULT_LIMIT', '50'))
+HISTORY_PAGE_MAX_LIMIT = int(os.environ.get('HISTORY_PAGE_MAX_LIMIT', '500'))
+# documents per batch of the streamed (application/x-ndjson) transaction history
+HISTORY_STREAM_BATCH_SIZE = int(os.environ.get('HISTORY_STREAM_BATCH_SIZE', '1000'))
+
+# in-process LRU cache of current balances, entries are dropped by the balance updates of the projections service
+# and expire after BALANCE_CACHE_MAX_AGE seconds when an update is lost
+BALANCE_CACHE_ENABLED = os.environ.get('BALANCE_CACHE_ENABLED', 'true').lower() == 'true'
+BALANCE_CACHE_SIZE = int(os.environ.get('BALANCE_CACHE_SIZE', '10000'))
+BALANCE_CACHE_MAX_AGE = float(os.environ.get('BALANCE_CACHE_MAX_AGE', '60'))
+BALANCE_UPDATES_PUBSUB_NAME = os.environ.get('BALANCE_UPDATES_PUBSUB_NAME', 'eventsource')
+BALANCE_UPDATES_TOPIC = os.environ.get('BALANCE_UPDATES_TOPIC', 'balances')
+
+# batch balance lookup, the account ids are resolved with one $in query per BALANCES_BATCH_SIZE accounts
+BALANCES_MAX_ACCOUNTS = int(os.environ.get('BALANCES_MAX_ACCOUNTS', '10000'))
+BALANCES_BATCH_SIZE = int(os.environ.get('BALANCES_BATCH_SIZE', '1000'))
+
+# opt-in request profiling, requests with the PROFILING_HEADER header and a PROFILING_SAMPLE_RATE fraction of the rest
+# are profiled with cProfile and written to PROFILING_DIR, the last ones are listed at /debug/profiles
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILING_HEADER = os.environ.get('PROFILING_HEADER', 'X-Profile')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', '/tmp/profiles')
+
+# logging, records are rendered and written by a background thread. LOG_SAMPLE_RATE is the fraction written of the
+# records below warning of the loggers bound with sampled=True, level and rate can be changed at /debug/logging.
+# LOG_FORMAT is console or json
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'info')
+LOG_SAMPLE_RATE = float(os.environ.get('LOG_SAMPLE_RATE', '1'))
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'console')
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', '10000'))
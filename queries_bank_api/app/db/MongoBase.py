@@ -1,30 +1,15 @@
+from com_ivansoft_corebank_lib.mongo_client import MongoBase, LazyClient, client_options  # noqa: F401
+from app.config.settings import (MONGO_URL, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS,
+                                 MONGO_WAIT_QUEUE_TIMEOUT_MS, MONGO_CONNECT_TIMEOUT_MS,
+                                 MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MONGO_COMPRESSORS)
 
-from motor.motor_asyncio import AsyncIOMotorClient
-from structlog import get_logger
-from app.config.settings import MONGO_URL
 
-logger = get_logger().bind(logger='MongoBase')
+def options() -> dict:
+    """Client options from the settings, the unset ones are left to the driver defaults"""
+    return client_options(MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_TIME_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS,
+                          MONGO_CONNECT_TIMEOUT_MS, MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+                          MONGO_COMPRESSORS)
 
 
-class MongoBase:
-    _client: AsyncIOMotorClient = None
-
-    @classmethod
-    def get_client(cls) -> AsyncIOMotorClient:
-        if not cls._client:
-            cls.connect()
-        return cls._client
-
-    @classmethod
-    def connect(cls):
-        logger.info('Connecting to MongoDB')
-        cls._client = AsyncIOMotorClient(MONGO_URL)
-
-    @classmethod
-    def close(cls):
-        if cls._client:
-            cls._client.close()
-            cls._client = None
-            logger.info('MongoDB connection closed')
-        else:
-            logger.warning('MongoDB connection already closed')
+# the client of the process and the repositories LazyClient are the shared ones, configured with the settings
+MongoBase.configure(MONGO_URL, options)
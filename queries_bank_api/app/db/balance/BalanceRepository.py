@@ -1,25 +1,42 @@
 
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from bson.decimal128 import Decimal128
 from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.metrics import timed
 from structlog import get_logger
 from motor.motor_asyncio import AsyncIOMotorClient
-from app.db.MongoBase import MongoBase
-from app.config.settings import MONGO_DB_NAME, MONGO_BALANCE_COLLECTION
+from app.db.MongoBase import LazyClient
+from app.config.settings import (MONGO_DB_NAME, MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION,
+                                 MONGO_BALANCE_CHECKPOINT_COLLECTION)
 
-logger = get_logger().bind(logger='BalanceRepository')
+logger = get_logger().bind(logger='BalanceRepository', sampled=True)
 
 
 class BalanceRepository:
-    _client: AsyncIOMotorClient = MongoBase.get_client()
+    _client: AsyncIOMotorClient = LazyClient()
 
+    @timed
     async def get(self, account_id: str) -> BalanceModel:
         logger.info('Retrieving balance', account_id=account_id)
 
-        # Get last balance, order by updated_at field
-        balance = await (BalanceRepository._client[MONGO_DB_NAME][MONGO_BALANCE_COLLECTION]
-                         .find_one({'account_id': account_id}, sort=[('updated_at', -1)]))
+        # the current balance document is keyed by account id, maintained by the projections service. Its applied
+        # transaction ids are only used by the projections
+        balance = await (BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+                         .find_one({'_id': account_id}, {'applied': False}))
 
-        return BalanceModel(**balance) if balance else None
+        return self._to_model(balance) if balance else None
 
+    @timed
+    async def get_many(self, account_ids: [str]) -> AsyncIterator[BalanceModel]:
+        """Current balances of the accounts with one $in query, accounts without a balance are skipped"""
+        logger.info('Retrieving balances', count=len(account_ids))
+
+        async for balance in (BalanceRepository._client[MONGO_DB_NAME][MONGO_CURRENT_BALANCE_COLLECTION]
+                              .find({'_id': {'$in': account_ids}}, {'applied': False})):
+            yield self._to_model(balance)
+
+    @timed
     async def get_history(self, account_id: str):
         logger.info('Retrieving balance history', account_id=account_id)
 
@@ -27,4 +44,24 @@ class BalanceRepository:
         history = await (BalanceRepository._client[MONGO_DB_NAME][MONGO_BALANCE_COLLECTION]
                          .find({'account_id': account_id}).sort('updated_at', -1).to_list(length=None))
 
-        return [BalanceModel(**balance) for balance in history]
\ No newline at end of file
+        return [self._to_model(balance) for balance in history]
+
+    @timed
+    async def get_checkpoint(self, account_id: str, as_of: datetime) -> Optional[dict]:
+        """Latest balance checkpoint written by the projections service at or before as_of, with the balance and
+        the events of the account up to it. Its timestamp is the latest of the transactions of those events, so all
+        of them are at or before as_of"""
+        logger.info('Retrieving balance checkpoint', account_id=account_id, as_of=as_of)
+
+        checkpoint = await (BalanceRepository._client[MONGO_DB_NAME][MONGO_BALANCE_CHECKPOINT_COLLECTION]
+                            .find_one({'account_id': account_id, 'timestamp': {'$lte': as_of}},
+                                      sort=[('timestamp', -1), ('events', -1)]))
+        if checkpoint and isinstance(checkpoint['balance'], Decimal128):
+            checkpoint['balance'] = checkpoint['balance'].to_decimal()
+        return checkpoint
+
+    @staticmethod
+    def _to_model(balance: dict) -> BalanceModel:
+        if isinstance(balance['balance'], Decimal128):
+            balance['balance'] = balance['balance'].to_decimal()
+        return BalanceModel(**balance)
@@ -0,0 +1,64 @@
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from app.config.settings import (MONGO_BALANCE_COLLECTION, MONGO_CURRENT_BALANCE_COLLECTION,
+                                 MONGO_TRANSACTION_COLLECTION, MONGO_ROLLUP_COLLECTION,
+                                 MONGO_BALANCE_CHECKPOINT_COLLECTION, MONGO_TRANSACTION_BUCKET_COLLECTION)
+
+# Indexes needed by the repositories queries, created at startup when missing. The names are shared with the
+# account projections service, which declares the same indexes for the collections both services read. Background
+# builds don't block the collection on servers older than 4.2, newer servers ignore the option
+INDEXES = {
+    MONGO_BALANCE_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('updated_at', DESCENDING)], name='account_id_updated_at', background=True),
+    ],
+    MONGO_TRANSACTION_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('timestamp', ASCENDING), ('id', ASCENDING)],
+                   name='account_id_timestamp_id', background=True),
+        IndexModel([('account_id', ASCENDING), ('event', ASCENDING)], name='account_id_event', background=True),
+    ],
+    MONGO_TRANSACTION_BUCKET_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('period', ASCENDING), ('sequence', ASCENDING)],
+                   name='account_id_period_sequence', background=True),
+        # a transaction is stored once per account whatever bucket it is in, the build fails on existing duplicates
+        IndexModel([('account_id', ASCENDING), ('transactions.id', ASCENDING)],
+                   name='account_id_transactions_id', unique=True, background=True),
+    ],
+    MONGO_ROLLUP_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('granularity', ASCENDING), ('period', ASCENDING)],
+                   name='account_id_granularity_period', background=True),
+    ],
+    MONGO_BALANCE_CHECKPOINT_COLLECTION: [
+        IndexModel([('account_id', ASCENDING), ('timestamp', DESCENDING), ('events', DESCENDING)],
+                   name='account_id_timestamp_events', background=True),
+    ],
+}
+
+# indexes replaced by one of INDEXES, dropped at startup once the replacement exists. account_id_timestamp was
+# extended with id for the keyset pagination of the history
+SUPERSEDED_INDEXES = {
+    MONGO_TRANSACTION_COLLECTION: ['account_id_timestamp'],
+}
+
+# (query, collection, fields of the filter followed by the fields of the sort), every query pattern must be
+# supported by an index whose keys start with these fields
+QUERY_PATTERNS = [
+    ('BalanceRepository.get', MONGO_CURRENT_BALANCE_COLLECTION, ['_id']),
+    ('BalanceRepository.get_many', MONGO_CURRENT_BALANCE_COLLECTION, ['_id']),
+    ('BalanceRepository.get_history', MONGO_BALANCE_COLLECTION, ['account_id', 'updated_at']),
+    ('TransactionRepository.get', MONGO_TRANSACTION_COLLECTION, ['account_id', 'timestamp']),
+    ('TransactionRepository.get_history', MONGO_TRANSACTION_COLLECTION, ['account_id', 'timestamp']),
+    ('TransactionRepository.get_history_page', MONGO_TRANSACTION_COLLECTION, ['account_id', 'timestamp', 'id']),
+    ('TransactionRepository.stream_history', MONGO_TRANSACTION_COLLECTION, ['account_id', 'timestamp', 'id']),
+    ('BalanceRepository.get_checkpoint', MONGO_BALANCE_CHECKPOINT_COLLECTION, ['account_id', 'timestamp', 'events']),
+    ('TransactionRepository.get_after', MONGO_TRANSACTION_COLLECTION, ['account_id', 'event']),
+    ('TransactionBucketRepository.get', MONGO_TRANSACTION_BUCKET_COLLECTION, ['account_id', 'period', 'sequence']),
+    ('TransactionBucketRepository.get_history', MONGO_TRANSACTION_BUCKET_COLLECTION,
+     ['account_id', 'period', 'sequence']),
+    ('TransactionBucketRepository.get_history_page', MONGO_TRANSACTION_BUCKET_COLLECTION,
+     ['account_id', 'period', 'sequence']),
+    ('TransactionBucketRepository.stream_history', MONGO_TRANSACTION_BUCKET_COLLECTION,
+     ['account_id', 'period', 'sequence']),
+    ('TransactionBucketRepository.get_after', MONGO_TRANSACTION_BUCKET_COLLECTION,
+     ['account_id', 'period', 'sequence']),
+    ('RollupRepository.get_summary', MONGO_ROLLUP_COLLECTION, ['account_id', 'granularity', 'period']),
+]
+
@@ -0,0 +1,34 @@
+from com_ivansoft_corebank_lib.models.Rollup import Rollup as RollupModel, RollupGranularity
+from com_ivansoft_corebank_lib.metrics import timed
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.db.MongoBase import LazyClient
+from app.config.settings import MONGO_DB_NAME, MONGO_ROLLUP_COLLECTION
+
+logger = get_logger().bind(logger='RollupRepository', sampled=True)
+
+
+class RollupRepository:
+    _client: AsyncIOMotorClient = LazyClient()
+
+    @timed
+    async def get_summary(self, account_id: str, granularity: RollupGranularity, from_period: str = None,
+                          to_period: str = None) -> list[RollupModel]:
+        """Rollups of the account between from_period and to_period (both included), oldest first. The rollups are
+        maintained by the projections service, one document per period with activity"""
+        logger.info('Retrieving summary', account_id=account_id, granularity=granularity.value,
+                    from_period=from_period, to_period=to_period)
+
+        query = {'account_id': account_id, 'granularity': granularity.value}
+        period = {}
+        if from_period:
+            period['$gte'] = from_period
+        if to_period:
+            period['$lte'] = to_period
+        if period:
+            query['period'] = period
+
+        rollups = await (RollupRepository._client[MONGO_DB_NAME][MONGO_ROLLUP_COLLECTION]
+                         .find(query, {'_id': False}).sort('period', 1).to_list(length=None))
+
+        return [RollupModel(**rollup) for rollup in rollups]
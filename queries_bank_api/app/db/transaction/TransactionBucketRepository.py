@@ -0,0 +1,134 @@
+from contextlib import aclosing
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from com_ivansoft_corebank_lib.models.Transaction import Transaction as TransactionModel
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.metrics import timed
+from com_ivansoft_corebank_lib.timestamp import naive_utc, parse_timestamp
+from structlog import get_logger
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.db.MongoBase import LazyClient
+from app.config.settings import MONGO_DB_NAME, MONGO_TRANSACTION_BUCKET_COLLECTION, TRANSACTION_BUCKET_PERIOD
+
+logger = get_logger().bind(logger='TransactionBucketRepository', sampled=True)
+
+# buckets read per round trip by the queries that usually need one or two of them, the driver reads 101 by default
+_PAGE_BUCKETS = 2
+
+
+class TransactionBucketRepository:
+    """Reads the transaction history stored by the account projections in the bucket layout: one document per account
+    and period (day or month) holding a capped array of transactions, a full bucket continues in the next sequence of
+    the period. Same queries and results as TransactionRepository, a page of history reads one or two buckets instead
+    of a document per transaction"""
+    _client: AsyncIOMotorClient = LazyClient()
+
+    granularity = RollupGranularity(TRANSACTION_BUCKET_PERIOD)
+
+    @timed
+    async def get(self, account_id: str) -> TransactionModel:
+        logger.info('Retrieving transaction', account_id=account_id)
+
+        async with aclosing(self._periods(account_id, newest_first=True, batch_size=_PAGE_BUCKETS)) as periods:
+            async for transactions in periods:
+                return TransactionModel(**transactions[0])
+        return None
+
+    @timed
+    async def get_history(self, account_id: str):
+        logger.info('Retrieving transaction history', account_id=account_id)
+
+        history = [TransactionModel(**transaction) async for transactions in self._periods(account_id)
+                   for transaction in transactions]
+        return history or None
+
+    @timed
+    async def get_history_page(self, account_id: str, limit: int, after: tuple = None) -> (list[TransactionModel], tuple):
+        """Newest first, after is the (timestamp, id) key of the last transaction of the previous page, its timestamp
+        is an ISO string in the cursors of pages read before the timestamps were stored as dates. Only the buckets of
+        the period of after and older ones are read"""
+        logger.info('Retrieving transaction history page', account_id=account_id, limit=limit, after=after)
+
+        after = (_cursor_timestamp(after[0]), after[1]) if after else None
+        periods_query = {'$lte': self.granularity.period(after[0])} if after else None
+        # one more than the page to know if there is a next page
+        documents = []
+        async with aclosing(self._periods(account_id, periods_query, newest_first=True,
+                                          batch_size=_PAGE_BUCKETS)) as periods:
+            async for transactions in periods:
+                if after:
+                    transactions = [transaction for transaction in transactions
+                                    if (transaction['timestamp'], transaction['id']) < after]
+                documents.extend(transactions[:limit + 1 - len(documents)])
+                if len(documents) > limit:
+                    break
+
+        page = documents[:limit]
+        next_key = (page[-1]['timestamp'], page[-1]['id']) if len(documents) > limit else None
+        return [TransactionModel(**transaction) for transaction in page], next_key
+
+    @timed
+    async def stream_history(self, account_id: str, batch_size: int) -> AsyncIterator[list[dict]]:
+        """Transaction history newest first as raw documents in batches of batch_size, one period of buckets is in
+        memory at a time"""
+        logger.info('Streaming transaction history', account_id=account_id, batch_size=batch_size)
+
+        batch = []
+        async for transactions in self._periods(account_id, newest_first=True):
+            batch.extend(transactions)
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    @timed
+    async def get_after(self, account_id: str, events: Optional[int], until: datetime) -> list[TransactionModel]:
+        """Transactions applied to the account after its first events, or all of them when None, up to until, oldest
+        first. A transaction delivered late can be in any period up to until, only the buckets whose last event is
+        after events are read"""
+        logger.info('Retrieving transactions after', account_id=account_id, events=events, until=until)
+
+        until = naive_utc(until)
+        periods = self._periods(account_id, {'$lte': self.granularity.period(until)}, last_event=events)
+        return [TransactionModel(**transaction) async for transactions in periods
+                for transaction in transactions if transaction['timestamp'] <= until and
+                (events is None or transaction.get('event', 0) > events)]
+
+    async def _periods(self, account_id: str, periods_query: dict = None, newest_first: bool = False,
+                       batch_size: int = None, last_event: int = None) -> AsyncIterator[list[dict]]:
+        """Raw transactions of the account one period at a time, sorted by (timestamp, id). The buckets of a period
+        are sorted together, a transaction delivered late can be in a later bucket than newer ones. With last_event
+        only the buckets with a later event are read"""
+        direction = -1 if newest_first else 1
+        query = {'account_id': account_id}
+        if periods_query:
+            query['period'] = periods_query
+        if last_event is not None:
+            query['last_event'] = {'$gt': last_event}
+        cursor = (TransactionBucketRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_BUCKET_COLLECTION]
+                  .find(query, {'_id': False, 'period': True, 'transactions': True})
+                  .sort([('period', direction), ('sequence', direction)]))
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+
+        period = None
+        transactions = []
+        async for bucket in cursor:
+            if bucket['period'] != period and transactions:
+                yield _sorted(transactions, newest_first)
+                transactions = []
+            period = bucket['period']
+            transactions.extend(bucket['transactions'])
+        if transactions:
+            yield _sorted(transactions, newest_first)
+
+
+def _sorted(transactions: list[dict], newest_first: bool) -> list[dict]:
+    return sorted(transactions, key=lambda transaction: (transaction['timestamp'], transaction['id']),
+                  reverse=newest_first)
+
+
+def _cursor_timestamp(timestamp) -> datetime:
+    # the buckets store dates, MongoDB returns them without timezone in UTC
+    return naive_utc(parse_timestamp(timestamp) if isinstance(timestamp, str) else timestamp)
@@ -1,33 +1,97 @@
 
+from datetime import datetime
+from typing import AsyncIterator, Optional
 from com_ivansoft_corebank_lib.models.Transaction import Transaction as TransactionModel
+from com_ivansoft_corebank_lib.metrics import timed
+from com_ivansoft_corebank_lib.timestamp import naive_utc
 from structlog import get_logger
 from motor.motor_asyncio import AsyncIOMotorClient
-from app.db.MongoBase import MongoBase
+from app.db.MongoBase import LazyClient
 from app.config.settings import MONGO_DB_NAME, MONGO_TRANSACTION_COLLECTION
 
-logger = get_logger().bind(logger='TransactionRepository')
+logger = get_logger().bind(logger='TransactionRepository', sampled=True)
 
 
 class TransactionRepository:
-    _client: AsyncIOMotorClient = MongoBase.get_client()
+    _client: AsyncIOMotorClient = LazyClient()
 
+    @timed
     async def get(self, account_id: str) -> TransactionModel:
         logger.info('Retrieving transaction', account_id=account_id)
 
-        # Get last balance, order by updated_at field
+        # Get last transaction, order by timestamp field
         transaction = await (TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION]
-                         .find_one({'account_id': account_id}, sort=[('updated_at', -1)]))
+                         .find_one({'account_id': account_id}, sort=[('timestamp', -1)]))
 
         return TransactionModel(**transaction) if transaction else None
 
+    @timed
     async def get_history(self, account_id: str):
         logger.info('Retrieving transaction history', account_id=account_id)
 
-        # find all balances, order by updated_at field
+        # find all transactions, oldest first
         history = await (TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION]
-                         .find({'account_id': account_id}).sort('updated_at', -1).to_list(length=None))
+                         .find({'account_id': account_id}).sort('timestamp', 1).to_list(length=None))
 
         if not history:
             return None
 
-        return [TransactionModel(**transaction) for transaction in history]
\ No newline at end of file
+        return [TransactionModel(**transaction) for transaction in history]
+
+    @timed
+    async def get_history_page(self, account_id: str, limit: int, after: tuple = None) -> (list[TransactionModel], tuple):
+        """Keyset pagination over the (account_id, timestamp, id) index, newest first. after is the (timestamp, id)
+        key of the last transaction of the previous page, returns the page and the key of its last transaction when
+        there are more pages. The timestamps not migrated yet are ISO strings, MongoDB only compares values of the same
+        type and sorts the strings after every date newest first, so they all follow a date cursor"""
+        logger.info('Retrieving transaction history page', account_id=account_id, limit=limit, after=after)
+
+        query = {'account_id': account_id}
+        if after:
+            timestamp, transaction_id = after
+            query['$or'] = [{'timestamp': {'$lt': timestamp}}, {'timestamp': timestamp, 'id': {'$lt': transaction_id}}]
+            if isinstance(timestamp, datetime):
+                query['$or'].append({'timestamp': {'$type': 'string'}})
+
+        # one more than the page to know if there is a next page
+        documents = await (TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION]
+                           .find(query).sort([('timestamp', -1), ('id', -1)]).limit(limit + 1)
+                           .to_list(length=limit + 1))
+
+        page = documents[:limit]
+        next_key = (page[-1]['timestamp'], page[-1]['id']) if len(documents) > limit else None
+        return [TransactionModel(**transaction) for transaction in page], next_key
+
+    @timed
+    async def stream_history(self, account_id: str, batch_size: int) -> AsyncIterator[list[dict]]:
+        """Transaction history newest first as raw documents, one batch at a time, so only one batch is in memory.
+        The documents are not validated into models, they are the projections written by the account projections"""
+        logger.info('Streaming transaction history', account_id=account_id, batch_size=batch_size)
+
+        cursor = (TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION]
+                  .find({'account_id': account_id}, {'_id': False})
+                  .sort([('timestamp', -1), ('id', -1)]).batch_size(batch_size))
+        while batch := await cursor.to_list(length=batch_size):
+            yield batch
+
+    @timed
+    async def get_after(self, account_id: str, events: Optional[int], until: datetime) -> list[TransactionModel]:
+        """Transactions applied to the account after its first events, or all of them when None, up to until, oldest
+        first. The event of every transaction is numbered by the account projections when they apply it. MongoDB can't
+        compare the timestamps not migrated yet, ISO strings, with until and sorts them before every date, so they are
+        read too and compared and sorted here"""
+        logger.info('Retrieving transactions after', account_id=account_id, events=events, until=until)
+
+        query = {'account_id': account_id, '$or': [{'timestamp': {'$lte': until}}, {'timestamp': {'$type': 'string'}}]}
+        if events is not None:
+            query['event'] = {'$gt': events}
+
+        documents = await (TransactionRepository._client[MONGO_DB_NAME][MONGO_TRANSACTION_COLLECTION]
+                           .find(query).sort([('timestamp', 1), ('id', 1)]).to_list(length=None))
+        transactions = [TransactionModel(**transaction) for transaction in documents]
+        if any(isinstance(transaction['timestamp'], str) for transaction in documents):
+            until = naive_utc(until)
+            transactions = sorted((transaction for transaction in transactions
+                                   if naive_utc(transaction.timestamp) <= until),
+                                  key=lambda transaction: (naive_utc(transaction.timestamp), transaction.id))
+        return transactions
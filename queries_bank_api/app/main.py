@@ -1,10 +1,115 @@
 
-from fastapi import FastAPI
+import asyncio
+import json
+from typing import Optional
+import socket
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Response
+from com_ivansoft_corebank_lib.log import configure_logging, logging_settings, set_level, set_sample_rate
+from com_ivansoft_corebank_lib.metrics import MetricsMiddleware, latest
+from com_ivansoft_corebank_lib.mongo_indexes import bootstrap_indexes
+from com_ivansoft_corebank_lib.profiling import ProfileStore, ProfilingMiddleware
 from app.api.routes.v1.account_handlers import router as account_handler
+from app.api.eventsource.v1.subscribers import router as subscriber_handlers
+from app.api.responses import ORJSONResponse
+from app.db.MongoBase import MongoBase
+from app.services.AccountService import AccountService
+from app.db.indexes import INDEXES, QUERY_PATTERNS, SUPERSEDED_INDEXES
+from app.config.settings import BALANCE_UPDATES_PUBSUB_NAME, BALANCE_UPDATES_TOPIC, MONGO_DB_NAME
+from app.config.settings import PROFILING_ENABLED, PROFILING_HEADER, PROFILING_SAMPLE_RATE, PROFILING_DIR
+from app.config.settings import LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE
 
-app = FastAPI()
+configure_logging(LOG_LEVEL, LOG_SAMPLE_RATE, LOG_FORMAT, LOG_QUEUE_SIZE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the client and its connection pool live as long as the app, the repositories use it through MongoBase
+    client = MongoBase.get_client()
+    # indexes are built in the background, the service starts serving queries meanwhile
+    indexes_task = asyncio.create_task(bootstrap_indexes(client[MONGO_DB_NAME], INDEXES, QUERY_PATTERNS,
+                                                         SUPERSEDED_INDEXES))
+    yield
+    indexes_task.cancel()
+    MongoBase.close()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# latency of every request per route, scraped with the rest of the metrics at /metrics
+app.add_middleware(MetricsMiddleware)
+# the services hold no request state, every request uses the same one
+app.state.account_service = AccountService()
+# on-demand profiling, the middleware is only added when enabled so it costs nothing otherwise
+profiles = ProfileStore(PROFILING_DIR) if PROFILING_ENABLED else None
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, store=profiles, header=PROFILING_HEADER, sample_rate=PROFILING_SAMPLE_RATE)
 # Include routers
 app.include_router(account_handler, prefix="/mybank/api/v1")
+app.include_router(subscriber_handlers, prefix="/mybank/subscriber/v1")
+
+# Register Dapr pub/sub subscriptions (programmatic subscription), the balance updates published by the account
+# projections invalidate the balance cache.
+#
+# Every replica has its own cache, so every replica must receive every update. Instances of the same app id share a
+# consumer group and compete for the messages, a consumer id per host gives every replica its own group.
+@app.get('/dapr/subscribe')
+def subscribe():
+    subscriptions = [
+        {
+            'pubsubname': BALANCE_UPDATES_PUBSUB_NAME,
+            'topic': BALANCE_UPDATES_TOPIC,
+            'route': '/mybank/subscriber/v1/balance_cache/handler',
+            'metadata': {
+                'consumerID': f'queriesbankapi-{socket.gethostname()}'
+            }
+        }]
+    print(f'Subscribing... : {subscriptions}')
+    return Response(content=json.dumps(subscriptions), media_type='application/json')
+
+# Prometheus metrics: request latency per route, MongoDB latency per repository method
+@app.get('/metrics', include_in_schema=False)
+def metrics():
+    content, media_type = latest()
+    return Response(content=content, media_type=media_type)
+
+
+# connections of the MongoDB pool per server: open, checked out, idle and waiting ones and the check out wait times
+@app.get('/debug/pool', include_in_schema=False)
+def pool():
+    return {'options': MongoBase.options(), 'servers': MongoBase.pool_stats.snapshot()}
+
+
+# log level and sample rate of this process, e.g. PUT /debug/logging?level=debug&sample_rate=0.1
+@app.get('/debug/logging', include_in_schema=False)
+def get_logging():
+    return logging_settings()
+
+
+@app.put('/debug/logging', include_in_schema=False)
+def update_logging(level: Optional[str] = None, sample_rate: Optional[float] = None):
+    try:
+        if level is not None:
+            set_level(level)
+        if sample_rate is not None:
+            set_sample_rate(sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return logging_settings()
+
+
+# summaries of the last profiled requests, the pstats files are in PROFILING_DIR
+if PROFILING_ENABLED:
+    @app.get('/debug/profiles', include_in_schema=False)
+    def list_profiles():
+        return profiles.recent()
+
+    @app.get('/debug/profiles/{profile_id}', include_in_schema=False)
+    def get_profile(profile_id: str):
+        summary = profiles.get(profile_id)
+        if summary is None:
+            raise HTTPException(status_code=404, detail='Profile not found')
+        return summary
+
 
 # ping route
 @app.get("/")
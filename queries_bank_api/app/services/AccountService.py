@@ -1,15 +1,27 @@
 
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator
+from com_ivansoft_corebank_lib.models.Rollup import Rollup as RollupModel, RollupGranularity
+from com_ivansoft_corebank_lib.models.Transaction import TransactionType
 from app.db.balance.BalanceRepository import BalanceRepository, BalanceModel
+from app.db.rollup.RollupRepository import RollupRepository
 from app.db.transaction.TransactionRepository import TransactionRepository
+from app.db.transaction.TransactionBucketRepository import TransactionBucketRepository
+from app.services.BalanceCache import balance_cache
+from app.config.settings import BALANCE_CACHE_ENABLED, BALANCES_BATCH_SIZE, TRANSACTION_LAYOUT
 from structlog import get_logger
 
-logger = get_logger().bind(logger='BalanceService')
+logger = get_logger().bind(logger='BalanceService', sampled=True)
 
 
 class AccountService:
     def __init__(self):
         self.balance_repository = BalanceRepository()
-        self.transaction_repository = TransactionRepository()
+        self.transaction_repository = (TransactionBucketRepository() if TRANSACTION_LAYOUT == 'bucket'
+                                       else TransactionRepository())
+        self.rollup_repository = RollupRepository()
+        self.balance_cache = balance_cache
 
     async def get_history_transactions(self, account_id: str):
         try:
@@ -21,8 +33,104 @@ class AccountService:
             raise ValueError('Not Found')
         return history
 
+    async def get_history_page(self, account_id: str, limit: int, after: tuple = None):
+        try:
+            history, next_key = await self.transaction_repository.get_history_page(account_id, limit, after)
+        except Exception as e:
+            logger.error('Error getting history page', account_id=account_id, error=str(e))
+            raise ValueError('Exception')
+        # an empty page after a cursor is the end of the history, not a missing account
+        if not history and not after:
+            raise ValueError('Not Found')
+        return history, next_key
+
+    async def stream_history(self, account_id: str, batch_size: int) -> AsyncIterator[list[dict]]:
+        """Batches of raw transaction documents, the first batch is read before returning so a missing account or a
+        database error is raised here and not in the middle of the response"""
+        batches = self.transaction_repository.stream_history(account_id, batch_size)
+        try:
+            first = await anext(batches)
+        except StopAsyncIteration:
+            raise ValueError('Not Found')
+        except Exception as e:
+            logger.error('Error streaming history', account_id=account_id, error=str(e))
+            raise ValueError('Exception')
+        return _prepend(first, batches)
+
     async def get_current_balance(self, account_id: str) -> BalanceModel:
+        if BALANCE_CACHE_ENABLED:
+            balance = self.balance_cache.get(account_id)
+            if balance:
+                return balance
+
+        token = self.balance_cache.token()
         balance = await self.balance_repository.get(account_id)
         if not balance:
             raise ValueError('Not Found')
-        return balance
\ No newline at end of file
+        if BALANCE_CACHE_ENABLED:
+            self.balance_cache.put(account_id, balance, token)
+        return balance
+
+    async def get_balance_as_of(self, account_id: str, as_of: datetime) -> dict:
+        """Balance of the account at as_of: the latest checkpoint written by the projections service at or before
+        as_of plus the transactions of the later events up to as_of, so about one checkpoint interval of transactions
+        is read whatever the age of the account. Before the first checkpoint the transactions are read from the first
+        one"""
+        current = await self.get_current_balance(account_id)
+        try:
+            checkpoint = await self.balance_repository.get_checkpoint(account_id, as_of)
+            transactions = await self.transaction_repository.get_after(
+                account_id, checkpoint['events'] if checkpoint else None, as_of)
+        except Exception as e:
+            logger.error('Error getting balance as of', account_id=account_id, as_of=as_of, error=str(e))
+            raise ValueError('Exception')
+
+        balance = checkpoint['balance'] if checkpoint else Decimal(0)
+        for transaction in transactions:
+            balance += transaction.amount if transaction.type == TransactionType.DEPOSIT else -transaction.amount
+        return {'account_id': account_id, 'balance': balance, 'currency': current.currency, 'as_of': as_of,
+                'checkpoint_events': checkpoint['events'] if checkpoint else 0,
+                'replayed_transactions': len(transactions)}
+
+    async def get_balances(self, account_ids: [str]) -> AsyncIterator[BalanceModel]:
+        """Current balances of the accounts, cached ones first and the rest with one query per BALANCES_BATCH_SIZE
+        accounts. Accounts without a balance are skipped"""
+        missing = []
+        for account_id in dict.fromkeys(account_ids):
+            balance = self.balance_cache.get(account_id) if BALANCE_CACHE_ENABLED else None
+            if balance:
+                yield balance
+            else:
+                missing.append(account_id)
+
+        for start in range(0, len(missing), BALANCES_BATCH_SIZE):
+            token = self.balance_cache.token()
+            async for balance in self.balance_repository.get_many(missing[start:start + BALANCES_BATCH_SIZE]):
+                if BALANCE_CACHE_ENABLED:
+                    self.balance_cache.put(balance.account_id, balance, token)
+                yield balance
+
+    async def get_summary(self, account_id: str, granularity: RollupGranularity, from_date: date = None,
+                          to_date: date = None) -> list[RollupModel]:
+        """Totals of the account per day or month between the dates, one rollup per period with transactions. The
+        dates are truncated to their period so a range always covers whole periods"""
+        if from_date and to_date and from_date > to_date:
+            raise ValueError('Invalid Range')
+        try:
+            return await self.rollup_repository.get_summary(
+                account_id, granularity, granularity.period(from_date) if from_date else None,
+                granularity.period(to_date) if to_date else None)
+        except Exception as e:
+            logger.error('Error getting summary', account_id=account_id, error=str(e))
+            raise ValueError('Exception')
+
+    def invalidate_balances(self, account_ids: [str]):
+        for account_id in account_ids:
+            self.balance_cache.invalidate(account_id)
+        logger.info('Balances invalidated', accounts=len(account_ids))
+
+
+async def _prepend(first: list[dict], batches: AsyncIterator[list[dict]]) -> AsyncIterator[list[dict]]:
+    yield first
+    async for batch in batches:
+        yield batch
@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from app.config.settings import BALANCE_CACHE_SIZE, BALANCE_CACHE_MAX_AGE
+
+
+class BalanceCache:
+    """LRU cache of current balances holding at most max_size accounts. Entries are invalidated when the projections
+    service publishes that the balance changed, and expire after max_age seconds in case an update was lost.
+
+    A balance read from the database before an invalidation of its account may be stale, so filling the cache takes
+    the token returned by token() before the read and is ignored when the account was invalidated after it"""
+
+    def __init__(self, max_size: int, max_age: float):
+        self._max_size = max_size
+        self._max_age = max_age
+        # account_id -> (balance, monotonic time the entry expires)
+        self._balances: OrderedDict[str, tuple[BalanceModel, float]] = OrderedDict()
+        # clock of the last invalidation of the recently invalidated accounts, older ones are covered by _floor
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        self._floor = 0
+        self._clock = 0
+
+    def get(self, account_id: str) -> Optional[BalanceModel]:
+        entry = self._balances.get(account_id)
+        if entry is None:
+            return None
+        if entry[1] <= time.monotonic():
+            del self._balances[account_id]
+            return None
+        self._balances.move_to_end(account_id)
+        return entry[0]
+
+    def token(self) -> int:
+        return self._clock
+
+    def put(self, account_id: str, balance: BalanceModel, token: int):
+        if token < self._floor or self._invalidated.get(account_id, 0) > token:
+            return
+        self._balances[account_id] = (balance, time.monotonic() + self._max_age)
+        self._balances.move_to_end(account_id)
+        if len(self._balances) > self._max_size:
+            self._balances.popitem(last=False)
+
+    def invalidate(self, account_id: str):
+        self._clock += 1
+        self._balances.pop(account_id, None)
+        self._invalidated[account_id] = self._clock
+        self._invalidated.move_to_end(account_id)
+        if len(self._invalidated) > self._max_size:
+            # forgetting an invalidation rejects every fill that started before it
+            _, self._floor = self._invalidated.popitem(last=False)
+
+    def __len__(self):
+        return len(self._balances)
+
+
+balance_cache = BalanceCache(BALANCE_CACHE_SIZE, BALANCE_CACHE_MAX_AGE)
@@ -1,5 +1,6 @@
 import asyncio
-from datetime import timedelta, datetime
+import json
+from datetime import date, timedelta, datetime
 from motor.motor_asyncio import AsyncIOMotorClient
 from app.config import settings
 # for testing
@@ -7,7 +8,11 @@ settings.MONGO_DB_NAME = "testdb"
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.api.routes.v1.account_handlers import get_account_service
+from app.api.schemas.HistoryCursor import encode_cursor, decode_cursor
 from app.services.AccountService import AccountService
+from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.models.Rollup import Rollup as RollupModel, RollupGranularity
 from unittest.mock import Mock, patch
 
 client = TestClient(app)
@@ -32,10 +37,11 @@ async def mongodb_client(event_loop):
 
 @pytest.fixture(scope="function")
 async def setup_balance_test_data(mongodb_client):
-    collection = mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_BALANCE_COLLECTION]
+    collection = mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_CURRENT_BALANCE_COLLECTION]
 
     # Create test balance data
     test_balance = {
+        "_id": "123",
         "account_id": "123",
         "balance": 1000.0,
         "user_id": 456,
@@ -146,7 +152,7 @@ async def test_get_transaction_history(setup_history_test_data):
 @pytest.mark.asyncio
 async def test_get_transaction_history_not_found(mock_account_service):
     with patch('app.api.routes.v1.account_handlers.get_account_service', return_value=mock_account_service):
-        mock_account_service.get_history_transactions.side_effect = ValueError('Not Found')
+        mock_account_service.get_history_page.side_effect = ValueError('Not Found')
 
         response = client.get("/mybank/api/v1/account/999/history")
 
@@ -155,3 +161,153 @@ async def test_get_transaction_history_not_found(mock_account_service):
 
         assert response.status_code == 404
         assert response.json()["detail"] == "History for account id: 999 not found"
+
+def test_get_transaction_history_next_cursor(mock_account_service):
+    mock_account_service.get_history_page.return_value = ([], ("2024-01-01T00:00:00", "tx124"))
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/123/history?limit=2")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert decode_cursor(response.headers["X-Next-Cursor"]) == ("2024-01-01T00:00:00", "tx124")
+    mock_account_service.get_history_page.assert_called_once_with("123", 2, None)
+
+def test_get_transaction_history_with_cursor(mock_account_service):
+    mock_account_service.get_history_page.return_value = ([], None)
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        cursor = encode_cursor(("2024-01-01T00:00:00", "tx124"))
+        response = client.get(f"/mybank/api/v1/account/123/history?cursor={cursor}")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+    mock_account_service.get_history_page.assert_called_once_with(
+        "123", settings.HISTORY_PAGE_DEFAULT_LIMIT, ("2024-01-01T00:00:00", "tx124"))
+
+def test_get_transaction_history_invalid_cursor(mock_account_service):
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/123/history?cursor=not-a-cursor")
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 400
+    mock_account_service.get_history_page.assert_not_called()
+
+def test_get_transaction_history_ndjson(mock_account_service):
+    async def batches():
+        yield [{"id": "tx125", "amount": 1300.0}, {"id": "tx124", "amount": 1500.0}]
+        yield [{"id": "tx123", "amount": 1000.0}]
+
+    mock_account_service.stream_history.return_value = batches()
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/123/history", headers={"Accept": "application/x-ndjson"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["id"] for line in lines] == ["tx125", "tx124", "tx123"]
+    mock_account_service.stream_history.assert_called_once_with("123", settings.HISTORY_STREAM_BATCH_SIZE)
+
+def test_get_transaction_history_ndjson_not_found(mock_account_service):
+    mock_account_service.stream_history.side_effect = ValueError('Not Found')
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/999/history", headers={"Accept": "application/x-ndjson"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 404
+
+def test_get_balances(mock_account_service):
+    async def balances():
+        yield BalanceModel(account_id="123", balance=1000.0, user_id=456, username="test_user")
+
+    mock_account_service.get_balances.return_value = balances()
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.post("/mybank/api/v1/accounts/balances", json={"account_ids": ["123", "999"]})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    response_data = response.json()
+    assert [balance["account_id"] for balance in response_data["balances"]] == ["123"]
+    assert response_data["balances"][0]["balance"] == 1000.0
+    assert response_data["missing"] == ["999"]
+    mock_account_service.get_balances.assert_called_once_with(["123", "999"])
+
+def test_get_balances_empty_request(mock_account_service):
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.post("/mybank/api/v1/accounts/balances", json={"account_ids": []})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 422
+
+def test_get_summary(mock_account_service):
+    mock_account_service.get_summary.return_value = [
+        RollupModel(account_id="123", granularity=RollupGranularity.MONTH, period="2024-01", count=2,
+                    deposits="1500.00", withdrawals="200.50", closing_balance="1299.50")]
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/123/summary",
+                              params={"granularity": "month", "from": "2024-01-01", "to": "2024-03-31"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.json() == [{"account_id": "123", "granularity": "month", "period": "2024-01", "count": 2,
+                                "deposits": 1500.0, "withdrawals": 200.5, "closing_balance": 1299.5,
+                                "updated_at": None, "net": 1299.5}]
+    mock_account_service.get_summary.assert_called_once_with("123", RollupGranularity.MONTH, date(2024, 1, 1),
+                                                             date(2024, 3, 31))
+
+def test_get_summary_invalid_range(mock_account_service):
+    mock_account_service.get_summary.side_effect = ValueError('Invalid Range')
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/123/summary", params={"from": "2024-02-01", "to": "2024-01-01"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 400
+
+def test_get_balance_as_of(mock_account_service):
+    mock_account_service.get_balance_as_of.return_value = {
+        "account_id": "123", "balance": 1050.45, "currency": "MXN", "as_of": datetime(2024, 3, 20, 18),
+        "checkpoint_events": 200, "replayed_transactions": 2}
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        response = client.get("/mybank/api/v1/account/123/balance", params={"as_of": "2024-03-20T18:00:00"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.json()["balance"] == 1050.45 and response.json()["as_of"] == "2024-03-20T18:00:00"
+    mock_account_service.get_balance_as_of.assert_called_once_with("123", datetime(2024, 3, 20, 18))
+    mock_account_service.get_current_balance.assert_not_called()
+
+def test_metrics_route_template(mock_account_service):
+    mock_account_service.get_current_balance.return_value = BalanceModel(
+        account_id="123", balance=1000.0, user_id=456, username="test_user")
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    try:
+        client.get("/mybank/api/v1/account/123/balance")
+    finally:
+        app.dependency_overrides.clear()
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    # labeled with the route template, not the account id
+    assert ('http_request_duration_seconds_count{method="GET",route="/mybank/api/v1/account/{account_id}/balance",'
+            'status="200"}') in response.text
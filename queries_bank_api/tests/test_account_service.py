@@ -1,9 +1,15 @@
+from datetime import date, datetime
+from decimal import Decimal
 import pytest
 from unittest.mock import Mock
 from app.services.AccountService import AccountService
 from app.db.balance.BalanceRepository import BalanceRepository
 from app.db.transaction.TransactionRepository import TransactionRepository
+from app.db.rollup.RollupRepository import RollupRepository
+from app.services.BalanceCache import BalanceCache
 from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+from com_ivansoft_corebank_lib.models.Transaction import Transaction, TransactionType
 
 @pytest.fixture
 def mock_balance_repo():
@@ -14,10 +20,16 @@ def mock_transaction_repo():
     return Mock(spec=TransactionRepository)
 
 @pytest.fixture
-def account_service(mock_balance_repo, mock_transaction_repo):
+def mock_rollup_repo():
+    return Mock(spec=RollupRepository)
+
+@pytest.fixture
+def account_service(mock_balance_repo, mock_transaction_repo, mock_rollup_repo):
     service = AccountService()
     service.balance_repository = mock_balance_repo
     service.transaction_repository = mock_transaction_repo
+    service.rollup_repository = mock_rollup_repo
+    service.balance_cache = BalanceCache(10, 60)
     return service
 
 @pytest.mark.asyncio
@@ -71,3 +83,155 @@ async def test_get_history_transactions_error(account_service, mock_transaction_
     with pytest.raises(ValueError, match='Not Found'):
         await account_service.get_history_transactions("123")
     mock_transaction_repo.get_history.assert_called_once_with("123")
+
+@pytest.mark.asyncio
+async def test_get_history_page_success(account_service, mock_transaction_repo):
+    mock_transaction_repo.get_history_page.return_value = (["tx125", "tx124"], ("2024-01-02T00:00:00", "tx124"))
+
+    history, next_key = await account_service.get_history_page("123", 2)
+    assert history == ["tx125", "tx124"]
+    assert next_key == ("2024-01-02T00:00:00", "tx124")
+    mock_transaction_repo.get_history_page.assert_called_once_with("123", 2, None)
+
+@pytest.mark.asyncio
+async def test_get_history_page_not_found(account_service, mock_transaction_repo):
+    mock_transaction_repo.get_history_page.return_value = ([], None)
+
+    with pytest.raises(ValueError, match='Not Found'):
+        await account_service.get_history_page("999", 50)
+
+@pytest.mark.asyncio
+async def test_get_history_page_end_of_history(account_service, mock_transaction_repo):
+    # an empty page after a cursor is the end of the history
+    mock_transaction_repo.get_history_page.return_value = ([], None)
+
+    history, next_key = await account_service.get_history_page("123", 50, ("2024-01-01T00:00:00", "tx123"))
+    assert history == []
+    assert next_key is None
+
+@pytest.mark.asyncio
+async def test_get_history_page_error(account_service, mock_transaction_repo):
+    mock_transaction_repo.get_history_page.side_effect = Exception("Database error")
+
+    with pytest.raises(ValueError, match='Exception'):
+        await account_service.get_history_page("123", 50)
+
+async def _batches(*batches):
+    for batch in batches:
+        yield batch
+
+@pytest.mark.asyncio
+async def test_stream_history_success(account_service, mock_transaction_repo):
+    mock_transaction_repo.stream_history.return_value = _batches([{"id": "tx125"}, {"id": "tx124"}], [{"id": "tx123"}])
+
+    batches = await account_service.stream_history("123", 2)
+    assert [batch async for batch in batches] == [[{"id": "tx125"}, {"id": "tx124"}], [{"id": "tx123"}]]
+    mock_transaction_repo.stream_history.assert_called_once_with("123", 2)
+
+@pytest.mark.asyncio
+async def test_stream_history_not_found(account_service, mock_transaction_repo):
+    mock_transaction_repo.stream_history.return_value = _batches()
+
+    with pytest.raises(ValueError, match='Not Found'):
+        await account_service.stream_history("999", 2)
+
+@pytest.mark.asyncio
+async def test_get_current_balance_cached(account_service, mock_balance_repo):
+    mock_balance = BalanceModel(account_id="123", balance=1000.0, user_id=456, username="test_user")
+    mock_balance_repo.get.return_value = mock_balance
+
+    await account_service.get_current_balance("123")
+    result = await account_service.get_current_balance("123")
+
+    assert result == mock_balance
+    mock_balance_repo.get.assert_called_once_with("123")
+
+@pytest.mark.asyncio
+async def test_get_current_balance_after_invalidation(account_service, mock_balance_repo):
+    old_balance = BalanceModel(account_id="123", balance=1000.0, user_id=456, username="test_user")
+    new_balance = BalanceModel(account_id="123", balance=1500.0, user_id=456, username="test_user")
+    mock_balance_repo.get.side_effect = [old_balance, new_balance]
+
+    await account_service.get_current_balance("123")
+    account_service.invalidate_balances(["123"])
+    result = await account_service.get_current_balance("123")
+
+    assert result == new_balance
+    assert mock_balance_repo.get.call_count == 2
+
+@pytest.mark.asyncio
+async def test_get_balances(account_service, mock_balance_repo):
+    cached = BalanceModel(account_id="123", balance=1000.0, user_id=456, username="test_user")
+    stored = BalanceModel(account_id="456", balance=500.0, user_id=789, username="other_user")
+    account_service.balance_cache.put("123", cached, account_service.balance_cache.token())
+    mock_balance_repo.get_many.return_value = _batches(stored)
+
+    result = [balance async for balance in account_service.get_balances(["123", "456", "999", "456"])]
+
+    assert result == [cached, stored]
+    # only the accounts that aren't cached are queried, once each
+    mock_balance_repo.get_many.assert_called_once_with(["456", "999"])
+    assert account_service.balance_cache.get("456") == stored
+
+@pytest.mark.asyncio
+async def test_get_summary_truncates_dates_to_periods(account_service, mock_rollup_repo):
+    mock_rollup_repo.get_summary.return_value = []
+
+    result = await account_service.get_summary("123", RollupGranularity.MONTH, date(2024, 1, 15), date(2024, 3, 2))
+
+    assert result == []
+    mock_rollup_repo.get_summary.assert_called_once_with("123", RollupGranularity.MONTH, "2024-01", "2024-03")
+
+@pytest.mark.asyncio
+async def test_get_summary_invalid_range(account_service, mock_rollup_repo):
+    with pytest.raises(ValueError, match="Invalid Range"):
+        await account_service.get_summary("123", RollupGranularity.DAY, date(2024, 2, 1), date(2024, 1, 1))
+    mock_rollup_repo.get_summary.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_get_summary_error(account_service, mock_rollup_repo):
+    mock_rollup_repo.get_summary.side_effect = Exception("Database error")
+
+    with pytest.raises(ValueError, match="Exception"):
+        await account_service.get_summary("123", RollupGranularity.DAY)
+
+def _transaction(transaction_id, amount, transaction_type=TransactionType.DEPOSIT):
+    return Transaction(id=transaction_id, account_id="123", amount=amount, type=transaction_type, status="PENDING",
+                       description="test", timestamp=datetime(2024, 3, 20, 12), version=1)
+
+@pytest.mark.asyncio
+async def test_get_balance_as_of_replays_after_checkpoint(account_service, mock_balance_repo, mock_transaction_repo):
+    as_of = datetime(2024, 3, 20, 18)
+    mock_balance_repo.get.return_value = BalanceModel(account_id="123", balance=5000.0, user_id=456, username="test_user")
+    mock_balance_repo.get_checkpoint.return_value = {
+        "account_id": "123", "events": 200, "balance": Decimal("1000.00"), "timestamp": datetime(2024, 3, 20, 10),
+        "transaction_id": "tx200"}
+    mock_transaction_repo.get_after.return_value = [
+        _transaction("tx201", "100.45"), _transaction("tx202", "50.00", TransactionType.WITHDRAW)]
+
+    result = await account_service.get_balance_as_of("123", as_of)
+
+    assert result["balance"] == Decimal("1050.45")
+    assert result["checkpoint_events"] == 200 and result["replayed_transactions"] == 2
+    mock_balance_repo.get_checkpoint.assert_called_once_with("123", as_of)
+    mock_transaction_repo.get_after.assert_called_once_with("123", 200, as_of)
+
+@pytest.mark.asyncio
+async def test_get_balance_as_of_before_first_checkpoint(account_service, mock_balance_repo, mock_transaction_repo):
+    as_of = datetime(2024, 3, 20, 18)
+    mock_balance_repo.get.return_value = BalanceModel(account_id="123", balance=5000.0, user_id=456, username="test_user")
+    mock_balance_repo.get_checkpoint.return_value = None
+    mock_transaction_repo.get_after.return_value = [_transaction("tx1", "100.45")]
+
+    result = await account_service.get_balance_as_of("123", as_of)
+
+    assert result["balance"] == Decimal("100.45")
+    mock_transaction_repo.get_after.assert_called_once_with("123", None, as_of)
+
+@pytest.mark.asyncio
+async def test_get_balance_as_of_not_found(account_service, mock_balance_repo, mock_transaction_repo):
+    mock_balance_repo.get.return_value = None
+
+    with pytest.raises(ValueError, match="Not Found"):
+        await account_service.get_balance_as_of("999", datetime(2024, 3, 20))
+    mock_transaction_repo.get_after.assert_not_called()
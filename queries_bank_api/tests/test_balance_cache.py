@@ -0,0 +1,71 @@
+from unittest.mock import patch
+from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from app.services.BalanceCache import BalanceCache
+
+
+def _balance(account_id, balance=1000.0):
+    return BalanceModel(account_id=account_id, balance=balance, user_id=456, username="test_user")
+
+def test_get_and_put():
+    cache = BalanceCache(10, 60)
+
+    cache.put("123", _balance("123"), cache.token())
+
+    assert cache.get("123") == _balance("123")
+    assert cache.get("999") is None
+
+def test_least_recently_used_is_evicted():
+    cache = BalanceCache(2, 60)
+    cache.put("1", _balance("1"), cache.token())
+    cache.put("2", _balance("2"), cache.token())
+
+    # "1" becomes the most recently used
+    cache.get("1")
+    cache.put("3", _balance("3"), cache.token())
+
+    assert len(cache) == 2
+    assert cache.get("2") is None
+    assert cache.get("1") is not None
+    assert cache.get("3") is not None
+
+def test_entries_expire_after_max_age():
+    cache = BalanceCache(10, 60)
+    with patch('app.services.BalanceCache.time.monotonic', return_value=1000.0):
+        cache.put("123", _balance("123"), cache.token())
+
+    with patch('app.services.BalanceCache.time.monotonic', return_value=1059.0):
+        assert cache.get("123") is not None
+    with patch('app.services.BalanceCache.time.monotonic', return_value=1060.0):
+        assert cache.get("123") is None
+    assert len(cache) == 0
+
+def test_invalidate():
+    cache = BalanceCache(10, 60)
+    cache.put("123", _balance("123"), cache.token())
+
+    cache.invalidate("123")
+
+    assert cache.get("123") is None
+
+def test_put_read_before_invalidation_is_ignored():
+    cache = BalanceCache(10, 60)
+    # the balance is read, then the account is invalidated before the read is cached
+    token = cache.token()
+    cache.invalidate("123")
+
+    cache.put("123", _balance("123"), token)
+
+    assert cache.get("123") is None
+    cache.put("123", _balance("123", 1500.0), cache.token())
+    assert cache.get("123").balance == 1500.0
+
+def test_put_read_before_forgotten_invalidation_is_ignored():
+    cache = BalanceCache(1, 60)
+    token = cache.token()
+    cache.invalidate("123")
+    # the invalidation of "123" is forgotten
+    cache.invalidate("456")
+
+    cache.put("123", _balance("123"), token)
+
+    assert cache.get("123") is None
@@ -30,10 +30,11 @@ async def mongodb_client():
 async def setup_test_data():
     # Connect to MongoDB
     client = AsyncIOMotorClient(settings.MONGO_URL)
-    collection = client[settings.MONGO_DB_NAME][settings.MONGO_BALANCE_COLLECTION]
+    collection = client[settings.MONGO_DB_NAME][settings.MONGO_CURRENT_BALANCE_COLLECTION]
 
     # Create test balance data
     test_balance = {
+        "_id": "123",
         "account_id": "123",
         "balance": 100.0,
         "user_id": 456,
@@ -56,7 +57,7 @@ async def balance_repository(mongodb_client):
     repo.client = mongodb_client
     yield repo
     # Clean up
-    await mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_BALANCE_COLLECTION].drop()
+    await mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_CURRENT_BALANCE_COLLECTION].drop()
 
 @pytest.mark.asyncio
 async def test_get_balance_success(balance_repository):
@@ -80,3 +81,10 @@ async def test_get_balance_not_found(balance_repository):
 
     # Assert
     assert result is None
+
+@pytest.mark.asyncio
+async def test_get_many(balance_repository):
+    result = [balance async for balance in balance_repository.get_many(["123", "999"])]
+
+    assert [balance.account_id for balance in result] == ["123"]
+    assert result[0].balance == Decimal("100.0")
@@ -0,0 +1,154 @@
+"""Throughput and latency of the query routes against the in-memory MongoDB of the common library, driven in-process
+through ASGI. The results are compared with tests/benchmark_baseline.json, set BENCHMARK_UPDATE_BASELINE=true to
+record a new baseline and run with -s to see the report. The transaction history is stored in both layouts, so the
+read cost of a page can be compared between them"""
+import os
+from datetime import datetime, timedelta
+from bson.decimal128 import Decimal128
+import pytest
+from httpx import ASGITransport, AsyncClient
+from com_ivansoft_corebank_lib.testing.benchmark import calibrate, check, run_benchmark
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryCursor, InMemoryMongoClient
+from com_ivansoft_corebank_lib.mongo_indexes import ensure_indexes, verify_query_patterns
+from app.main import app
+from app.config import settings
+from app.db.indexes import INDEXES, QUERY_PATTERNS
+# the database the repositories were imported with, other test modules change settings.MONGO_DB_NAME
+from app.db.balance.BalanceRepository import BalanceRepository, MONGO_DB_NAME
+from app.db.rollup.RollupRepository import RollupRepository
+from app.db.transaction.TransactionRepository import TransactionRepository
+from app.db.transaction.TransactionBucketRepository import TransactionBucketRepository
+import app.services.AccountService as account_service_module
+from app.services.BalanceCache import BalanceCache
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+ACCOUNTS = 100
+TRANSACTIONS_PER_ACCOUNT = 100
+CALLS = 300
+
+
+@pytest.fixture
+async def mongo(monkeypatch):
+    client = InMemoryMongoClient()
+    for repository in (BalanceRepository, TransactionRepository, TransactionBucketRepository, RollupRepository):
+        monkeypatch.setattr(repository, '_client', client)
+    database = client[MONGO_DB_NAME]
+    # the queries run on the indexes the service declares, like they do in MongoDB
+    await ensure_indexes(client[MONGO_DB_NAME], INDEXES)
+    assert await verify_query_patterns(client[MONGO_DB_NAME], QUERY_PATTERNS) == []
+
+    # documents as the account projections write them
+    start = datetime(2024, 1, 1)
+    await database[settings.MONGO_CURRENT_BALANCE_COLLECTION].insert_many([
+        {"_id": f"acc{a}", "account_id": f"acc{a}", "balance": Decimal128("10045.00"), "currency": "MXN",
+         "user_id": 1, "username": "test_user", "created_at": start.isoformat(), "updated_at": start.isoformat()}
+        for a in range(ACCOUNTS)])
+    transactions = [
+        {"id": f"tx{a}-{t}", "account_id": f"acc{a}", "amount": Decimal128("100.45"), "type": "DEPOSIT",
+         "status": "PENDING", "description": "Deposit of $100.45", "timestamp": start + timedelta(hours=t * 12),
+         "version": 1}
+        for a in range(ACCOUNTS) for t in range(TRANSACTIONS_PER_ACCOUNT)]
+    await database[settings.MONGO_TRANSACTION_COLLECTION].insert_many(
+        [{"_id": transaction["id"], **transaction} for transaction in transactions])
+    # monthly buckets of up to 200 transactions, the default layout settings of the account projections
+    buckets = {}
+    for transaction in transactions:
+        buckets.setdefault((transaction["account_id"], f"{transaction['timestamp']:%Y-%m}"), []).append(transaction)
+    await database[settings.MONGO_TRANSACTION_BUCKET_COLLECTION].insert_many([
+        {"_id": f"{account_id}:{period}:0", "account_id": account_id, "period": period, "sequence": 0,
+         "count": len(items), "transactions": items} for (account_id, period), items in buckets.items()])
+    await database[settings.MONGO_ROLLUP_COLLECTION].insert_many([
+        {"_id": f"acc{a}:day:{day:%Y-%m-%d}", "account_id": f"acc{a}", "granularity": "day", "period": f"{day:%Y-%m-%d}",
+         "count": 2, "deposits": Decimal128("200.90"), "withdrawals": Decimal128("0"),
+         "closing_balance": Decimal128("200.90"), "updated_at": None}
+        for a in range(ACCOUNTS) for day in (start + timedelta(days=d) for d in range(TRANSACTIONS_PER_ACCOUNT // 2))])
+    return database
+
+
+@pytest.fixture
+async def client(mongo):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test/mybank/api/v1") as client:
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_routes_benchmark(client, monkeypatch):
+    async def balance(i):
+        response = await client.get(f"/account/acc{i % ACCOUNTS}/balance")
+        assert response.status_code == 200
+
+    async def balances(i):
+        response = await client.post("/accounts/balances", json={"account_ids": [f"acc{a}" for a in range(ACCOUNTS)]})
+        assert len(response.json()["balances"]) == ACCOUNTS
+
+    async def history_page(i):
+        response = await client.get(f"/account/acc{i % ACCOUNTS}/history", params={"limit": 50})
+        assert len(response.json()) == 50
+
+    async def history_ndjson(i):
+        response = await client.get(f"/account/acc{i % ACCOUNTS}/history", headers={"Accept": "application/x-ndjson"})
+        assert response.text.count("\n") == TRANSACTIONS_PER_ACCOUNT
+
+    async def summary(i):
+        response = await client.get(f"/account/acc{i % ACCOUNTS}/summary",
+                                    params={"from": "2024-01-01", "to": "2024-01-31"})
+        assert len(response.json()) == 31
+
+    calibration = calibrate()
+    # balances are read from MongoDB every time, the cache would hide the query
+    monkeypatch.setattr(account_service_module, 'BALANCE_CACHE_ENABLED', False)
+    results = [
+        await run_benchmark("balance_uncached", balance, CALLS),
+        await run_benchmark("balances_batch_accounts", balances, CALLS // 10, ACCOUNTS),
+        await run_benchmark("history_page", history_page, CALLS),
+        await run_benchmark("history_ndjson_transactions", history_ndjson, CALLS // 10, TRANSACTIONS_PER_ACCOUNT),
+        await run_benchmark("summary_month_of_days", summary, CALLS),
+    ]
+    monkeypatch.setattr(account_service_module, 'BALANCE_CACHE_ENABLED', True)
+    # the service of the app is shared by every request
+    monkeypatch.setattr(app.state.account_service, 'balance_cache', BalanceCache(ACCOUNTS, 60))
+    results.append(await run_benchmark("balance_cached", balance, CALLS))
+
+    regressions = check(results, BASELINE, calibration)
+    assert not regressions, regressions
+
+
+@pytest.mark.asyncio
+async def test_history_layouts_benchmark(client, monkeypatch):
+    """A page of history read from the document and the bucket layout, with the documents each layout reads per
+    page"""
+    read = 0
+    to_list, anext_ = InMemoryCursor.to_list, InMemoryCursor.__anext__
+
+    async def counted_to_list(self, length=None):
+        nonlocal read
+        documents = await to_list(self, length)
+        read += len(documents)
+        return documents
+
+    async def counted_anext(self):
+        nonlocal read
+        document = await anext_(self)
+        read += 1
+        return document
+
+    monkeypatch.setattr(InMemoryCursor, 'to_list', counted_to_list)
+    monkeypatch.setattr(InMemoryCursor, '__anext__', counted_anext)
+
+    async def history_page(i):
+        response = await client.get(f"/account/acc{i % ACCOUNTS}/history", params={"limit": 50})
+        assert len(response.json()) == 50
+
+    calibration = calibrate()
+    results = []
+    documents_per_page = {}
+    for layout, repository in (("document", TransactionRepository()), ("bucket", TransactionBucketRepository())):
+        monkeypatch.setattr(app.state.account_service, 'transaction_repository', repository)
+        read = 0
+        results.append(await run_benchmark(f"history_page_{layout}_layout", history_page, CALLS, warmup=0))
+        documents_per_page[layout] = read / CALLS
+
+    # the bucket layout reads the one or two buckets holding the page instead of a document per transaction
+    assert documents_per_page["bucket"] <= 2 < documents_per_page["document"], documents_per_page
+    regressions = check(results, BASELINE, calibration)
+    assert not regressions, regressions
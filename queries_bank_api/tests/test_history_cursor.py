@@ -0,0 +1,22 @@
+import pytest
+from datetime import datetime
+from app.api.schemas.HistoryCursor import encode_cursor, decode_cursor
+
+
+def test_cursor_round_trip():
+    key = ("2024-01-01T10:00:00.123456", "tx123")
+
+    cursor = encode_cursor(key)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == key
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30", "W10"])
+def test_decode_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(cursor)
+
+def test_cursor_round_trip_datetime():
+    key = (datetime(2024, 1, 1, 10, 0, 0, 123456), "tx123")
+
+    assert decode_cursor(encode_cursor(key)) == key
@@ -0,0 +1,62 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from app.config import settings
+from com_ivansoft_corebank_lib.mongo_indexes import ensure_indexes, verify_query_patterns
+from app.db.indexes import INDEXES, QUERY_PATTERNS, SUPERSEDED_INDEXES
+
+
+def _database(index_information: dict):
+    """Mock database whose collections return the index information of index_information[collection]"""
+    collections = {}
+
+    def get_collection(name):
+        if name not in collections:
+            collection = MagicMock()
+            collection.index_information = AsyncMock(
+                return_value={'_id_': {'key': [('_id', 1)]}, **index_information.get(name, {})})
+            collection.create_indexes = AsyncMock()
+            collections[name] = collection
+        return collections[name]
+
+    database = MagicMock()
+    database.__getitem__.side_effect = get_collection
+    return database, get_collection
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_creates_missing():
+    # Arrange
+    database, collection = _database({})
+
+    # Act
+    await ensure_indexes(database, INDEXES)
+
+    # Assert
+    created = collection(settings.MONGO_BALANCE_COLLECTION).create_indexes.call_args[0][0]
+    assert [index.document['name'] for index in created] == ['account_id_updated_at']
+    created = collection(settings.MONGO_TRANSACTION_COLLECTION).create_indexes.call_args[0][0]
+    assert [index.document['name'] for index in created] == ['account_id_timestamp_id', 'account_id_event']
+
+@pytest.mark.asyncio
+async def test_verify_query_patterns_reports_unsupported():
+    # Arrange - the balance history is sorted by a field the index doesn't have
+    database, _ = _database({
+        settings.MONGO_BALANCE_COLLECTION: {'account_id': {'key': [('account_id', 1)]}},
+        settings.MONGO_TRANSACTION_COLLECTION: {'account_id_timestamp_id': {'key': [('account_id', 1), ('timestamp', 1), ('id', 1)]},
+                                                'account_id_event': {'key': [('account_id', 1), ('event', 1)]}},
+        settings.MONGO_ROLLUP_COLLECTION: {'account_id_granularity_period': {'key': [('account_id', 1), ('granularity', 1), ('period', 1)]}},
+        settings.MONGO_BALANCE_CHECKPOINT_COLLECTION: {'account_id_timestamp_events': {
+            'key': [('account_id', 1), ('timestamp', -1), ('events', -1)]}},
+        settings.MONGO_TRANSACTION_BUCKET_COLLECTION: {'account_id_period_sequence': {'key': [('account_id', 1), ('period', 1), ('sequence', 1)]}},
+    })
+
+    # Act
+    unsupported = await verify_query_patterns(database, QUERY_PATTERNS)
+
+    # Assert
+    assert unsupported == ['BalanceRepository.get_history']
+
+def test_superseded_indexes_are_not_declared():
+    # Act / Assert - a declared index would be created and dropped on every startup
+    for collection, names in SUPERSEDED_INDEXES.items():
+        declared = {index.document['name'] for index in INDEXES[collection]}
+        assert not declared.intersection(names), collection
@@ -0,0 +1,21 @@
+import json
+from datetime import datetime
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.models.Balance import Balance as BalanceModel
+from app.api.responses import ORJSONResponse, dumps
+
+
+def test_dumps_amounts_as_numbers():
+    content = {"balance": Decimal("1000.10"), "stored": Decimal128("5.5"), "timestamp": datetime(2024, 1, 1, 10, 0, 0)}
+
+    assert json.loads(dumps(content)) == {"balance": 1000.1, "stored": 5.5, "timestamp": "2024-01-01T10:00:00"}
+
+def test_response_matches_default_encoding():
+    balance = BalanceModel(account_id="123", balance=Decimal("1000.0"), user_id=456, username="test_user")
+
+    response = ORJSONResponse(balance.model_dump())
+
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == {"balance": 1000.0, "currency": "MXN", "user_id": 456, "username": "test_user",
+                                         "account_id": "123", "created_at": None, "updated_at": None}
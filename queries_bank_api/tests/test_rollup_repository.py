@@ -0,0 +1,64 @@
+import asyncio
+from decimal import Decimal
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.models.Rollup import RollupGranularity
+import pytest
+from app.config import settings
+# for testing
+settings.MONGO_DB_NAME = "test_db"
+
+from app.db.rollup.RollupRepository import RollupRepository
+from motor.motor_asyncio import AsyncIOMotorClient
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """Create an instance of the default event loop for the test session."""
+    policy = asyncio.get_event_loop_policy()
+    loop = policy.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    loop.close()
+
+@pytest.fixture(scope="function")
+async def mongodb_client():
+    """Create a MongoDB client for the test."""
+    client = AsyncIOMotorClient(settings.MONGO_URL)
+    yield client
+    await client.drop_database(settings.MONGO_DB_NAME)
+    client.close()
+
+@pytest.fixture(autouse=True)
+async def setup_test_data(mongodb_client):
+    collection = mongodb_client[settings.MONGO_DB_NAME][settings.MONGO_ROLLUP_COLLECTION]
+
+    # rollups as written by the projections service
+    test_rollups = [
+        {"_id": f"123:day:{period}", "account_id": "123", "granularity": "day", "period": period, "count": 1,
+         "deposits": Decimal128("100.00"), "withdrawals": Decimal128("0"), "closing_balance": Decimal128(closing)}
+        for period, closing in [("2024-01-30", "100.00"), ("2024-01-31", "200.00"), ("2024-02-01", "300.00")]
+    ] + [
+        {"_id": "123:month:2024-01", "account_id": "123", "granularity": "month", "period": "2024-01", "count": 2,
+         "deposits": Decimal128("200.00"), "withdrawals": Decimal128("0"), "closing_balance": Decimal128("200.00")}
+    ]
+
+    await collection.insert_many(test_rollups)
+
+    yield
+
+@pytest.mark.asyncio
+async def test_get_summary_range(mongodb_client):
+    result = await RollupRepository().get_summary("123", RollupGranularity.DAY, "2024-01-31", "2024-02-01")
+
+    assert [rollup.period for rollup in result] == ["2024-01-31", "2024-02-01"]
+    assert result[-1].closing_balance == Decimal("300.00")
+
+@pytest.mark.asyncio
+async def test_get_summary_granularity(mongodb_client):
+    result = await RollupRepository().get_summary("123", RollupGranularity.MONTH)
+
+    assert [(rollup.period, rollup.count) for rollup in result] == [("2024-01", 2)]
+
+@pytest.mark.asyncio
+async def test_get_summary_empty(mongodb_client):
+    assert await RollupRepository().get_summary("999", RollupGranularity.DAY) == []
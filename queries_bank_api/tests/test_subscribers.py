@@ -0,0 +1,48 @@
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import Mock
+from app.api.eventsource.v1.subscribers import router, get_account_service
+from app.services.AccountService import AccountService
+
+
+@pytest.fixture
+def mock_account_service():
+    return Mock(spec=AccountService)
+
+@pytest.fixture
+def client(mock_account_service):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_account_service] = lambda: mock_account_service
+    return TestClient(app)
+
+def _cloud_event(data):
+    return {
+        "specversion": "1.0",
+        "type": "com.dapr.event.sent",
+        "source": "accountprojections",
+        "id": "123",
+        "datacontenttype": "application/json",
+        "data": data,
+        "topic": "balances",
+        "pubsubname": "eventsource",
+        "tracestate": "",
+        "traceid": "test",
+    }
+
+@pytest.mark.parametrize("data", [{"account_ids": ["123", "456"]}, json.dumps({"account_ids": ["123", "456"]})])
+def test_balance_cache_handler(client, mock_account_service, data):
+    response = client.post("/balance_cache/handler", json=_cloud_event(data))
+
+    assert response.status_code == 200
+    mock_account_service.invalidate_balances.assert_called_once_with(["123", "456"])
+
+@pytest.mark.parametrize("data", [{}, {"account_ids": "123"}, {"account_ids": [123]}, "not json", json.dumps(["123"])])
+def test_balance_cache_handler_drops_invalid_updates(client, mock_account_service, data):
+    response = client.post("/balance_cache/handler", json=_cloud_event(data))
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "DROP"}
+    mock_account_service.invalidate_balances.assert_not_called()
@@ -0,0 +1,132 @@
+import pytest
+from datetime import datetime, timedelta
+from bson.decimal128 import Decimal128
+from com_ivansoft_corebank_lib.testing.mongo import InMemoryMongoClient
+from app.config import settings
+from app.db.transaction.TransactionBucketRepository import TransactionBucketRepository
+# the database the repositories were imported with, other test modules change settings.MONGO_DB_NAME
+from app.db.transaction.TransactionRepository import TransactionRepository, MONGO_DB_NAME
+
+START = datetime(2024, 3, 30)
+
+
+def _transaction(i: int) -> dict:
+    # every 5th transaction was delivered late, its timestamp is older than the ones stored before it
+    hours = i * 12 - (30 if i % 5 == 4 else 0)
+    return {"id": f"tx{i:02}", "account_id": "acc1", "amount": Decimal128("100.45"), "type": "DEPOSIT",
+            "status": "PENDING", "description": "Deposit of $100.45", "timestamp": START + timedelta(hours=hours),
+            "version": 1, "event": i + 1}
+
+
+def _buckets(transactions: list[dict], size: int) -> list[dict]:
+    """Buckets in the order the projections fill them, size transactions each"""
+    buckets = {}
+    for transaction in transactions:
+        period = transaction['timestamp'].strftime('%Y-%m')
+        sequence = max((key[1] for key in buckets if key[0] == period), default=0)
+        if len(buckets.get((period, sequence), [])) == size:
+            sequence += 1
+        buckets.setdefault((period, sequence), []).append(transaction)
+    return [{"_id": f"acc1:{period}:{sequence}", "account_id": "acc1", "period": period, "sequence": sequence,
+             "count": len(items), "last_event": max(transaction["event"] for transaction in items),
+             "transactions": items} for (period, sequence), items in buckets.items()]
+
+
+@pytest.fixture
+async def repositories(monkeypatch):
+    client = InMemoryMongoClient()
+    for repository in (TransactionRepository, TransactionBucketRepository):
+        monkeypatch.setattr(repository, '_client', client)
+    database = client[MONGO_DB_NAME]
+    transactions = [_transaction(i) for i in range(12)]
+    await database[settings.MONGO_TRANSACTION_COLLECTION].insert_many(
+        [{"_id": transaction["id"], **transaction} for transaction in transactions])
+    await database[settings.MONGO_TRANSACTION_BUCKET_COLLECTION].insert_many(_buckets(transactions, size=3))
+    return TransactionRepository(), TransactionBucketRepository()
+
+@pytest.mark.asyncio
+async def test_history_pages_match_the_document_layout(repositories):
+    # Arrange
+    documents, buckets = repositories
+
+    # Act
+    pages = []
+    for repository in (documents, buckets):
+        page, after = await repository.get_history_page('acc1', 5)
+        ids = [[transaction.id for transaction in page]]
+        while after:
+            page, after = await repository.get_history_page('acc1', 5, after)
+            ids.append([transaction.id for transaction in page])
+        pages.append(ids)
+
+    # Assert
+    assert pages[1] == pages[0]
+    assert pages[0][0] == ['tx11', 'tx10', 'tx08', 'tx07', 'tx09']
+
+@pytest.mark.asyncio
+async def test_history_queries_match_the_document_layout(repositories):
+    # Arrange
+    documents, buckets = repositories
+    until = START + timedelta(days=3)
+
+    # Act / Assert
+    assert await buckets.get('acc1') == await documents.get('acc1')
+    assert await buckets.get_history('acc1') == await documents.get_history('acc1')
+    assert [batch async for batch in buckets.stream_history('acc1', 5)] == \
+        [batch async for batch in documents.stream_history('acc1', 5)]
+    assert await buckets.get_after('acc1', 4, until) == await documents.get_after('acc1', 4, until)
+    assert await buckets.get_after('acc1', None, until) == await documents.get_after('acc1', None, until)
+    assert await buckets.get_history('acc2') is None
+
+@pytest.mark.asyncio
+async def test_history_page_after_a_string_timestamp_cursor(repositories):
+    # Arrange - cursor of a page read while the timestamps were ISO strings
+    documents, buckets = repositories
+    _, (timestamp, transaction_id) = await documents.get_history_page('acc1', 5)
+
+    # Act
+    page, _ = await buckets.get_history_page('acc1', 5, (timestamp.isoformat(), transaction_id))
+
+    # Assert
+    expected, _ = await buckets.get_history_page('acc1', 5, (timestamp, transaction_id))
+    assert [transaction.id for transaction in page] == [transaction.id for transaction in expected]
+    assert len(page) == 5
+
+@pytest.mark.asyncio
+async def test_history_pages_over_legacy_string_timestamps(repositories):
+    # Arrange - the oldest transactions weren't migrated, their timestamps are still ISO strings
+    documents, _ = repositories
+    collection = documents._client[MONGO_DB_NAME][settings.MONGO_TRANSACTION_COLLECTION]
+    for transaction_id in ("tx00", "tx01", "tx02"):
+        transaction = await collection.find_one({"_id": transaction_id})
+        await collection.update_one({"_id": transaction_id},
+                                    {"$set": {"timestamp": transaction["timestamp"].isoformat()}})
+
+    # Act
+    page, after = await documents.get_history_page('acc1', 5)
+    ids = [transaction.id for transaction in page]
+    while after:
+        page, after = await documents.get_history_page('acc1', 5, after)
+        ids.extend(transaction.id for transaction in page)
+
+    # Assert - the pages after a date cursor continue with the string timestamps
+    assert sorted(ids) == [f"tx{i:02}" for i in range(12)]
+    assert ids[-3:] == ["tx02", "tx01", "tx00"]
+
+@pytest.mark.asyncio
+async def test_transactions_after_include_legacy_string_timestamps(repositories):
+    # Arrange - tx00 and tx05 weren't migrated, tx05 is after until
+    documents, buckets = repositories
+    collection = documents._client[MONGO_DB_NAME][settings.MONGO_TRANSACTION_COLLECTION]
+    for transaction_id in ("tx00", "tx05"):
+        transaction = await collection.find_one({"_id": transaction_id})
+        await collection.update_one({"_id": transaction_id},
+                                    {"$set": {"timestamp": transaction["timestamp"].isoformat()}})
+    until = START + timedelta(days=2)
+
+    # Act
+    transactions = await documents.get_after('acc1', None, until)
+
+    # Assert - same transactions and order as when every timestamp is a date
+    assert transactions == await buckets.get_after('acc1', None, until)
+    assert [transaction.id for transaction in transactions] == ["tx00", "tx01", "tx04", "tx02", "tx03"]
@@ -105,3 +105,22 @@ async def test_get_history_success(transaction_repository):
 async def test_get_history_empty(transaction_repository):
     result = await transaction_repository.get_history("12345678901234")
     assert result is None
+
+@pytest.mark.asyncio
+async def test_get_history_page(transaction_repository):
+    first, next_key = await transaction_repository.get_history_page("123", 2)
+
+    # newest first
+    assert [item.id for item in first] == ["tx125", "tx124"]
+    assert next_key[1] == "tx124"
+
+    second, next_key = await transaction_repository.get_history_page("123", 2, next_key)
+    assert [item.id for item in second] == ["tx123"]
+    assert next_key is None
+
+@pytest.mark.asyncio
+async def test_stream_history(transaction_repository):
+    batches = [batch async for batch in transaction_repository.stream_history("123", 2)]
+
+    assert [[document["id"] for document in batch] for batch in batches] == [["tx125", "tx124"], ["tx123"]]
+    assert all("_id" not in document for batch in batches for document in batch)